@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+LLM 路由基准测试
+
+在本地启动三个假的LLM提供商（OpenAI/DeepSeek 兼容的SSE接口，千问的整段返回接口），
+每个提供商的首字延迟可配置，并有一定比例的请求出现长尾延迟。分别在关闭和开启对冲
+（hedging）的情况下通过自动路由发送请求，统计首字延迟的 p50/p95/p99、各提供商胜出
+的次数以及路由器记录的延迟和熔断状态。
+
+用法:
+    python benchmark_llm.py --requests 200
+    python benchmark_llm.py --delays openai=0.4,deepseek=0.2,qianwen=0.6 --tail 0.1
+    python benchmark_llm.py --fail deepseek
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit.logger
+
+# 脱离 streamlit run 导入应用时会有大量无关的警告
+streamlit.logger.set_log_level("error")
+
+from streamlit_app import AsyncHTTPClient, LLMService
+
+PROVIDERS = ("openai", "deepseek", "qianwen")
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """按 server.delay 延迟后回答；tail 比例的请求延迟放大 tail_factor 倍，fail 时返回500"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # 健康检查
+        self.send_response(405)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.requests += 1
+        if server.fail:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        delay = random.uniform(0.8, 1.2) * server.delay
+        if random.random() < server.tail:
+            delay *= server.tail_factor
+        time.sleep(delay)
+
+        answer = f"Answer from {server.name}: the workflow platform can help with OCR and TTS."
+        if "input" in request:
+            # 千问（DashScope）格式，整段返回
+            body = json.dumps({"output": {"choices": [{"message": {"role": "assistant", "content": answer}}]}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 对冲请求被取消
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for word in answer.split(" "):
+                chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 对冲请求被取消
+
+    def log_message(self, *args):
+        pass
+
+
+def start_provider(name: str, delay: float, tail: float, tail_factor: float, fail: bool) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProvider)
+    server.daemon_threads = True
+    server.name, server.delay, server.tail, server.tail_factor, server.fail = name, delay, tail, tail_factor, fail
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(requests: int, hedge: bool, servers: dict) -> dict:
+    llm = LLMService(AsyncHTTPClient())
+    llm.hedge = hedge
+    latencies, failures, winners = [], 0, {}
+    try:
+        for i in range(requests):
+            started = time.perf_counter()
+            try:
+                pieces = llm.stream_response(f"request {i}", "auto")
+                answer = next(pieces)
+                latencies.append(time.perf_counter() - started)
+                answer += "".join(pieces)
+                winner = answer.split(" ")[2].rstrip(":")
+                winners[winner] = winners.get(winner, 0) + 1
+            except Exception as e:
+                failures += 1
+                print(f"  ❌ 请求 {i} 失败: {e}")
+    finally:
+        llm.http.close()
+    return {"latencies": latencies, "failures": failures, "winners": winners, "router": llm.router.stats()}
+
+
+def report(name: str, result: dict, sent: dict):
+    latencies = result["latencies"]
+    print(f"{name}:")
+    if latencies:
+        print(f"  首字延迟 p50 {percentile(latencies, 0.5) * 1000:.0f}ms  "
+              f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms  p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"  胜出次数: {result['winners']}  发出的上游请求: {sent}  失败: {result['failures']}")
+    for provider, stats in result["router"].items():
+        p50, p95 = (f"{stats[key]:.0f}ms" if stats[key] is not None else "-" for key in ("p50_ms", "p95_ms"))
+        print(f"  {provider:<9} p50 {p50}  p95 {p95}  "
+              f"错误率 {stats['error_rate']:.0%}  熔断器 {stats['breaker']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM路由基准测试")
+    parser.add_argument("--requests", type=int, default=100, help="每种模式的请求数")
+    parser.add_argument("--delays", default="openai=0.3,deepseek=0.15,qianwen=0.5", help="各提供商的首字延迟（秒）")
+    parser.add_argument("--tail", type=float, default=0.1, help="出现长尾延迟的请求比例")
+    parser.add_argument("--tail-factor", type=float, default=8.0, help="长尾请求的延迟倍数")
+    parser.add_argument("--fail", default="", help="逗号分隔，始终返回500的提供商")
+    args = parser.parse_args()
+
+    delays = {name: float(value) for name, value in (item.split("=") for item in args.delays.split(","))}
+    failing = set(filter(None, args.fail.split(",")))
+    servers = {
+        name: start_provider(name, delays.get(name, 0.3), args.tail, args.tail_factor, name in failing)
+        for name in PROVIDERS
+    }
+    for name, server in servers.items():
+        path = "/api/v1/services/aigc/text-generation/generation" if name == "qianwen" else "/v1/chat/completions"
+        os.environ[f"{name.upper()}_API_URL"] = f"http://127.0.0.1:{server.server_port}{path}"
+        os.environ[f"{name.upper()}_API_KEY"] = "fake-key"
+
+    print(f"🚀 LLM 路由基准测试（延迟 {delays}，长尾 {args.tail:.0%} x{args.tail_factor:g}，"
+          f"故障 {sorted(failing) or '无'}）")
+    print("=" * 50)
+    results = {}
+    for name, hedge in (("不对冲", False), ("对冲", True)):
+        before = {provider: server.requests for provider, server in servers.items()}
+        results[name] = run(args.requests, hedge, servers)
+        sent = {provider: server.requests - before[provider] for provider, server in servers.items()}
+        report(name, results[name], sent)
+        print("-" * 50)
+
+    failed = sum(result["failures"] for result in results.values())
+    print("=" * 50)
+    if failed:
+        print(f"❌ {failed} 个请求失败")
+        return False
+    print("✅ 测试完成")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
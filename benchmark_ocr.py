@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+OCR 引擎吞吐量基准测试
+
+生成一批带轻微倾斜的合成文本页面，分别以 1、2、4……个工作进程识别，
+统计每秒处理的图片数以及相对单进程的加速比。
+未安装 Tesseract 时只测试预处理（对比度、纠偏）部分。
+另外对比大尺寸手机照片（JPEG）完整解码与归一化（draft/reduce）的耗时和位图大小。
+
+用法:
+    python benchmark_ocr.py --pages 32 --workers 1,2,4,8
+    python benchmark_ocr.py --preprocess-only
+"""
+
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ocr_engine import DEFAULT_DPI, DEFAULT_MAX_PIXELS, OCREngine, normalize, preprocess
+
+WORDS = ("invoice order total amount shipping address customer account payment "
+         "reference quantity description service delivery schedule").split()
+
+
+def make_page(seed: int, dpi: int = DEFAULT_DPI) -> bytes:
+    """生成一张 A4 大小的合成文本页面（PNG），随机倾斜 ±3°"""
+    rng = random.Random(seed)
+    width, height = round(8.27 * dpi), round(11.69 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    title_font = ImageFont.load_default(size=dpi // 5)
+    body_font = ImageFont.load_default(size=dpi // 10)
+
+    y = dpi // 2
+    draw.text((dpi // 2, y), f"Report {seed}", font=title_font, fill=0)
+    y += dpi // 2
+    while y < height - dpi:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 10)))
+        draw.text((dpi // 2, y), line, font=body_font, fill=0)
+        y += dpi // 6
+
+    image = image.rotate(rng.uniform(-3, 3), resample=Image.Resampling.BICUBIC, fillcolor=255)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", dpi=(dpi, dpi))
+    return buffer.getvalue()
+
+
+def make_photo(width: int = 8064, height: int = 6048) -> bytes:
+    """生成一张手机照片大小的JPEG（EXIF方向为旋转90°，72dpi）"""
+    page = Image.open(io.BytesIO(make_page(0, dpi=150))).convert("RGB")
+    photo = page.resize((height, width)).transpose(Image.Transpose.ROTATE_90)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=90, dpi=(72, 72), exif=exif)
+    return buffer.getvalue()
+
+
+def benchmark_decode(rounds: int = 3):
+    """对比完整解码后缩放与 normalize（draft/reduce）的耗时和解码位图大小"""
+    data = make_photo()
+    full = Image.open(io.BytesIO(data))
+    print(f"手机照片: {full.width}x{full.height} JPEG，{len(data) / 1024 / 1024:.1f}MB")
+
+    def decode_full():
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        scale = (DEFAULT_MAX_PIXELS / (image.width * image.height)) ** 0.5
+        size = (round(image.width * scale), round(image.height * scale))
+        return image.convert("L").resize(size, Image.Resampling.LANCZOS), image.width * image.height * 3
+
+    def decode_normalized():
+        image = Image.open(io.BytesIO(data))
+        result = normalize(image, DEFAULT_DPI, DEFAULT_MAX_PIXELS)
+        return result, image.width * image.height * len(image.getbands())
+
+    for name, decode in (("完整解码", decode_full), ("draft/reduce", decode_normalized)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            image, decoded_bytes = decode()
+        elapsed = (time.perf_counter() - started) / rounds
+        print(f"  {name:<12} {elapsed * 1000:>7.0f}ms  解码位图 {decoded_bytes / 1024 / 1024:>6.1f}MB  "
+              f"输出 {image.width}x{image.height}")
+
+
+def preprocess_batch(pages, options):
+    for page in pages:
+        preprocess(Image.frombytes("L", *page))
+    return len(pages)
+
+
+def make_runner(workers: int, batch_size: int, preprocess_only: bool, lang: str):
+    """返回 (识别函数, 关闭函数)"""
+    if not preprocess_only:
+        engine = OCREngine(workers=workers, batch_size=batch_size, lang=lang)
+        return engine.recognize_many, engine.close
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def run(pages):
+        size = max(1, min(batch_size, math.ceil(len(pages) / workers)))
+        batches = [pages[i:i + size] for i in range(0, len(pages), size)]
+        return list(executor.map(preprocess_batch, batches, repeat({})))
+
+    return run, executor.shutdown
+
+
+def benchmark(pages, workers: int, batch_size: int, preprocess_only: bool, lang: str) -> dict:
+    run, close = make_runner(workers, batch_size, preprocess_only, lang)
+    try:
+        run(pages[:workers])  # 预热：启动工作进程并完成导入
+        started = time.perf_counter()
+        results = run(pages)
+        elapsed = time.perf_counter() - started
+    finally:
+        close()
+
+    failed = 0 if preprocess_only else sum(1 for page in results if page["status"] != "completed")
+    return {"workers": workers, "elapsed": elapsed, "throughput": len(pages) / elapsed, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR引擎吞吐量基准测试")
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)})
+    parser.add_argument("--pages", type=int, default=32, help="页面数")
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)), help="逗号分隔的工作进程数")
+    parser.add_argument("--batch-size", type=int, default=4, help="每批提交的页数")
+    parser.add_argument("--lang", default="eng", help="Tesseract 语言")
+    parser.add_argument("--preprocess-only", action="store_true", help="只测试预处理")
+    args = parser.parse_args()
+
+    preprocess_only = args.preprocess_only
+    if not preprocess_only and not OCREngine.available():
+        print("⚠️ 未找到 pytesseract / tesseract，只测试预处理")
+        preprocess_only = True
+
+    print(f"🚀 OCR 吞吐量基准测试（{'预处理' if preprocess_only else '预处理+识别'}，CPU核数 {cpus}）")
+    print("=" * 50)
+    benchmark_decode()
+    print("=" * 50)
+
+    print("生成测试页面...")
+    files = [make_page(seed) for seed in range(args.pages)]
+    loader = OCREngine()
+    started = time.perf_counter()
+    pages = [page for data in files for page in loader.load(data)]
+    elapsed = time.perf_counter() - started
+    print(f"{len(pages)} 页，平均 {sum(map(len, files)) / len(files) / 1024:.0f}KB，"
+          f"归一化 {elapsed / len(pages) * 1000:.0f}ms/页")
+    print("=" * 50)
+
+    baseline = None
+    failed = 0
+    print(f"{'进程数':>6} {'耗时(s)':>9} {'图片/秒':>9} {'加速比':>7} {'效率':>6}")
+    for workers in (int(n) for n in args.workers.split(",")):
+        result = benchmark(pages, workers, args.batch_size, preprocess_only, args.lang)
+        baseline = baseline or result["throughput"] / result["workers"]
+        speedup = result["throughput"] / baseline
+        failed += result["failed"]
+        print(f"{workers:>6} {result['elapsed']:>9.2f} {result['throughput']:>9.2f} "
+              f"{speedup:>6.2f}x {speedup / workers:>6.0%}")
+
+    print("=" * 50)
+    if failed:
+        print(f"❌ {failed} 页识别失败")
+        return False
+    print("✅ 测试完成")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Streamlit 重跑开销基准测试
+
+以无界面模式启动应用，用一个最简的 websocket 客户端模拟浏览器反复触发重跑：
+与浏览器一样把已缓存消息的哈希随重跑请求带给服务器。统计首次渲染和之后每次重跑
+收到的字节数、以哈希引用代替完整内容的元素数，以及服务器进程每次重跑消耗的CPU时间。
+
+需要额外安装 websockets（pip install websockets）。
+
+用法:
+    python benchmark_rerun.py --reruns 30
+    python benchmark_rerun.py --app /path/to/other/streamlit_app.py
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid: int) -> float:
+    """进程累计的用户态+内核态CPU时间"""
+    try:
+        import psutil
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except ImportError:
+        # 没有psutil时读取 /proc（仅Linux）
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def start_app(app: str, port: int, extra_args: list) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app,
+         "--server.headless=true", f"--server.port={port}",
+         "--browser.gatherUsageStats=false", *extra_args],
+        cwd=os.path.dirname(os.path.abspath(app)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Streamlit 启动超时")
+
+
+async def rerun(ws, cached_hashes: set) -> dict:
+    """触发一次重跑，收到 script_finished 为止"""
+    msg = BackMsg()
+    msg.rerun_script.query_string = ""
+    msg.rerun_script.cached_message_hashes.extend(sorted(cached_hashes))
+    await ws.send(msg.SerializeToString())
+
+    stats = {"bytes": 0, "messages": 0, "references": 0}
+    while True:
+        data = await ws.recv()
+        forward = ForwardMsg()
+        forward.ParseFromString(data)
+        stats["bytes"] += len(data)
+        stats["messages"] += 1
+        if forward.WhichOneof("type") == "ref_hash":
+            stats["references"] += 1
+        elif forward.metadata.cacheable:
+            cached_hashes.add(forward.hash)
+        if forward.WhichOneof("type") == "script_finished":
+            return stats
+
+
+async def run_benchmark(port: int, pid: int, reruns: int) -> list:
+    results = []
+    cached_hashes = set()
+    async with websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                  subprotocols=["streamlit"], max_size=None) as ws:
+        for _ in range(reruns + 1):
+            cpu_before = cpu_seconds(pid)
+            started = time.perf_counter()
+            stats = await rerun(ws, cached_hashes)
+            stats["wall_ms"] = (time.perf_counter() - started) * 1000
+            stats["cpu_ms"] = (cpu_seconds(pid) - cpu_before) * 1000
+            results.append(stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit重跑开销基准测试")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py"))
+    parser.add_argument("--reruns", type=int, default=30, help="首次渲染之后的重跑次数")
+    parser.add_argument("streamlit_args", nargs="*", help="传给 streamlit run 的额外参数，例如 --global.minCachedMessageSize=10000")
+    args = parser.parse_args()
+
+    print(f"🚀 Streamlit 重跑开销基准测试: {args.app}")
+    port = free_port()
+    process = start_app(args.app, port, args.streamlit_args)
+    try:
+        results = asyncio.run(run_benchmark(port, process.pid, args.reruns))
+    finally:
+        process.terminate()
+        process.wait()
+
+    first, steady = results[0], results[1:]
+    print("=" * 50)
+    print(f"首次渲染: {first['bytes'] / 1024:.1f}KB，{first['messages']} 条消息")
+    if steady:
+        def average(key):
+            return sum(r[key] for r in steady) / len(steady)
+        print(f"之后每次重跑: {average('bytes') / 1024:.1f}KB，{average('messages'):.0f} 条消息，"
+              f"其中 {average('references'):.0f} 条为缓存引用")
+        print(f"服务器CPU: {average('cpu_ms'):.1f}ms/次，往返耗时 {average('wall_ms'):.1f}ms/次")
+    print("=" * 50)
+    print("✅ 测试完成")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Agent B TTS 并发基准测试
+
+启动一个本地的假 ElevenLabs 服务器（每次合成固定延迟、分块返回音频），
+再以子进程方式启动 Agent B 指向该服务器，同时提交多个 /tts 任务，
+并在合成进行期间持续轮询 /task/{id}，统计轮询延迟。
+
+用法:
+    python benchmark.py --jobs 20 --delay 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+BENCHMARK_VOICES = [
+    {"voice_id": "21m00Tcm4TlvDq8ikWAM", "name": "Rachel", "category": "premade", "labels": {"language": "en"}}
+]
+
+
+class FakeElevenLabsHandler(BaseHTTPRequestHandler):
+    """模拟 ElevenLabs API：合成请求延迟 delay 秒后分块返回"""
+
+    delay = 3.0
+    chunks = 10
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if not self.path.startswith("/v1/text-to-speech/"):
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for _ in range(self.chunks):
+            time.sleep(self.delay / self.chunks)
+            chunk = b"\xff\xfb\x90\x00" + b"\x00" * 4092
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        # /v1/voices 与官方接口一样返回 {"voices": [...]}，/v1/models 等其他只读接口返回空列表
+        if self.path.split("?")[0] == "/v1/voices":
+            body = json.dumps({"voices": BENCHMARK_VOICES}).encode()
+        else:
+            body = b"[]"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_elevenlabs(port: int, delay: float) -> ThreadingHTTPServer:
+    """在后台线程中启动假 ElevenLabs 服务器"""
+    FakeElevenLabsHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeElevenLabsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_agent(port: int, fake_port: int, workers: int) -> subprocess.Popen:
+    """以子进程方式启动 Agent B，指向假 ElevenLabs 服务器"""
+    env = dict(os.environ)
+    env["ELEVENLABS_API_KEY"] = "benchmark-key"
+    env["ELEVENLABS_BASE_URL"] = f"http://127.0.0.1:{fake_port}"
+    env["SYNTHESIS_MAX_WORKERS"] = str(workers)
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(50):
+        try:
+            if requests.get(f"{base_url}/", timeout=1).status_code == 200:
+                return proc
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError("Agent B 启动失败")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_benchmark(base_url: str, jobs: int, timeout: float):
+    """并发提交 jobs 个任务，并统计合成期间的轮询延迟"""
+    session = requests.Session()
+
+    def submit(i):
+        response = session.post(f"{base_url}/tts", json={
+            "text": f"基准测试文本 {i}。This is benchmark text number {i}.",
+            "voice_id": "21m00Tcm4TlvDq8ikWAM"
+        })
+        response.raise_for_status()
+        return response.json()["task_id"]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        task_ids = list(pool.map(submit, range(jobs)))
+
+    latencies = []
+    pending = set(task_ids)
+    deadline = time.time() + timeout
+
+    while pending and time.time() < deadline:
+        for task_id in list(pending):
+            t0 = time.perf_counter()
+            status = session.get(f"{base_url}/task/{task_id}").json()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if status["status"] in ("completed", "failed"):
+                pending.discard(task_id)
+        time.sleep(0.05)
+
+    wall_time = time.perf_counter() - started
+    health = session.get(f"{base_url}/health").json()
+
+    return {
+        "jobs": jobs,
+        "unfinished": len(pending),
+        "wall_time": wall_time,
+        "polls": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "max": max(latencies),
+        "synthesis": health.get("synthesis")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent B 并发合成基准测试")
+    parser.add_argument("--jobs", type=int, default=20, help="并发 /tts 任务数")
+    parser.add_argument("--delay", type=float, default=3.0, help="假服务器每次合成耗时（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="SYNTHESIS_MAX_WORKERS")
+    parser.add_argument("--port", type=int, default=8012, help="Agent B 端口")
+    parser.add_argument("--fake-port", type=int, default=8013, help="假 ElevenLabs 端口")
+    parser.add_argument("--timeout", type=float, default=120.0, help="等待全部任务完成的超时（秒）")
+    args = parser.parse_args()
+
+    fake_server = start_fake_elevenlabs(args.fake_port, args.delay)
+    agent = start_agent(args.port, args.fake_port, args.workers)
+
+    try:
+        print(f"🏁 提交 {args.jobs} 个任务（合成耗时 {args.delay}s，线程池 {args.workers}）...")
+        result = run_benchmark(f"http://127.0.0.1:{args.port}", args.jobs, args.timeout)
+    finally:
+        agent.terminate()
+        agent.wait()
+        fake_server.shutdown()
+
+    print("=" * 50)
+    print(f"总耗时: {result['wall_time']:.2f}s  未完成: {result['unfinished']}")
+    print(f"轮询次数: {result['polls']}")
+    print(f"轮询延迟 p50: {result['p50']:.1f}ms  p95: {result['p95']:.1f}ms  max: {result['max']:.1f}ms")
+    print(f"线程池指标: {result['synthesis']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Agent B 目录缓存
+ElevenLabs 的语音列表和模型列表很少变化，缓存在进程内并提前在后台刷新，
+/voices 和 /health 不再每次请求都访问ElevenLabs
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """带TTL的提前刷新（refresh-ahead）缓存
+
+    loader 是同步阻塞函数（ElevenLabs SDK），在线程中执行，返回可JSON序列化的数据。
+    - 缓存年龄超过 ttl * refresh_ahead 时，读取立即返回当前值，同时在后台刷新
+    - 超过 ttl 时等待刷新完成；刷新失败则继续返回旧值（并记录错误），没有旧值时抛出异常
+    - 同一时刻只有一个刷新在进行，并发读取共用同一次刷新
+    - 刷新失败后 retry_interval 秒内不再触发后台刷新，ElevenLabs不可用时
+      频繁的 /health 请求不会每次都发起一次刷新
+    每个值附带内容哈希生成的ETag，用于条件请求。
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], ttl: float = 300.0, refresh_ahead: float = 0.8,
+                 retry_interval: float = 30.0):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_interval = retry_interval
+        self.value = None
+        self.etag: Optional[str] = None
+        self.updated_at: Optional[float] = None
+        self.failed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.refreshes = 0
+        self.failures = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.updated_at is not None
+
+    def age(self) -> Optional[float]:
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    def backing_off(self) -> bool:
+        """上次刷新失败后是否仍在重试间隔内"""
+        return self.failed_at is not None and time.monotonic() - self.failed_at < self.retry_interval
+
+    async def get(self) -> Any:
+        """读取缓存，必要时等待或在后台触发刷新"""
+        age = self.age()
+        if age is None or age >= self.ttl:
+            try:
+                await self.refresh()
+            except Exception:
+                if not self.loaded:
+                    raise
+                logger.warning(f"{self.name} 刷新失败，继续使用 {age:.0f} 秒前的数据")
+        elif age >= self.ttl * self.refresh_ahead and not self.backing_off():
+            self.refresh_in_background()
+        return self.value
+
+    def peek(self) -> Any:
+        """只读取本地已有的值（可能为None），不等待网络；过期时在后台触发刷新（失败后的重试间隔内除外）"""
+        age = self.age()
+        if (age is None or age >= self.ttl * self.refresh_ahead) and not self.backing_off():
+            self.refresh_in_background()
+        return self.value
+
+    def refresh_in_background(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            # 后台刷新的异常已记录在 last_error 中
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def refresh(self):
+        """重新加载；已有刷新在进行时等待它完成"""
+        self.refresh_in_background()
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh(self):
+        try:
+            value = await asyncio.to_thread(self.loader)
+        except Exception as e:
+            self.failures += 1
+            self.failed_at = time.monotonic()
+            self.last_error = str(e)
+            logger.error(f"刷新{self.name}失败: {e}")
+            raise
+        payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+        self.etag = f'"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+        self.value = value
+        self.updated_at = time.monotonic()
+        self.failed_at = None
+        self.last_error = None
+        self.refreshes += 1
+
+    def stats(self) -> dict:
+        age = self.age()
+        return {
+            "loaded": self.loaded,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl_seconds": self.ttl,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
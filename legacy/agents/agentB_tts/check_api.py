@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 """
-Agent B TTS API 测试脚本
+Agent B TTS API 检查脚本
+对运行中的服务（BASE_URL）逐项调用接口并打印结果，不是pytest测试；单元测试见 test_*.py
+
+用法:
+    python check_api.py
 """
 
 import requests
 import json
-import time
 import os
 from dotenv import load_dotenv
 
@@ -16,6 +19,21 @@ load_dotenv('config.env')
 BASE_URL = "http://localhost:8002"
 API_KEY = os.getenv('ELEVENLABS_API_KEY', '')
 
+def wait_for_task(task_id, timeout=30, on_progress=None):
+    """订阅任务进度事件，直到任务完成或失败，返回最终任务状态"""
+    status = None
+    with requests.get(f"{BASE_URL}/task/{task_id}/events", stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            status = json.loads(line[len("data:"):])
+            if on_progress:
+                on_progress(status)
+            if status.get('status') in ('completed', 'failed'):
+                break
+    return status
+
 def test_health():
     """测试健康检查"""
     print("🔍 测试健康检查...")
@@ -43,6 +61,34 @@ def test_voices():
         print(f"❌ 获取语音列表失败: {e}")
         return False
 
+def test_health_probes():
+    """测试存活/就绪检查"""
+    print("\n💓 测试存活/就绪检查...")
+    try:
+        live = requests.get(f"{BASE_URL}/health/live")
+        ready = requests.get(f"{BASE_URL}/health/ready")
+        print(f"存活: {live.status_code}，就绪: {ready.status_code} {ready.json()}")
+        return live.status_code == 200 and ready.status_code == 200
+    except Exception as e:
+        print(f"❌ 存活/就绪检查失败: {e}")
+        return False
+
+def test_voices_etag():
+    """测试语音列表的条件请求"""
+    print("\n🏷️ 测试语音列表ETag...")
+    try:
+        response = requests.get(f"{BASE_URL}/voices")
+        etag = response.headers.get("ETag")
+        if not etag:
+            print("❌ 响应中没有ETag")
+            return False
+        cached = requests.get(f"{BASE_URL}/voices", headers={"If-None-Match": etag})
+        print(f"ETag: {etag}，条件请求状态码: {cached.status_code}")
+        return cached.status_code == 304 and not cached.content
+    except Exception as e:
+        print(f"❌ 语音列表ETag测试失败: {e}")
+        return False
+
 def test_tts():
     """测试TTS功能"""
     print("\n🎵 测试TTS功能...")
@@ -63,44 +109,38 @@ def test_tts():
             task_id = task_info['task_id']
             print(f"任务ID: {task_id}")
             
-            # 轮询任务状态
-            max_attempts = 30
-            for attempt in range(max_attempts):
-                status_response = requests.get(f"{BASE_URL}/task/{task_id}")
-                if status_response.status_code == 200:
-                    task_status = status_response.json()
-                    print(f"任务状态: {task_status['status']} ({task_status['progress']}%)")
-                    
-                    if task_status['status'] == 'completed':
-                        print(f"✅ TTS任务完成!")
-                        print(f"音频URL: {task_status['audio_url']}")
-                        print(f"VTT字幕URL: {task_status['vtt_url']}")
-                        print(f"文件大小: {task_status['file_size']} bytes")
-                        print(f"时长: {task_status['duration']} 秒")
-                        
-                        # 显示QC报告
-                        if task_status.get('qc_report'):
-                            qc = task_status['qc_report']
-                            print(f"QC报告 - 总分: {qc['score']:.1f}")
-                            print(f"  音频质量: {qc['audio_quality']:.1f}")
-                            print(f"  文本准确性: {qc['text_accuracy']:.1f}")
-                            print(f"  语音一致性: {qc['voice_consistency']:.1f}")
-                            if qc['issues']:
-                                print(f"  问题: {', '.join(qc['issues'])}")
-                            if qc['recommendations']:
-                                print(f"  建议: {', '.join(qc['recommendations'])}")
-                        
-                        return True
-                    elif task_status['status'] == 'failed':
-                        print(f"❌ TTS任务失败: {task_status.get('error_message', '未知错误')}")
-                        return False
-                    
-                    time.sleep(1)
-                else:
-                    print(f"❌ 获取任务状态失败: {status_response.status_code}")
-                    return False
+            # 订阅任务进度
+            task_status = wait_for_task(
+                task_id,
+                on_progress=lambda s: print(f"任务状态: {s['status']} ({s['progress']}%)")
+            )
             
-            print("⏰ 任务超时")
+            if task_status is None:
+                print("⏰ 任务超时")
+                return False
+            
+            if task_status['status'] == 'completed':
+                print(f"✅ TTS任务完成!")
+                print(f"音频URL: {task_status['audio_url']}")
+                print(f"VTT字幕URL: {task_status['vtt_url']}")
+                print(f"文件大小: {task_status['file_size']} bytes")
+                print(f"时长: {task_status['duration']} 秒")
+                
+                # 显示QC报告
+                if task_status.get('qc_report'):
+                    qc = task_status['qc_report']
+                    print(f"QC报告 - 总分: {qc['score']:.1f}")
+                    print(f"  音频质量: {qc['audio_quality']:.1f}")
+                    print(f"  文本准确性: {qc['text_accuracy']:.1f}")
+                    print(f"  语音一致性: {qc['voice_consistency']:.1f}")
+                    if qc['issues']:
+                        print(f"  问题: {', '.join(qc['issues'])}")
+                    if qc['recommendations']:
+                        print(f"  建议: {', '.join(qc['recommendations'])}")
+                
+                return True
+            
+            print(f"❌ TTS任务失败: {task_status.get('error_message', '未知错误')}")
             return False
         else:
             print(f"❌ 创建TTS任务失败: {response.text}")
@@ -132,6 +172,9 @@ def test_batch_tts():
             print(f"批量任务ID: {batch_info['batch_id']}")
             print(f"任务数量: {batch_info['total_tasks']}")
             print(f"任务ID列表: {batch_info['task_ids']}")
+            
+            status = requests.get(f"{BASE_URL}/batch/{batch_info['batch_id']}").json()
+            print(f"批量进度: {status['progress']}% ({status['status']})")
             return True
         else:
             print(f"❌ 创建批量任务失败: {response.text}")
@@ -176,13 +219,9 @@ def test_vtt_download():
             task_id = response.json()['task_id']
             
             # 等待任务完成
-            for _ in range(30):
-                status = requests.get(f"{BASE_URL}/task/{task_id}").json()
-                if status['status'] == 'completed':
-                    break
-                time.sleep(1)
+            status = wait_for_task(task_id)
             
-            if status['status'] == 'completed':
+            if status and status['status'] == 'completed':
                 # 下载VTT文件
                 vtt_response = requests.get(f"{BASE_URL}/task/{task_id}/vtt")
                 if vtt_response.status_code == 200:
@@ -219,13 +258,9 @@ def test_qc_report():
             task_id = response.json()['task_id']
             
             # 等待任务完成
-            for _ in range(30):
-                status = requests.get(f"{BASE_URL}/task/{task_id}").json()
-                if status['status'] == 'completed':
-                    break
-                time.sleep(1)
+            status = wait_for_task(task_id)
             
-            if status['status'] == 'completed':
+            if status and status['status'] == 'completed':
                 # 获取QC报告
                 qc_response = requests.get(f"{BASE_URL}/task/{task_id}/qc-report")
                 if qc_response.status_code == 200:
@@ -256,7 +291,9 @@ def main():
     
     tests = [
         ("健康检查", test_health),
+        ("存活/就绪检查", test_health_probes),
         ("语音列表", test_voices),
+        ("语音列表ETag", test_voices_etag),
         ("TTS功能", test_tts),
         ("VTT字幕下载", test_vtt_download),
         ("QC报告获取", test_qc_report),
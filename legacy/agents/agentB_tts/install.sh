@@ -53,5 +53,5 @@ echo "1. 编辑 config.env 文件，设置 ElevenLabs API 密钥"
 echo "2. 运行: python run.py"
 echo "3. 访问: http://localhost:8002/docs"
 echo ""
-echo "测试命令: python test_api.py"
+echo "测试命令: python check_api.py"
 
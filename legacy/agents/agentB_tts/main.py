@@ -3,19 +3,26 @@ Agent B - 文字转语音 (TTS) 服务
 使用 ElevenLabs API 进行高质量语音合成
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Set
 import os
 import uuid
 import asyncio
+import threading
 import aiofiles
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 from elevenlabs.client import ElevenLabs
 from elevenlabs import Voice, VoiceSettings
 import json
+import base64
+import re
+from task_store import create_task_store, page_key
+from synthesis_cache import SynthesisCache
+from catalog_cache import CatalogCache
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -29,9 +36,27 @@ app = FastAPI(
 
 # 配置
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY', '')
+ELEVENLABS_BASE_URL = os.getenv('ELEVENLABS_BASE_URL', '')  # 为空时使用官方地址
+SYNTHESIS_MAX_WORKERS = int(os.getenv('SYNTHESIS_MAX_WORKERS', 4))  # 同时进行的合成数
 UPLOAD_DIR = "uploads"
 OUTPUT_DIR = "outputs"
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_TEXT_LENGTH = 5000  # 单次合成的最大字符数，更长的文本按句子分段合成
+BATCH_MAX_TEXTS = int(os.getenv('BATCH_MAX_TEXTS', 5000))  # 单个批量任务的最大文本数
+BATCH_MAX_TEXT_LENGTH = int(os.getenv('BATCH_MAX_TEXT_LENGTH', 100000))  # 批量任务中单个文本的最大字符数
+BATCH_PARALLELISM = int(os.getenv('BATCH_PARALLELISM', 2))  # 同时处理的批量子任务数，应小于SYNTHESIS_MAX_WORKERS
+TASK_STORE_BACKEND = os.getenv('TASK_STORE_BACKEND', 'sqlite')  # sqlite 或 memory
+TASK_DB_PATH = os.getenv('TASK_DB_PATH', 'tasks.db')
+MAX_PAGE_SIZE = 200  # /tasks 每页最多返回的任务数
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式播放每次读取的字节数
+STREAM_POLL_INTERVAL = 0.5  # 任务在其他worker中合成时，流式读取轮询磁盘的间隔（秒）
+EVENTS_HEARTBEAT_INTERVAL = 15  # 进度事件流的心跳间隔（秒）
+SYNTHESIS_CACHE_DIR = os.getenv('SYNTHESIS_CACHE_DIR', os.path.join(OUTPUT_DIR, "cache"))  # 须与OUTPUT_DIR在同一文件系统
+SYNTHESIS_CACHE_MAX_ENTRIES = int(os.getenv('SYNTHESIS_CACHE_MAX_ENTRIES', 1000))  # 设为0关闭缓存
+SYNTHESIS_CACHE_MAX_BYTES = int(os.getenv('SYNTHESIS_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+CATALOG_TTL = int(os.getenv('CATALOG_TTL', 3600))  # 语音/模型列表缓存时间（秒），到期前在后台提前刷新
+CATALOG_RETRY_INTERVAL = int(os.getenv('CATALOG_RETRY_INTERVAL', 30))  # 列表刷新失败后多久再在后台重试（秒）
+VOICES_MAX_AGE = 60  # /voices 响应允许客户端缓存的秒数，之后用ETag重新验证
 
 # 确保目录存在
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -39,11 +64,202 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # 初始化ElevenLabs客户端
 if ELEVENLABS_API_KEY:
-    elevenlabs = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+    if ELEVENLABS_BASE_URL:
+        # base_url 参数会强制使用https并丢弃端口，这里直接指定完整地址
+        from elevenlabs.environment import ElevenLabsEnvironment
+        elevenlabs = ElevenLabs(
+            api_key=ELEVENLABS_API_KEY,
+            environment=ElevenLabsEnvironment(
+                base=ELEVENLABS_BASE_URL,
+                wss=ELEVENLABS_BASE_URL.replace("http", "ws", 1)
+            )
+        )
+    else:
+        elevenlabs = ElevenLabs(api_key=ELEVENLABS_API_KEY)
 else:
     elevenlabs = None
     logger.warning("ElevenLabs API key not found. Service will run in mock mode.")
 
+class SynthesisExecutor:
+    """语音合成线程池
+
+    ElevenLabs SDK 是同步阻塞的，直接在 async 函数中调用会卡住整个事件循环，
+    因此所有合成调用都提交到这里执行，并记录排队深度等指标。
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="tts-synthesis"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, func, *args):
+        """在线程池中执行阻塞函数并等待结果"""
+        with self._lock:
+            self.queued += 1
+
+        def _call():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                result = func(*args)
+            except Exception:
+                with self._lock:
+                    self.running -= 1
+                    self.failed += 1
+                raise
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+            return result
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _call)
+
+    def stats(self) -> dict:
+        """线程池运行指标"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed
+            }
+
+synthesis_executor = SynthesisExecutor(SYNTHESIS_MAX_WORKERS)
+
+class LiveAudio:
+    """正在合成的音频文件
+
+    合成线程每写入一个分块就通过 publish 更新已写入的字节数，
+    流式读取者在事件循环中等待新数据，不需要轮询。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self.written = 0
+        self.done = False
+
+    def _update(self, written: Optional[int], done: bool):
+        if written is not None:
+            self.written = written
+        self.done = self.done or done
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, written: int):
+        """记录已写入的字节数（可在合成线程中调用）"""
+        self._loop.call_soon_threadsafe(self._update, written, False)
+
+    def finish(self):
+        """合成结束（成功或失败）"""
+        self._loop.call_soon_threadsafe(self._update, None, True)
+
+    async def wait(self, offset: int):
+        """等待写入超过 offset 字节或合成结束"""
+        changed = self._changed
+        if self.written > offset or self.done:
+            return
+        await changed.wait()
+
+class TaskEvents:
+    """任务进度订阅
+
+    每个订阅者持有一个asyncio.Queue，任务状态变化时推送到对应队列；
+    没有订阅者的任务不产生任何额外开销。
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._local: Set[str] = set()  # 由当前worker处理的任务
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[task_id]
+
+    def publish(self, task):
+        for queue in self._subscribers.get(task.task_id, ()):
+            queue.put_nowait(task.model_copy(deep=True))
+
+    def mark_local(self, task_id: str):
+        self._local.add(task_id)
+
+    def unmark_local(self, task_id: str):
+        self._local.discard(task_id)
+
+    def is_local(self, task_id: str) -> bool:
+        """任务是否由当前worker处理（否则进度只能从任务存储中读取）"""
+        return task_id in self._local
+
+task_events = TaskEvents()
+
+# 当前worker中正在合成的音频，供 /task/{task_id}/stream 跟随
+live_audio: Dict[str, LiveAudio] = {}
+
+# 合成结果缓存（相同文本和参数不重复调用ElevenLabs）
+synthesis_cache = SynthesisCache(
+    SYNTHESIS_CACHE_DIR,
+    max_entries=SYNTHESIS_CACHE_MAX_ENTRIES,
+    max_bytes=SYNTHESIS_CACHE_MAX_BYTES
+)
+
+# 未配置ElevenLabs时返回的模拟语音列表
+MOCK_VOICES = [
+    {
+        "voice_id": "21m00Tcm4TlvDq8ikWAM",
+        "name": "Rachel",
+        "category": "premade",
+        "description": "默认女性语音",
+        "labels": {"gender": "female", "age": "young"}
+    },
+    {
+        "voice_id": "AZnzlk1XvdvUeBnXmlld",
+        "name": "Domi",
+        "category": "premade",
+        "description": "默认男性语音",
+        "labels": {"gender": "male", "age": "young"}
+    }
+]
+
+def load_voices() -> List[dict]:
+    """从ElevenLabs获取语音列表"""
+    return [
+        {
+            "voice_id": voice.voice_id,
+            "name": voice.name,
+            "category": voice.category,
+            "description": voice.description,
+            "labels": voice.labels
+        }
+        for voice in elevenlabs.voices.get_all().voices
+    ]
+
+def load_models() -> List[dict]:
+    """从ElevenLabs获取模型列表"""
+    return [{"model_id": model.model_id, "name": model.name} for model in elevenlabs.models.get_all()]
+
+# 语音和模型列表缓存（/voices、/health 不再每次请求都访问ElevenLabs）
+voices_cache = CatalogCache("语音列表", load_voices if elevenlabs else lambda: MOCK_VOICES,
+                            ttl=CATALOG_TTL, retry_interval=CATALOG_RETRY_INTERVAL)
+models_cache = CatalogCache("模型列表", load_models, ttl=CATALOG_TTL, retry_interval=CATALOG_RETRY_INTERVAL)
+
 # 数据模型
 class TTSRequest(BaseModel):
     text: str
@@ -73,6 +289,7 @@ class QCReport(BaseModel):
 
 class TaskStatus(BaseModel):
     task_id: str
+    batch_id: Optional[str] = None  # 所属批量任务
     status: str  # pending, processing, completed, failed
     progress: int  # 0-100
     text: str
@@ -82,6 +299,7 @@ class TaskStatus(BaseModel):
     duration: Optional[float] = None
     file_size: Optional[int] = None
     qc_report: Optional[QCReport] = None  # QC质检报告
+    stream_url: Optional[str] = None  # 边合成边播放的音频流URL
     error_message: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
@@ -94,8 +312,55 @@ class BatchTTSRequest(BaseModel):
     language: Optional[str] = "zh"
     output_format: Optional[str] = "mp3"
 
-# 内存中的任务存储（生产环境应使用数据库）
-tasks = {}
+class BatchStatus(BaseModel):
+    batch_id: str
+    total: int
+    voice_id: str
+    request: Optional[dict] = None  # 子任务共用的合成参数（不含文本），重启后据此重新排队
+    created_at: datetime
+
+# 任务存储（SQLite WAL模式，多个worker共享，重启后不丢失）
+task_store = create_task_store(TASK_STORE_BACKEND, TaskStatus, TASK_DB_PATH, batch_model=BatchStatus)
+
+class BatchScheduler:
+    """批量任务调度器
+
+    所有批量子任务进入同一个队列，由固定数量的worker协程依次处理，
+    一次提交数千个文本也只会同时处理 parallelism 个，不会挤占单个 /tts 请求。
+    队列只在内存中，服务重启时由 resume_interrupted_tasks 按任务存储重新排队。
+    """
+
+    def __init__(self, parallelism: int):
+        self.parallelism = parallelism
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def submit(self, jobs: List[tuple]):
+        """提交 (task_id, TTSRequest) 列表"""
+        if self._queue is None:
+            # 需要在事件循环中创建，因此延迟到第一次提交时启动
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.parallelism)]
+        for job in jobs:
+            self._queue.put_nowait(job)
+
+    async def _worker(self):
+        while True:
+            task_id, request = await self._queue.get()
+            try:
+                await process_tts_task(task_id, request)
+            except Exception as e:
+                logger.error(f"批量子任务异常 {task_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "parallelism": self.parallelism,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0
+        }
+
+batch_scheduler = BatchScheduler(BATCH_PARALLELISM)
 
 # 默认语音设置
 DEFAULT_VOICE_SETTINGS = {
@@ -115,70 +380,129 @@ async def root():
         "elevenlabs_connected": elevenlabs is not None
     }
 
+@app.on_event("startup")
+async def warm_catalogs():
+    """启动时在后台加载语音和模型列表，就绪检查在加载完成后才通过"""
+    voices_cache.refresh_in_background()
+    if elevenlabs:
+        models_cache.refresh_in_background()
+
+@app.on_event("startup")
+async def resume_interrupted_tasks():
+    """重启后处理上次未完成的任务
+
+    批量子任务按批量记录中的合成参数重新排队；单个 /tts 任务的请求参数没有保存，
+    标记为失败，由调用方重新提交。每个任务以原状态为条件更新，多个worker同时启动时
+    只有一个会接手；仍处于 processing 的任务被视为已随旧进程中断，因此所有worker
+    应一起重启，而不是在其他worker运行期间单独启动新worker。
+    """
+    interrupted = [
+        task
+        for status in ("pending", "processing")
+        for task in iter_tasks(status=status)
+    ]
+    interrupted.sort(key=page_key)
+    
+    jobs = []
+    failed = 0
+    batches = {}
+    for task in interrupted:
+        status = task.status
+        if task.batch_id and task.batch_id not in batches:
+            batches[task.batch_id] = task_store.get_batch(task.batch_id)
+        batch = batches.get(task.batch_id)
+        if batch is not None and batch.request is not None:
+            task.status = "pending"
+            task.progress = 0
+            if task_store.update(task, expected_status=status):
+                task_events.mark_local(task.task_id)
+                jobs.append((task.task_id, TTSRequest(text=task.text, **batch.request)))
+        else:
+            task.status = "failed"
+            task.error_message = "服务重启，任务已中断，请重新提交"
+            task.completed_at = datetime.now()
+            if task_store.update(task, expected_status=status):
+                failed += 1
+    
+    if jobs:
+        batch_scheduler.submit(jobs)
+    if jobs or failed:
+        logger.info(f"恢复未完成的任务: 重新排队 {len(jobs)} 个，标记失败 {failed} 个")
+
+def iter_tasks(status: Optional[str] = None):
+    """按创建时间倒序遍历任务存储中的全部任务（键集分页）"""
+    before = None
+    while True:
+        page = task_store.page(limit=MAX_PAGE_SIZE, before=before, status=status)
+        yield from page
+        if len(page) < MAX_PAGE_SIZE:
+            return
+        before = page_key(page[-1])
+
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    try:
-        if elevenlabs:
-            # 测试ElevenLabs连接
-            models = elevenlabs.models.get_all()
-            return {
-                "status": "healthy",
-                "elevenlabs_connected": True,
-                "available_models": len(models)
-            }
-        else:
-            return {
-                "status": "healthy",
-                "elevenlabs_connected": False,
-                "mode": "mock"
-            }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e)
+    """健康检查端点（只读取本地状态，不访问ElevenLabs）"""
+    if elevenlabs:
+        models = models_cache.peek()
+        health = {
+            "status": "healthy",
+            "elevenlabs_connected": True,
+            "available_models": len(models) if models is not None else None
         }
+        if models is None and models_cache.last_error:
+            health.update(status="unhealthy", error=models_cache.last_error)
+    else:
+        health = {
+            "status": "healthy",
+            "elevenlabs_connected": False,
+            "mode": "mock"
+        }
+    health.update({
+        "catalog": {"voices": voices_cache.stats(), "models": models_cache.stats()},
+        "synthesis": synthesis_executor.stats(),
+        "synthesis_cache": synthesis_cache.stats(),
+        "batch": batch_scheduler.stats()
+    })
+    return health
+
+@app.get("/health/live")
+async def liveness_check():
+    """存活检查：进程能响应即可"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪检查：语音和模型列表已加载（模拟模式下始终就绪），未就绪时返回503"""
+    catalogs = [voices_cache, models_cache] if elevenlabs else [voices_cache]
+    pending = [cache.name for cache in catalogs if cache.peek() is None]
+    if pending and elevenlabs:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "pending": pending,
+                     "errors": {cache.name: cache.last_error for cache in catalogs if cache.last_error}}
+        )
+    return {"status": "ready"}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 是否包含当前ETag（忽略弱验证前缀 W/）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
 
 @app.get("/voices")
-async def get_voices():
-    """获取可用语音列表"""
+async def get_voices(request: Request):
+    """获取可用语音列表（缓存，支持 If-None-Match 条件请求）"""
     try:
-        if elevenlabs:
-            voices = elevenlabs.voices.get_all()
-            return {
-                "voices": [
-                    {
-                        "voice_id": voice.voice_id,
-                        "name": voice.name,
-                        "category": voice.category,
-                        "description": voice.description,
-                        "labels": voice.labels
-                    }
-                    for voice in voices
-                ]
-            }
-        else:
-            # 返回模拟语音列表
-            return {
-                "voices": [
-                    {
-                        "voice_id": "21m00Tcm4TlvDq8ikWAM",
-                        "name": "Rachel",
-                        "category": "premade",
-                        "description": "默认女性语音",
-                        "labels": {"gender": "female", "age": "young"}
-                    },
-                    {
-                        "voice_id": "AZnzlk1XvdvUeBnXmlld",
-                        "name": "Domi",
-                        "category": "premade", 
-                        "description": "默认男性语音",
-                        "labels": {"gender": "male", "age": "young"}
-                    }
-                ]
-            }
+        voices = await voices_cache.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取语音列表失败: {str(e)}")
+    
+    headers = {"ETag": voices_cache.etag, "Cache-Control": f"public, max-age={VOICES_MAX_AGE}"}
+    if etag_matches(request, voices_cache.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content={"voices": voices}, headers=headers)
 
 @app.post("/tts", response_model=TTSResponse)
 async def create_tts_task(request: TTSRequest, background_tasks: BackgroundTasks):
@@ -188,8 +512,8 @@ async def create_tts_task(request: TTSRequest, background_tasks: BackgroundTasks
         if not request.text.strip():
             raise HTTPException(status_code=400, detail="文本内容不能为空")
         
-        if len(request.text) > 5000:
-            raise HTTPException(status_code=400, detail="文本长度不能超过5000字符")
+        if len(request.text) > MAX_TEXT_LENGTH:
+            raise HTTPException(status_code=400, detail=f"文本长度不能超过{MAX_TEXT_LENGTH}字符，更长的文本请使用 /batch-tts")
         
         # 生成任务ID
         task_id = str(uuid.uuid4())
@@ -201,9 +525,11 @@ async def create_tts_task(request: TTSRequest, background_tasks: BackgroundTasks
             progress=0,
             text=request.text,
             voice_id=request.voice_id,
+            stream_url=f"/task/{task_id}/stream",
             created_at=datetime.now()
         )
-        tasks[task_id] = task
+        task_store.save(task)
+        task_events.mark_local(task_id)
         
         # 添加后台任务
         background_tasks.add_task(process_tts_task, task_id, request)
@@ -215,6 +541,8 @@ async def create_tts_task(request: TTSRequest, background_tasks: BackgroundTasks
             created_at=task.created_at
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"创建TTS任务失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
@@ -222,21 +550,67 @@ async def create_tts_task(request: TTSRequest, background_tasks: BackgroundTasks
 @app.get("/task/{task_id}", response_model=TaskStatus)
 async def get_task_status(task_id: str):
     """获取任务状态"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return tasks[task_id]
+    return task
+
+@app.get("/task/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """订阅任务进度（Server-Sent Events）
+
+    连接后立即推送当前状态，之后每次进度或状态变化推送一条 progress 事件，
+    任务完成或失败后关闭连接。等待期间只发送心跳，不会轮询。
+    """
+    task = task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    queue = task_events.subscribe(task_id)
+    
+    async def event_stream():
+        try:
+            current = task
+            last_state = None
+            while True:
+                state = (current.status, current.progress)
+                if state != last_state:
+                    yield f"event: progress\ndata: {current.model_dump_json()}\n\n"
+                    last_state = state
+                if current.status in ("completed", "failed"):
+                    break
+                
+                # 其他worker处理的任务收不到推送，退化为按间隔读取任务存储
+                timeout = EVENTS_HEARTBEAT_INTERVAL if task_events.is_local(task_id) else STREAM_POLL_INTERVAL
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    latest = task_store.get(task_id)
+                    if latest is None:
+                        yield "event: deleted\ndata: {}\n\n"
+                        break
+                    if (latest.status, latest.progress) == last_state:
+                        yield ": keepalive\n\n"
+                    current = latest
+        finally:
+            task_events.unsubscribe(task_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/task/{task_id}/download")
 async def download_audio(task_id: str):
     """下载生成的音频文件"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
     if task.status != "completed":
-        raise HTTPException(status_code=400, detail="任务尚未完成")
+        raise HTTPException(status_code=400, detail=f"任务尚未完成，可通过 {task.stream_url} 边合成边播放")
     
     if not task.audio_url:
         raise HTTPException(status_code=404, detail="音频文件不存在")
@@ -251,14 +625,68 @@ async def download_audio(task_id: str):
         media_type="audio/mpeg"
     )
 
+@app.get("/task/{task_id}/stream")
+async def stream_audio(task_id: str):
+    """流式播放音频
+
+    合成进行中时，已写入磁盘的部分会立即返回，之后随合成进度持续推送新的分块；
+    中途加入的客户端先从磁盘回放已有内容再跟随。任务完成后等同于下载完整文件。
+    """
+    task = task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    if task.status == "failed":
+        raise HTTPException(status_code=400, detail=f"任务失败: {task.error_message}")
+    
+    return StreamingResponse(
+        follow_audio(task_id),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def follow_audio(task_id: str):
+    """从磁盘读取音频并跟随正在写入的部分，直到合成结束"""
+    file_path = os.path.join(OUTPUT_DIR, f"{task_id}.mp3")
+    f = None
+    try:
+        while True:
+            # 先确定是否已结束再读取，保证结束前写入的数据都能读到
+            live = live_audio.get(task_id)
+            if live is not None:
+                finished = live.done
+            else:
+                task = task_store.get(task_id)
+                finished = task is None or task.status in ("completed", "failed")
+            
+            if f is None and os.path.exists(file_path):
+                f = await aiofiles.open(file_path, "rb")
+            if f is not None:
+                while True:
+                    chunk = await f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            
+            if finished:
+                break
+            
+            if live is not None:
+                await live.wait(await f.tell() if f is not None else 0)
+            else:
+                # 任务仍在排队，或由其他worker进程合成
+                await asyncio.sleep(STREAM_POLL_INTERVAL)
+    finally:
+        if f is not None:
+            await f.close()
+
 @app.get("/task/{task_id}/vtt")
 async def download_vtt(task_id: str):
     """下载生成的VTT字幕文件"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
     if task.status != "completed":
         raise HTTPException(status_code=400, detail="任务尚未完成")
     
@@ -278,11 +706,10 @@ async def download_vtt(task_id: str):
 @app.get("/task/{task_id}/qc-report")
 async def get_qc_report(task_id: str):
     """获取QC质检报告"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
     if task.status != "completed":
         raise HTTPException(status_code=400, detail="任务尚未完成")
     
@@ -292,13 +719,29 @@ async def get_qc_report(task_id: str):
     return task.qc_report
 
 @app.post("/batch-tts")
-async def create_batch_tts(request: BatchTTSRequest, background_tasks: BackgroundTasks):
-    """创建批量TTS任务"""
+async def create_batch_tts(request: BatchTTSRequest):
+    """创建批量TTS任务
+
+    子任务由批量调度器按 BATCH_PARALLELISM 并发处理；超过单次合成长度的文本
+    会按句子分段合成后拼接。进度通过 GET /batch/{batch_id} 查询。
+    """
     try:
-        if len(request.texts) > 10:
-            raise HTTPException(status_code=400, detail="批量任务不能超过10个文本")
+        if not request.texts:
+            raise HTTPException(status_code=400, detail="批量任务不能为空")
+        
+        if len(request.texts) > BATCH_MAX_TEXTS:
+            raise HTTPException(status_code=400, detail=f"批量任务不能超过{BATCH_MAX_TEXTS}个文本")
+        
+        for text in request.texts:
+            if not text.strip():
+                raise HTTPException(status_code=400, detail="文本内容不能为空")
+            if len(text) > BATCH_MAX_TEXT_LENGTH:
+                raise HTTPException(status_code=400, detail=f"单个文本长度不能超过{BATCH_MAX_TEXT_LENGTH}字符")
         
-        task_ids = []
+        batch_id = str(uuid.uuid4())
+        created_at = datetime.now()
+        batch_tasks = []
+        jobs = []
         for text in request.texts:
             tts_request = TTSRequest(
                 text=text,
@@ -310,50 +753,133 @@ async def create_batch_tts(request: BatchTTSRequest, background_tasks: Backgroun
             )
             
             task_id = str(uuid.uuid4())
-            task = TaskStatus(
+            batch_tasks.append(TaskStatus(
                 task_id=task_id,
+                batch_id=batch_id,
                 status="pending",
                 progress=0,
                 text=text,
                 voice_id=request.voice_id,
-                created_at=datetime.now()
-            )
-            tasks[task_id] = task
-            task_ids.append(task_id)
-            
-            # 添加后台任务
-            background_tasks.add_task(process_tts_task, task_id, tts_request)
+                stream_url=f"/task/{task_id}/stream",
+                created_at=created_at
+            ))
+            jobs.append((task_id, tts_request))
+        
+        task_store.save_many(batch_tasks)
+        task_store.save_batch(BatchStatus(
+            batch_id=batch_id,
+            total=len(batch_tasks),
+            voice_id=request.voice_id,
+            request=request.model_dump(exclude={"texts"}),
+            created_at=created_at
+        ))
+        for task in batch_tasks:
+            task_events.mark_local(task.task_id)
+        batch_scheduler.submit(jobs)
         
         return {
-            "batch_id": str(uuid.uuid4()),
-            "task_ids": task_ids,
-            "total_tasks": len(task_ids),
-            "status": "created"
+            "batch_id": batch_id,
+            "task_ids": [task.task_id for task in batch_tasks],
+            "total_tasks": len(batch_tasks),
+            "status": "created",
+            "status_url": f"/batch/{batch_id}"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"创建批量TTS任务失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"创建批量任务失败: {str(e)}")
 
-@app.get("/tasks")
-async def list_tasks(limit: int = 50, offset: int = 0):
-    """获取任务列表"""
-    task_list = list(tasks.values())
-    task_list.sort(key=lambda x: x.created_at, reverse=True)
+@app.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """获取批量任务进度"""
+    batch = task_store.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    
+    counts = task_store.batch_counts(batch_id)
+    total = sum(counts.values())  # 不含已删除的子任务
+    finished = counts.get("completed", 0) + counts.get("failed", 0)
+    
+    if finished < total:
+        status = "processing" if finished or counts.get("processing") else "pending"
+    elif counts.get("failed"):
+        status = "completed_with_errors"
+    else:
+        status = "completed"
     
     return {
-        "tasks": task_list[offset:offset + limit],
-        "total": len(task_list),
+        "batch_id": batch_id,
+        "status": status,
+        "total": total,
+        "pending": counts.get("pending", 0),
+        "processing": counts.get("processing", 0),
+        "completed": counts.get("completed", 0),
+        "failed": counts.get("failed", 0),
+        "progress": round(finished * 100 / total) if total else 100,
+        "created_at": batch.created_at
+    }
+
+@app.get("/tasks")
+async def list_tasks(
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    voice_id: Optional[str] = None
+):
+    """获取任务列表
+
+    按创建时间倒序返回。翻页时传入上一页返回的 next_cursor（键集分页），
+    每页开销只与 limit 有关；不带 cursor 的请求额外返回 total。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    before = decode_cursor(cursor) if cursor else None
+    
+    page = task_store.page(
+        limit=limit,
+        before=before,
+        offset=offset,
+        status=status,
+        voice_id=voice_id
+    )
+    
+    result = {
+        "tasks": page,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": encode_cursor(page[-1]) if len(page) == limit else None
     }
+    if cursor is None:
+        result["total"] = task_store.count(status=status, voice_id=voice_id)
+    
+    return result
+
+def encode_cursor(task: TaskStatus) -> str:
+    """将任务的排序键编码为分页游标"""
+    raw = json.dumps([task.created_at.timestamp(), task.task_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """解析分页游标"""
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(created_at), str(task_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
 
 async def process_tts_task(task_id: str, request: TTSRequest):
     """处理TTS任务的后台函数"""
     try:
-        task = tasks[task_id]
+        task = task_store.get(task_id)
+        if task is None or task.status != "pending":
+            return  # 任务在排队期间已被删除，或已由其他worker接手
         task.status = "processing"
         task.progress = 10
+        if not task_store.update(task, expected_status="pending"):
+            return
+        task_events.publish(task)
         
         logger.info(f"开始处理TTS任务: {task_id}")
         
@@ -367,15 +893,37 @@ async def process_tts_task(task_id: str, request: TTSRequest):
         task.status = "completed"
         task.progress = 100
         task.completed_at = datetime.now()
+        if not save_task(task):
+            # 合成期间任务已被删除：不重新创建记录，并删除刚生成的文件
+            remove_task_files(task_id)
+            logger.info(f"TTS任务已在处理期间被删除: {task_id}")
+            return
         
         logger.info(f"TTS任务完成: {task_id}")
         
     except Exception as e:
         logger.error(f"处理TTS任务失败 {task_id}: {str(e)}")
-        task = tasks[task_id]
-        task.status = "failed"
-        task.error_message = str(e)
-        task.completed_at = datetime.now()
+        task = task_store.get(task_id)
+        if task is not None:
+            task.status = "failed"
+            task.error_message = str(e)
+            task.completed_at = datetime.now()
+        if task is None or not save_task(task):
+            remove_task_files(task_id)
+    finally:
+        task_events.unmark_local(task_id)
+
+def save_task(task: TaskStatus) -> bool:
+    """持久化任务并通知进度订阅者；任务已被删除时不写入，返回False"""
+    if not task_store.update(task):
+        return False
+    task_events.publish(task)
+    return True
+
+def update_progress(task: TaskStatus, progress: int):
+    """更新任务进度并持久化"""
+    task.progress = progress
+    save_task(task)
 
 async def process_with_elevenlabs(task: TaskStatus, request: TTSRequest):
     """使用ElevenLabs API处理TTS"""
@@ -385,36 +933,45 @@ async def process_with_elevenlabs(task: TaskStatus, request: TTSRequest):
         if request.voice_settings:
             voice_settings = VoiceSettings(**request.voice_settings)
         
-        # 生成音频
-        task.progress = 30
-        
-        audio = elevenlabs.generate(
-            text=request.text,
-            voice=Voice(
-                voice_id=request.voice_id,
-                settings=voice_settings
-            ),
-            model_id=request.model_id
-        )
-        
-        task.progress = 50
-        
-        # 保存音频文件
         output_path = os.path.join(OUTPUT_DIR, f"{task.task_id}.mp3")
-        with open(output_path, "wb") as f:
-            for chunk in audio:
-                f.write(chunk)
-        
-        # 获取文件信息
-        file_size = os.path.getsize(output_path)
+        vtt_path = os.path.join(OUTPUT_DIR, f"{task.task_id}.vtt")
         estimated_duration = len(request.text) * 0.1  # 估算时长
         
-        task.progress = 70
-        
-        # 生成VTT字幕文件
-        await generate_vtt_file(task.task_id, request.text, estimated_duration)
+        # 相同文本和参数已合成过时，直接复用缓存的MP3/VTT
+        cache_key = SynthesisCache.make_key(
+            request.text,
+            request.voice_id,
+            request.model_id,
+            request.voice_settings or DEFAULT_VOICE_SETTINGS,
+            request.output_format
+        )
+        if synthesis_cache.fetch(cache_key, output_path, vtt_path):
+            logger.info(f"命中合成缓存: {task.task_id}")
+            file_size = os.path.getsize(output_path)
+        else:
+            # 生成音频（在线程池中执行，避免阻塞事件循环）
+            update_progress(task, 30)
+            
+            # 合成过程中通过 live_audio 通知流式播放的客户端
+            live = LiveAudio(asyncio.get_running_loop())
+            live_audio[task.task_id] = live
+            try:
+                file_size = await synthesis_executor.run(
+                    synthesize_to_file, request, voice_settings, output_path, live.publish
+                )
+            finally:
+                live.finish()
+                live_audio.pop(task.task_id, None)
+            
+            update_progress(task, 50)
+            
+            # 生成VTT字幕文件
+            await generate_vtt_file(task.task_id, request.text, estimated_duration)
+            
+            synthesis_cache.store(cache_key, output_path, vtt_path)
+            update_progress(task, 70)
         
-        task.progress = 85
+        update_progress(task, 85)
         
         # 生成QC报告
         qc_report = await generate_qc_report(task.task_id, request.text, output_path, estimated_duration)
@@ -431,12 +988,44 @@ async def process_with_elevenlabs(task: TaskStatus, request: TTSRequest):
     except Exception as e:
         raise Exception(f"ElevenLabs处理失败: {str(e)}")
 
+def synthesize_to_file(
+    request: TTSRequest,
+    voice_settings: VoiceSettings,
+    output_path: str,
+    on_chunk: Optional[Callable[[int], None]] = None
+) -> int:
+    """调用ElevenLabs合成音频并写入文件（阻塞调用，须在线程池中运行），返回文件大小
+
+    每写入一个分块都会立即刷新到磁盘，并以已写入的总字节数调用 on_chunk。
+    """
+    written = 0
+    with open(output_path, "wb") as f:
+        # 超过单次合成长度的文本按句子分段合成，音频按顺序拼接到同一个文件
+        for segment in split_text_segments(request.text):
+            audio = elevenlabs.generate(
+                text=segment,
+                voice=Voice(
+                    voice_id=request.voice_id,
+                    settings=voice_settings
+                ),
+                model=request.model_id
+            )
+            
+            for chunk in audio:
+                f.write(chunk)
+                f.flush()
+                written += len(chunk)
+                if on_chunk:
+                    on_chunk(written)
+    
+    return written
+
 async def process_mock_tts(task: TaskStatus, request: TTSRequest):
     """模拟TTS处理"""
     try:
         # 模拟处理时间
         await asyncio.sleep(2)
-        task.progress = 50
+        update_progress(task, 50)
         
         # 创建模拟音频文件（实际项目中应该生成真实音频）
         output_path = os.path.join(OUTPUT_DIR, f"{task.task_id}.mp3")
@@ -447,12 +1036,12 @@ async def process_mock_tts(task: TaskStatus, request: TTSRequest):
         
         estimated_duration = len(request.text) * 0.1
         
-        task.progress = 70
+        update_progress(task, 70)
         
         # 生成VTT字幕文件
         await generate_vtt_file(task.task_id, request.text, estimated_duration)
         
-        task.progress = 85
+        update_progress(task, 85)
         
         # 生成QC报告
         qc_report = await generate_qc_report(task.task_id, request.text, output_path, estimated_duration)
@@ -469,35 +1058,78 @@ async def process_mock_tts(task: TaskStatus, request: TTSRequest):
     except Exception as e:
         raise Exception(f"模拟TTS处理失败: {str(e)}")
 
+def split_text_segments(text: str, max_chars: int = MAX_TEXT_LENGTH) -> List[str]:
+    """把长文本按句子边界切分为不超过 max_chars 字符的段落，短文本原样返回"""
+    if len(text) <= max_chars:
+        return [text]
+    
+    sentences = re.split(r"(?<=[。！？!?；;\n])|(?<=[.]\s)", text)
+    
+    segments = []
+    current = ""
+    for sentence in sentences:
+        # 单个句子超长时只能硬切
+        while len(sentence) > max_chars:
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        
+        if len(current) + len(sentence) > max_chars:
+            segments.append(current)
+            current = ""
+        current += sentence
+    
+    if current:
+        segments.append(current)
+    
+    return [segment for segment in segments if segment.strip()]
+
+def build_vtt_cues(text: str, duration: float, offset: float = 0.0) -> str:
+    """生成一段文本的VTT字幕块，时间轴整体后移 offset 秒"""
+    # 简单的VTT字幕生成（实际应该根据音频进行精确时间轴分割）
+    words = text.split()
+    words_per_second = len(words) / duration if duration > 0 else 1
+    
+    cues = ""
+    
+    current_time = 0.0
+    words_per_chunk = max(1, int(words_per_second * 3))  # 每3秒一个字幕块
+    
+    for i in range(0, len(words), words_per_chunk):
+        chunk_words = words[i:i + words_per_chunk]
+        chunk_text = " ".join(chunk_words)
+        
+        start_time = current_time
+        end_time = min(current_time + 3.0, duration)
+        
+        # 格式化时间
+        start_formatted = format_vtt_time(offset + start_time)
+        end_formatted = format_vtt_time(offset + end_time)
+        
+        cues += f"{start_formatted} --> {end_formatted}\n"
+        cues += f"{chunk_text}\n\n"
+        
+        current_time = end_time
+    
+    return cues
+
 async def generate_vtt_file(task_id: str, text: str, duration: float):
-    """生成VTT字幕文件"""
+    """生成VTT字幕文件
+
+    长文本与合成时一样按句子分段，每段的字幕时间轴依次后移前面各段的时长。
+    """
     try:
         vtt_path = os.path.join(OUTPUT_DIR, f"{task_id}.vtt")
         
-        # 简单的VTT字幕生成（实际应该根据音频进行精确时间轴分割）
-        words = text.split()
-        words_per_second = len(words) / duration if duration > 0 else 1
-        
         vtt_content = "WEBVTT\n\n"
         
-        current_time = 0.0
-        words_per_chunk = max(1, int(words_per_second * 3))  # 每3秒一个字幕块
-        
-        for i in range(0, len(words), words_per_chunk):
-            chunk_words = words[i:i + words_per_chunk]
-            chunk_text = " ".join(chunk_words)
-            
-            start_time = current_time
-            end_time = min(current_time + 3.0, duration)
-            
-            # 格式化时间
-            start_formatted = format_vtt_time(start_time)
-            end_formatted = format_vtt_time(end_time)
-            
-            vtt_content += f"{start_formatted} --> {end_formatted}\n"
-            vtt_content += f"{chunk_text}\n\n"
-            
-            current_time = end_time
+        offset = 0.0
+        for segment in split_text_segments(text):
+            segment_duration = duration * len(segment) / len(text) if text else 0.0
+            vtt_content += build_vtt_cues(segment, segment_duration, offset)
+            offset += segment_duration
         
         # 保存VTT文件
         async with aiofiles.open(vtt_path, 'w', encoding='utf-8') as f:
@@ -599,28 +1231,23 @@ async def generate_qc_report(task_id: str, text: str, audio_path: str, duration:
 @app.delete("/task/{task_id}")
 async def delete_task(task_id: str):
     """删除任务和相关文件"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
-    # 删除音频文件
-    if task.audio_url:
-        audio_path = os.path.join(OUTPUT_DIR, f"{task_id}.mp3")
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-    
-    # 删除VTT字幕文件
-    if task.vtt_url:
-        vtt_path = os.path.join(OUTPUT_DIR, f"{task_id}.vtt")
-        if os.path.exists(vtt_path):
-            os.remove(vtt_path)
-    
-    # 删除任务记录
-    del tasks[task_id]
+    # 先删除任务记录，正在处理的任务完成时发现记录不存在，会自行删除之后生成的文件
+    task_store.delete(task_id)
+    remove_task_files(task_id)
     
     return {"message": "任务已删除，包括音频文件和VTT字幕文件"}
 
+def remove_task_files(task_id: str):
+    """删除任务的音频文件和VTT字幕文件"""
+    for extension in ("mp3", "vtt"):
+        path = os.path.join(OUTPUT_DIR, f"{task_id}.{extension}")
+        if os.path.exists(path):
+            os.remove(path)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,156 @@
+"""
+Agent B 合成结果缓存
+相同的文本、语音和参数只向ElevenLabs合成一次，之后的请求直接复用已有的MP3/VTT文件
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class SynthesisCache:
+    """内容寻址的合成结果缓存
+
+    以 (text, voice_id, model_id, voice_settings, output_format) 的哈希为键，
+    在 cache_dir 中保存 <key>.mp3 和 <key>.vtt。命中时把缓存文件硬链接到任务的
+    输出路径（不支持硬链接时复制）。最近使用时间记录在文件mtime中，
+    条目数或总字节数超过上限时按LRU顺序淘汰。
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 1000, max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> 占用字节数，按最近使用排序
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: Optional[dict], output_format: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps(
+            [text, voice_id, model_id, voice_settings or {}, output_format],
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+
+    def _load(self):
+        """启动时扫描缓存目录，按mtime恢复LRU顺序"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext != ".mp3":
+                continue
+            path = os.path.join(self.cache_dir, name)
+            vtt_path = self._path(key, "vtt")
+            if not os.path.exists(vtt_path):
+                os.remove(path)
+                continue
+            size = os.path.getsize(path) + os.path.getsize(vtt_path)
+            found.append((os.path.getmtime(path), key, size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def fetch(self, key: str, audio_path: str, vtt_path: str) -> bool:
+        """缓存命中时把MP3/VTT链接到目标路径，返回是否命中"""
+        if not self.enabled:
+            return False
+
+        try:
+            _link(self._path(key, "mp3"), audio_path)
+            _link(self._path(key, "vtt"), vtt_path)
+            os.utime(self._path(key, "mp3"))
+        except FileNotFoundError:
+            # 未缓存，或已被其他进程淘汰；清理可能已链接的一半，避免之后写入时改动缓存文件
+            for path in (audio_path, vtt_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            with self._lock:
+                self.misses += 1
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)
+            return False
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # 由其他worker进程写入的条目
+                self._entries[key] = os.path.getsize(audio_path) + os.path.getsize(vtt_path)
+                self._total_bytes += self._entries[key]
+        return True
+
+    def store(self, key: str, audio_path: str, vtt_path: str):
+        """把新合成的MP3/VTT加入缓存"""
+        if not self.enabled:
+            return
+
+        _link(audio_path, self._path(key, "mp3"))
+        _link(vtt_path, self._path(key, "vtt"))
+        size = os.path.getsize(audio_path) + os.path.getsize(vtt_path)
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            for ext in ("mp3", "vtt"):
+                try:
+                    os.remove(self._path(key, ext))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        """缓存命中率等指标"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+
+def _link(src: str, dst: str):
+    """原子地把 src 链接到 dst，不支持硬链接的文件系统退化为复制"""
+    tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, tmp)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
@@ -0,0 +1,375 @@
+"""
+Agent B 任务存储
+提供可插拔的任务存储接口，默认使用SQLite（WAL模式），
+多个worker进程共享同一份任务数据，服务重启后任务不会丢失
+"""
+
+import bisect
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# 键集分页游标：(created_at时间戳, task_id)，按此二元组倒序排列
+PageKey = Tuple[float, str]
+
+
+class TaskStore(ABC):
+    """任务存储接口；后端须实现全部抽象方法，否则实例化时即报错"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[BaseModel]:
+        """按ID获取任务，不存在时返回None"""
+
+    @abstractmethod
+    def save(self, task: BaseModel) -> None:
+        """新建或更新任务"""
+
+    def save_many(self, tasks: List[BaseModel]) -> None:
+        """批量写入任务（批量任务创建时使用）"""
+        for task in tasks:
+            self.save(task)
+
+    @abstractmethod
+    def update(self, task: BaseModel, expected_status: Optional[str] = None) -> bool:
+        """只更新已存在的任务，返回是否写入；处理期间被删除的任务不会被重新插入
+
+        指定 expected_status 时，只有存储中的任务仍处于该状态才写入，
+        多个worker争抢同一个任务时只有一个能成功。
+        """
+
+    @abstractmethod
+    def delete(self, task_id: str) -> bool:
+        """删除任务，返回是否存在"""
+
+    @abstractmethod
+    def page(self, limit: int = 50, before: Optional[PageKey] = None, offset: int = 0,
+             status: Optional[str] = None, voice_id: Optional[str] = None) -> List[BaseModel]:
+        """按创建时间倒序分页列出任务
+
+        before 为上一页最后一个任务的 (created_at, task_id)，只返回排在它之后的任务，
+        开销只与 limit 有关，与历史任务总数无关。
+        """
+
+    @abstractmethod
+    def count(self, status: Optional[str] = None, voice_id: Optional[str] = None) -> int:
+        """任务总数"""
+
+    @abstractmethod
+    def save_batch(self, batch: BaseModel) -> None:
+        """保存批量任务记录"""
+
+    @abstractmethod
+    def get_batch(self, batch_id: str) -> Optional[BaseModel]:
+        """按ID获取批量任务记录"""
+
+    @abstractmethod
+    def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        """统计批量任务中各状态的任务数"""
+
+
+def page_key(task: BaseModel) -> PageKey:
+    """任务在时间索引中的排序键"""
+    return (task.created_at.timestamp(), task.task_id)
+
+
+class TimeIndex:
+    """按 (created_at, task_id) 有序的任务索引，支持从任意位置向前翻页"""
+
+    def __init__(self):
+        self._keys: List[PageKey] = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: PageKey):
+        bisect.insort(self._keys, key)
+
+    def remove(self, key: PageKey):
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def iter_before(self, before: Optional[PageKey] = None):
+        """从新到旧遍历早于 before 的键"""
+        i = len(self._keys) if before is None else bisect.bisect_left(self._keys, before)
+        while i > 0:
+            i -= 1
+            yield self._keys[i]
+
+
+class MemoryTaskStore(TaskStore):
+    """进程内存存储（仅适合单进程开发调试）"""
+
+    def __init__(self):
+        self._tasks: Dict[str, BaseModel] = {}
+        self._batches: Dict[str, BaseModel] = {}
+        self._batch_tasks: Dict[str, set] = {}
+        self._time_index = TimeIndex()
+        self._status_index: Dict[str, TimeIndex] = {}
+        self._voice_index: Dict[str, TimeIndex] = {}
+        # 任务当前在索引中的位置；任务对象可能被原地修改，不能依赖旧对象的字段
+        self._indexed: Dict[str, Tuple[PageKey, str, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, task_id: str) -> Optional[BaseModel]:
+        return self._tasks.get(task_id)
+
+    def save(self, task: BaseModel) -> None:
+        with self._lock:
+            self._save(task)
+
+    def update(self, task: BaseModel, expected_status: Optional[str] = None) -> bool:
+        with self._lock:
+            # 任务对象可能已被原地修改，存储中的状态以索引记录的为准
+            indexed = self._indexed.get(task.task_id)
+            if indexed is None or (expected_status is not None and indexed[1] != expected_status):
+                return False
+            self._save(task)
+            return True
+
+    def _save(self, task: BaseModel):
+        self._tasks[task.task_id] = task
+        key = page_key(task)
+        entry = (key, task.status, task.voice_id)
+        old = self._indexed.get(task.task_id)
+        if old == entry:
+            return  # 只更新了进度等字段，索引不变
+        if old is None and getattr(task, "batch_id", None):
+            self._batch_tasks.setdefault(task.batch_id, set()).add(task.task_id)
+        if old is not None:
+            self._unindex(task.task_id)
+        self._indexed[task.task_id] = entry
+        self._time_index.add(key)
+        self._status_index.setdefault(task.status, TimeIndex()).add(key)
+        self._voice_index.setdefault(task.voice_id, TimeIndex()).add(key)
+
+    def delete(self, task_id: str) -> bool:
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task is None:
+                return False
+            self._unindex(task_id)
+            if getattr(task, "batch_id", None):
+                self._batch_tasks.get(task.batch_id, set()).discard(task_id)
+            return True
+
+    def _unindex(self, task_id: str):
+        key, status, voice_id = self._indexed.pop(task_id)
+        self._time_index.remove(key)
+        self._status_index[status].remove(key)
+        self._voice_index[voice_id].remove(key)
+
+    def page(self, limit: int = 50, before: Optional[PageKey] = None, offset: int = 0,
+             status: Optional[str] = None, voice_id: Optional[str] = None) -> List[BaseModel]:
+        with self._lock:
+            # 优先使用状态或语音索引，另一个条件在遍历时过滤
+            if status is not None:
+                index = self._status_index.get(status, TimeIndex())
+            elif voice_id is not None:
+                index = self._voice_index.get(voice_id, TimeIndex())
+            else:
+                index = self._time_index
+
+            result = []
+            for _, task_id in index.iter_before(before):
+                task = self._tasks[task_id]
+                if voice_id is not None and task.voice_id != voice_id:
+                    continue
+                if offset > 0:
+                    offset -= 1
+                    continue
+                result.append(task)
+                if len(result) >= limit:
+                    break
+            return result
+
+    def count(self, status: Optional[str] = None, voice_id: Optional[str] = None) -> int:
+        with self._lock:
+            if status is None and voice_id is None:
+                return len(self._time_index)
+            if voice_id is None:
+                return len(self._status_index.get(status, ()))
+            if status is None:
+                return len(self._voice_index.get(voice_id, ()))
+            return sum(1 for _, task_id in self._status_index.get(status, TimeIndex()).iter_before()
+                       if self._tasks[task_id].voice_id == voice_id)
+
+    def save_batch(self, batch: BaseModel) -> None:
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+
+    def get_batch(self, batch_id: str) -> Optional[BaseModel]:
+        return self._batches.get(batch_id)
+
+    def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for task_id in self._batch_tasks.get(batch_id, ()):
+                status = self._tasks[task_id].status
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite任务存储
+
+    使用WAL模式，读写互不阻塞，多个进程可以同时访问同一个数据库文件。
+    每个线程使用独立连接；任务以JSON形式保存，status/voice_id/created_at
+    单独成列，并按 (created_at, task_id) 建立有序索引用于键集分页。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            voice_id TEXT,
+            batch_id TEXT,
+            created_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at, task_id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, created_at, task_id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_voice ON tasks (voice_id, created_at, task_id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_batch ON tasks (batch_id, status);
+        CREATE TABLE IF NOT EXISTS batches (
+            batch_id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, model: Type[BaseModel], batch_model: Optional[Type[BaseModel]] = None):
+        self.path = path
+        self.model = model
+        self.batch_model = batch_model
+        self._local = threading.local()
+
+        conn = self._connection()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+        if columns and "batch_id" not in columns:
+            # 兼容没有batch_id列的旧数据库
+            conn.execute("ALTER TABLE tasks ADD COLUMN batch_id TEXT")
+        conn.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, task_id: str) -> Optional[BaseModel]:
+        row = self._connection().execute(
+            "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return self.model.model_validate_json(row[0]) if row else None
+
+    UPSERT = """
+        INSERT INTO tasks (task_id, status, voice_id, batch_id, created_at, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(task_id) DO UPDATE SET
+            status = excluded.status,
+            voice_id = excluded.voice_id,
+            data = excluded.data
+    """
+
+    @staticmethod
+    def _row(task: BaseModel) -> tuple:
+        return (task.task_id, task.status, task.voice_id, getattr(task, "batch_id", None),
+                task.created_at.timestamp(), task.model_dump_json())
+
+    def save(self, task: BaseModel) -> None:
+        self._connection().execute(self.UPSERT, self._row(task))
+
+    def save_many(self, tasks: List[BaseModel]) -> None:
+        # 单个事务写入，避免每个任务单独提交
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(self.UPSERT, [self._row(task) for task in tasks])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    UPDATE = "UPDATE tasks SET status = ?, voice_id = ?, data = ? WHERE task_id = ?"
+
+    def update(self, task: BaseModel, expected_status: Optional[str] = None) -> bool:
+        # 单条UPDATE语句，行已被删除时不影响任何行，不会像UPSERT那样重新插入
+        sql, params = self.UPDATE, [task.status, task.voice_id, task.model_dump_json(), task.task_id]
+        if expected_status is not None:
+            sql += " AND status = ?"
+            params.append(expected_status)
+        return self._connection().execute(sql, params).rowcount > 0
+
+    def delete(self, task_id: str) -> bool:
+        cursor = self._connection().execute(
+            "DELETE FROM tasks WHERE task_id = ?", (task_id,)
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _filters(status: Optional[str], voice_id: Optional[str]):
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if voice_id is not None:
+            conditions.append("voice_id = ?")
+            params.append(voice_id)
+        return conditions, params
+
+    def page(self, limit: int = 50, before: Optional[PageKey] = None, offset: int = 0,
+             status: Optional[str] = None, voice_id: Optional[str] = None) -> List[BaseModel]:
+        conditions, params = self._filters(status, voice_id)
+        if before is not None:
+            conditions.append("(created_at, task_id) < (?, ?)")
+            params.extend(before)
+
+        sql = "SELECT data FROM tasks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, task_id DESC LIMIT ? OFFSET ?"
+
+        rows = self._connection().execute(sql, (*params, limit, offset)).fetchall()
+        return [self.model.model_validate_json(row[0]) for row in rows]
+
+    def count(self, status: Optional[str] = None, voice_id: Optional[str] = None) -> int:
+        conditions, params = self._filters(status, voice_id)
+        sql = "SELECT COUNT(*) FROM tasks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self._connection().execute(sql, params).fetchone()[0]
+
+    def save_batch(self, batch: BaseModel) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO batches (batch_id, created_at, data) VALUES (?, ?, ?)",
+            (batch.batch_id, batch.created_at.timestamp(), batch.model_dump_json())
+        )
+
+    def get_batch(self, batch_id: str) -> Optional[BaseModel]:
+        row = self._connection().execute(
+            "SELECT data FROM batches WHERE batch_id = ?", (batch_id,)
+        ).fetchone()
+        return self.batch_model.model_validate_json(row[0]) if row else None
+
+    def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall()
+        return dict(rows)
+
+
+def create_task_store(backend: str, model: Type[BaseModel], path: str = "tasks.db",
+                      batch_model: Optional[Type[BaseModel]] = None) -> TaskStore:
+    """根据配置创建任务存储"""
+    if backend == "memory":
+        return MemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore(path, model, batch_model)
+    raise ValueError(f"不支持的任务存储类型: {backend}")
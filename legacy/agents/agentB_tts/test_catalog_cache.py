@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Agent B 目录缓存测试
+
+首次加载、到期前的后台提前刷新、刷新失败时继续使用旧值，
+以及刷新失败后在重试间隔内不再触发后台刷新。
+
+用法:
+    python -m pytest test_catalog_cache.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_cache import CatalogCache  # noqa: E402
+
+
+class Loader:
+    """记录调用次数的加载函数，fail 为真时抛出异常"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("ElevenLabs不可用")
+        return [{"voice_id": f"v{self.calls}"}]
+
+
+async def settle(cache: CatalogCache):
+    """等待正在进行的后台刷新结束"""
+    if cache._refresh_task is not None:
+        await asyncio.gather(cache._refresh_task, return_exceptions=True)
+
+
+def test_get_loads_once_and_sets_etag():
+    loader = Loader()
+    cache = CatalogCache("语音列表", loader, ttl=60)
+
+    async def run():
+        first = await cache.get()
+        second = await cache.get()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == [{"voice_id": "v1"}]
+    assert loader.calls == 1
+    assert cache.etag.startswith('"') and cache.stats()["refreshes"] == 1
+
+
+def test_refresh_ahead_in_background():
+    loader = Loader()
+    cache = CatalogCache("语音列表", loader, ttl=60, refresh_ahead=0.5)
+
+    async def run():
+        await cache.get()
+        cache.updated_at -= 40  # 超过 ttl * refresh_ahead，但未过期
+        stale = await cache.get()
+        await settle(cache)
+        return stale
+
+    # 立即返回当前值，刷新在后台完成
+    assert asyncio.run(run()) == [{"voice_id": "v1"}]
+    assert loader.calls == 2
+    assert cache.value == [{"voice_id": "v2"}]
+
+
+def test_failed_refresh_keeps_old_value():
+    loader = Loader()
+    cache = CatalogCache("语音列表", loader, ttl=60)
+
+    async def run():
+        await cache.get()
+        loader.fail = True
+        cache.updated_at -= 120
+        return await cache.get()
+
+    assert asyncio.run(run()) == [{"voice_id": "v1"}]
+    assert cache.stats()["failures"] == 1
+    assert cache.last_error == "ElevenLabs不可用"
+
+
+def test_get_without_value_raises():
+    loader = Loader()
+    loader.fail = True
+    cache = CatalogCache("语音列表", loader, ttl=60)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get())
+
+
+def test_peek_backs_off_after_failure():
+    """没有加载成功时，频繁的 peek 在重试间隔内只触发一次刷新"""
+    loader = Loader()
+    loader.fail = True
+    cache = CatalogCache("模型列表", loader, ttl=60, retry_interval=30)
+
+    async def run():
+        for _ in range(5):
+            assert cache.peek() is None
+            await settle(cache)
+
+        # 重试间隔过后再次在后台刷新，成功后清除失败记录
+        cache.failed_at -= 31
+        loader.fail = False
+        cache.peek()
+        await settle(cache)
+
+    asyncio.run(run())
+    assert loader.calls == 2
+    assert cache.value == [{"voice_id": "v2"}]
+    assert cache.failed_at is None and cache.last_error is None
+
+
+def test_refresh_ahead_backs_off_after_failure():
+    loader = Loader()
+    cache = CatalogCache("语音列表", loader, ttl=60, refresh_ahead=0.5, retry_interval=30)
+
+    async def run():
+        await cache.get()
+        loader.fail = True
+        cache.updated_at -= 40
+        for _ in range(5):
+            assert await cache.get() == [{"voice_id": "v1"}]
+            assert cache.peek() == [{"voice_id": "v1"}]
+            await settle(cache)
+
+    asyncio.run(run())
+    assert loader.calls == 2
+    assert cache.stats()["failures"] == 1
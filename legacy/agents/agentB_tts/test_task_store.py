@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Agent B 任务存储测试
+
+同一组约定分别在 memory 和 sqlite 两种后端上运行：增删改查、只更新已存在任务的
+update（含按原状态的条件更新）、按 (created_at, task_id) 倒序的键集分页与过滤计数，
+以及批量任务的状态统计。
+
+用法:
+    python -m pytest test_task_store.py
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from task_store import TaskStore, create_task_store, page_key  # noqa: E402
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+class Task(BaseModel):
+    task_id: str
+    batch_id: Optional[str] = None
+    status: str
+    progress: int = 0
+    text: str = ""
+    voice_id: str
+    created_at: datetime
+
+
+class Batch(BaseModel):
+    batch_id: str
+    total: int
+    created_at: datetime
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return create_task_store(request.param, Task, str(tmp_path / "tasks.db"), batch_model=Batch)
+
+
+def make_task(index: int, status: str = "pending", voice_id: str = "v1", batch_id: str = None) -> Task:
+    return Task(task_id=f"t{index:03d}", batch_id=batch_id, status=status, voice_id=voice_id,
+                created_at=START + timedelta(seconds=index))
+
+
+def ids(tasks) -> list:
+    return [task.task_id for task in tasks]
+
+
+def test_incomplete_backend_cannot_be_created():
+    class PartialStore(TaskStore):
+        def get(self, task_id):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_save_get_delete(store):
+    assert store.get("t001") is None
+
+    store.save(make_task(1))
+    assert store.get("t001").status == "pending"
+
+    assert store.delete("t001")
+    assert not store.delete("t001")
+    assert store.get("t001") is None
+    assert store.count() == 0
+
+
+def test_update_only_existing(store):
+    task = make_task(1)
+    assert not store.update(task)
+    assert store.get("t001") is None
+
+    store.save(task)
+    task = store.get("t001")
+    task.progress = 50
+    assert store.update(task)
+    assert store.get("t001").progress == 50
+
+    # 处理期间任务被删除，之后的进度写入不会重新创建它
+    store.delete("t001")
+    task.status = "completed"
+    assert not store.update(task)
+    assert store.get("t001") is None
+    assert store.count() == 0
+
+
+def test_update_expected_status(store):
+    store.save(make_task(1))
+
+    # 与 process_tts_task 一样先原地修改取回的对象，再按原状态条件写入
+    task = store.get("t001")
+    task.status = "processing"
+    assert store.update(task, expected_status="pending")
+    assert store.get("t001").status == "processing"
+
+    # 第二个worker的 pending → processing 不再成功
+    again = store.get("t001")
+    again.status = "processing"
+    assert not store.update(again, expected_status="pending")
+    assert store.count(status="processing") == 1
+    assert store.count(status="pending") == 0
+
+
+def test_page_newest_first(store):
+    store.save_many([make_task(i) for i in range(5)])
+
+    assert ids(store.page()) == ["t004", "t003", "t002", "t001", "t000"]
+    assert ids(store.page(limit=2, offset=1)) == ["t003", "t002"]
+    assert store.count() == 5
+
+
+def test_keyset_pages_cover_all_tasks(store):
+    store.save_many([make_task(i) for i in range(7)])
+
+    seen, before = [], None
+    while True:
+        page = store.page(limit=3, before=before)
+        seen += ids(page)
+        if len(page) < 3:
+            break
+        before = page_key(page[-1])
+
+    assert seen == [f"t{i:03d}" for i in reversed(range(7))]
+
+
+def test_same_created_at_ordered_by_task_id(store):
+    for task_id in ("a", "c", "b"):
+        store.save(Task(task_id=task_id, status="pending", voice_id="v1", created_at=START))
+
+    first = store.page(limit=2)
+    assert ids(first) == ["c", "b"]
+    assert ids(store.page(limit=2, before=page_key(first[-1]))) == ["a"]
+
+
+def test_page_and_count_filters(store):
+    statuses = ["pending", "completed", "failed", "completed", "completed", "pending"]
+    voices = ["v1", "v2", "v1", "v1", "v2", "v2"]
+    store.save_many([make_task(i, status, voice) for i, (status, voice) in enumerate(zip(statuses, voices))])
+
+    assert ids(store.page(status="completed")) == ["t004", "t003", "t001"]
+    assert ids(store.page(voice_id="v1")) == ["t003", "t002", "t000"]
+    assert ids(store.page(status="completed", voice_id="v2")) == ["t004", "t001"]
+    assert ids(store.page(status="completed", before=page_key(make_task(4)))) == ["t003", "t001"]
+    assert store.page(status="unknown") == []
+
+    assert store.count(status="completed") == 3
+    assert store.count(voice_id="v2") == 3
+    assert store.count(status="completed", voice_id="v1") == 1
+    assert store.count(status="unknown") == 0
+
+
+def test_filters_follow_status_changes(store):
+    store.save_many([make_task(i) for i in range(3)])
+
+    task = store.get("t001")
+    task.status = "completed"
+    store.update(task)
+
+    assert ids(store.page(status="pending")) == ["t002", "t000"]
+    assert ids(store.page(status="completed")) == ["t001"]
+    assert store.count(status="pending") == 2
+    assert store.count() == 3
+
+
+def test_batch_counts(store):
+    store.save_batch(Batch(batch_id="b1", total=4, created_at=START))
+    store.save_many([
+        make_task(0, "completed", batch_id="b1"),
+        make_task(1, "failed", batch_id="b1"),
+        make_task(2, "pending", batch_id="b1"),
+        make_task(3, "pending", batch_id="b1"),
+        make_task(4, "pending", batch_id="b2"),
+        make_task(5, "pending")
+    ])
+
+    assert store.get_batch("b1").total == 4
+    assert store.get_batch("missing") is None
+    assert store.batch_counts("b1") == {"completed": 1, "failed": 1, "pending": 2}
+
+    task = store.get("t002")
+    task.status = "processing"
+    store.update(task)
+    store.delete("t003")
+
+    # 已删除的子任务不计入
+    assert store.batch_counts("b1") == {"completed": 1, "failed": 1, "processing": 1}
+    assert store.batch_counts("missing") == {}
+
+
+def test_sqlite_shared_between_instances(tmp_path):
+    """同一个数据库文件的两个存储实例（相当于两个worker）看到彼此的写入"""
+    path = str(tmp_path / "tasks.db")
+    first = create_task_store("sqlite", Task, path)
+    second = create_task_store("sqlite", Task, path)
+
+    first.save(make_task(1))
+    task = second.get("t001")
+    task.status = "processing"
+    assert second.update(task, expected_status="pending")
+
+    assert first.get("t001").status == "processing"
+    assert not first.update(make_task(1, "processing"), expected_status="pending")
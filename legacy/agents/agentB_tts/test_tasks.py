@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Agent B 任务处理测试
+
+在临时目录中加载一份独立的服务（内存任务存储、未配置ElevenLabs时的模拟合成），
+通过 httpx.ASGITransport 在进程内调用接口，不需要启动真实服务：
+长文本按句子分段、/tasks 的键集分页与无效游标、处理期间被删除的任务，
+以及重启后未完成任务的恢复。
+
+用法:
+    python -m pytest test_tasks.py
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+AGENT_B_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AGENT_B_DIR)
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def agent_b(monkeypatch, tmp_path):
+    """在本测试的临时目录中加载 main.py（模块名与 Orchestrator 的 main 区分）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TASK_STORE_BACKEND", "memory")
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "")
+    spec = importlib.util.spec_from_file_location("agent_b_main", os.path.join(AGENT_B_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def add_task(agent_b, index: int, status: str = "pending", voice_id: str = "v1", batch_id: str = None):
+    task = agent_b.TaskStatus(
+        task_id=f"t{index:03d}",
+        batch_id=batch_id,
+        status=status,
+        progress=0,
+        text=f"文本{index}",
+        voice_id=voice_id,
+        created_at=START + timedelta(seconds=index)
+    )
+    agent_b.task_store.save(task)
+    return task
+
+
+def list_tasks(agent_b, **params) -> httpx.Response:
+    async def get():
+        transport = httpx.ASGITransport(app=agent_b.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent-b") as client:
+            return await client.get("/tasks", params=params)
+    return asyncio.run(get())
+
+
+def test_short_text_is_one_segment(agent_b):
+    text = "短文本。" * 10
+    assert agent_b.split_text_segments(text) == [text]
+    assert agent_b.split_text_segments("x" * agent_b.MAX_TEXT_LENGTH) == ["x" * agent_b.MAX_TEXT_LENGTH]
+
+
+def test_long_text_split_at_sentences(agent_b):
+    sentence = "这是一个用于测试分段的句子。"
+    text = sentence * (agent_b.MAX_TEXT_LENGTH // len(sentence) * 2 + 5)
+    assert len(text) > 2 * agent_b.MAX_TEXT_LENGTH
+
+    segments = agent_b.split_text_segments(text)
+    assert len(segments) == 3
+    assert all(len(segment) <= agent_b.MAX_TEXT_LENGTH for segment in segments)
+    # 每段都在句子边界结束，拼接后与原文一致
+    assert all(segment.endswith("。") for segment in segments)
+    assert "".join(segments) == text
+
+
+def test_overlong_sentence_is_cut(agent_b):
+    text = "开头。" + "长" * 12000 + "。结尾。"
+    segments = agent_b.split_text_segments(text, max_chars=5000)
+
+    assert [len(segment) for segment in segments] == [3, 5000, 5000, 2004]
+    assert "".join(segments) == text
+
+
+def test_list_tasks_keyset_pages(agent_b):
+    for i in range(5):
+        add_task(agent_b, i, status="completed" if i % 2 else "pending")
+
+    first = list_tasks(agent_b, limit=2).json()
+    assert [task["task_id"] for task in first["tasks"]] == ["t004", "t003"]
+    assert first["total"] == 5
+
+    second = list_tasks(agent_b, limit=2, cursor=first["next_cursor"]).json()
+    assert [task["task_id"] for task in second["tasks"]] == ["t002", "t001"]
+    # 带游标的请求不再统计总数
+    assert "total" not in second
+
+    last = list_tasks(agent_b, limit=2, cursor=second["next_cursor"]).json()
+    assert [task["task_id"] for task in last["tasks"]] == ["t000"]
+    assert last["next_cursor"] is None
+
+
+def test_list_tasks_filters(agent_b):
+    for i in range(6):
+        add_task(agent_b, i, status="completed" if i % 2 else "pending", voice_id="v1" if i < 3 else "v2")
+
+    page = list_tasks(agent_b, status="completed", limit=1).json()
+    assert [task["task_id"] for task in page["tasks"]] == ["t005"]
+    assert page["total"] == 3
+
+    page = list_tasks(agent_b, status="completed", limit=1, cursor=page["next_cursor"]).json()
+    assert [task["task_id"] for task in page["tasks"]] == ["t003"]
+
+    page = list_tasks(agent_b, status="pending", voice_id="v1").json()
+    assert [task["task_id"] for task in page["tasks"]] == ["t002", "t000"]
+    assert page["total"] == 2
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "bm90IGpzb24", "WzFd"])
+def test_list_tasks_rejects_bad_cursor(agent_b, cursor):
+    response = list_tasks(agent_b, cursor=cursor)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "无效的分页游标"
+
+
+def test_task_deleted_while_processing(agent_b, monkeypatch):
+    """合成期间任务被删除：结束时不重新写入任务，并删除刚生成的文件"""
+    add_task(agent_b, 1)
+    audio_path = os.path.join(agent_b.OUTPUT_DIR, "t001.mp3")
+
+    async def synthesize(task, request):
+        with open(audio_path, "w") as f:
+            f.write("audio")
+        agent_b.task_store.delete(task.task_id)
+
+    monkeypatch.setattr(agent_b, "process_mock_tts", synthesize)
+    asyncio.run(agent_b.process_tts_task("t001", agent_b.TTSRequest(text="文本1")))
+
+    assert agent_b.task_store.get("t001") is None
+    assert agent_b.task_store.count() == 0
+    assert not os.path.exists(audio_path)
+
+
+def test_resume_interrupted_tasks(agent_b, monkeypatch):
+    """重启后批量子任务按保存的合成参数重新排队，单个 /tts 任务标记为失败"""
+    batch_request = agent_b.BatchTTSRequest(texts=["文本"], voice_id="v1", model_id="model-x")
+    agent_b.task_store.save_batch(agent_b.BatchStatus(
+        batch_id="b1", total=2, voice_id="v1",
+        request=batch_request.model_dump(exclude={"texts"}), created_at=START
+    ))
+    add_task(agent_b, 0, status="processing", batch_id="b1")
+    add_task(agent_b, 1, status="pending", batch_id="b1")
+    add_task(agent_b, 2, status="pending")
+    add_task(agent_b, 3, status="completed", batch_id="b1")
+
+    submitted = []
+    monkeypatch.setattr(agent_b.batch_scheduler, "submit", submitted.extend)
+    asyncio.run(agent_b.resume_interrupted_tasks())
+
+    assert [task_id for task_id, _ in submitted] == ["t000", "t001"]
+    assert all(request.model_id == "model-x" and request.voice_id == "v1" for _, request in submitted)
+    assert [request.text for _, request in submitted] == ["文本0", "文本1"]
+    assert agent_b.task_store.get("t000").status == "pending"
+    assert agent_b.task_store.get("t002").status == "failed"
+    assert agent_b.task_store.get("t003").status == "completed"
+    assert agent_b.task_store.batch_counts("b1") == {"pending": 2, "completed": 1}
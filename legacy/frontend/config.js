@@ -40,6 +40,7 @@ const API_CONFIG = {
         
         // 项目管理
         PROJECT_STATUS: (sessionId) => `/projects/${sessionId}/status`,
+        PROJECT_EVENTS: (sessionId) => `/projects/${sessionId}/events`,
         PROJECT_RESULTS: (sessionId) => `/projects/${sessionId}/results`,
         PROJECT_DOWNLOAD: (sessionId) => `/projects/${sessionId}/download`,
         
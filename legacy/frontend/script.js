@@ -261,9 +261,29 @@ class WorkflowPlatform {
     }
     
     /**
-     * 开始轮询项目状态
+     * 订阅项目状态（SSE），服务端在时间轴变化时推送，不支持时退化为轮询
      */
     startStatusPolling() {
+        if (window.EventSource) {
+            this.statusEventSource = new EventSource(`${this.config.BASE_URL}/projects/${this.sessionId}/events`);
+            
+            this.statusEventSource.addEventListener('timeline', async (event) => {
+                const statusData = JSON.parse(event.data);
+                this.updateTimelineFromAPI(statusData);
+                
+                // 项目完成后服务端会关闭连接，这里主动关闭避免自动重连
+                if (this.isProjectCompleted(statusData)) {
+                    this.statusEventSource.close();
+                    await this.handleProjectCompletion();
+                }
+            });
+            
+            this.statusEventSource.onerror = (error) => {
+                console.error('项目状态订阅中断:', error);
+            };
+            return;
+        }
+        
         this.statusPollingInterval = setInterval(async () => {
             try {
                 const statusData = await this.getProjectStatus();
@@ -271,7 +291,7 @@ class WorkflowPlatform {
                     this.updateTimelineFromAPI(statusData);
                     
                     // 如果项目完成，停止轮询
-                    if (statusData.current_phase === 'completed') {
+                    if (this.isProjectCompleted(statusData)) {
                         clearInterval(this.statusPollingInterval);
                         await this.handleProjectCompletion();
                     }
@@ -282,13 +302,21 @@ class WorkflowPlatform {
         }, 5000); // 每5秒轮询一次
     }
     
+    /**
+     * 项目是否已完成
+     */
+    isProjectCompleted(statusData) {
+        return statusData.current_phase === 'completed' || statusData.status === 'completed';
+    }
+    
     /**
      * 从API更新时间轴
      */
     updateTimelineFromAPI(statusData) {
         const timelineItems = document.querySelectorAll('.timeline-item');
+        const milestones = statusData.milestones || statusData.timeline || [];
         
-        statusData.milestones.forEach((milestone, index) => {
+        milestones.forEach((milestone, index) => {
             if (timelineItems[index]) {
                 const item = timelineItems[index];
                 const marker = item.querySelector('.timeline-marker');
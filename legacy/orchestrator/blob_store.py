@@ -0,0 +1,97 @@
+"""
+Orchestrator 上传文件的内容寻址存储
+相同内容的文件只保存一份，按sha256前缀分目录存放：<root>/ab/cd/<sha256>.<代号>
+"""
+
+import os
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+from storage import BLOBS, RecordKey, StateStore
+
+
+class BlobMissing(Exception):
+    """引用的blob已不存在（引用计数归零后被删除）"""
+
+
+class BlobStore:
+    """内容寻址的去重文件存储
+
+    每个blob在状态存储中有一条 BLOBS 记录（文件路径、大小、引用计数）。会话和项目
+    引用或释放blob时，在同一个 update_many 事务里用 add_ref / drop_ref 修改引用计数，
+    计数与引用它的记录始终一致：计数归零的事务同时删除blob记录，提交后由 discard
+    删除文件，不需要扫描磁盘。
+
+    新建blob时先由 stage 把写完的临时文件移到一个带新代号的路径（按需创建目录），再在事务中登记；
+    若事务发现blob已存在（重复内容），提交后丢弃这份文件。刚归零正在删除的旧文件
+    与重新上传的同一内容路径不同，不会误删。
+    """
+
+    def __init__(self, root: str, state_store: StateStore):
+        self.root = root
+        self.state_store = state_store
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+        self.collected = 0
+
+    @staticmethod
+    def key(digest: str) -> RecordKey:
+        return (BLOBS, digest)
+
+    def exists(self, digest: str) -> bool:
+        return self.state_store.exists(BLOBS, digest)
+
+    def stage(self, tmp_path: str, digest: str) -> str:
+        """把已写完的临时文件移到新的blob路径，返回该路径（尚未登记）"""
+        blob_path = os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{uuid.uuid4().hex[:12]}")
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+        return blob_path
+
+    def add_ref(self, records: Dict[RecordKey, Optional[dict]], digest: str,
+                staged_path: Optional[str] = None, size: int = 0) -> Tuple[str, bool]:
+        """在 update_many 的 mutate 中增加一个引用，返回 (blob路径, 是否为已有内容)
+
+        blob不存在时用 staged_path 新建；没有 staged_path 时抛出 BlobMissing。
+        """
+        record = records.get(self.key(digest))
+        if record is not None:
+            record["refs"] += 1
+            return record["path"], True
+        if staged_path is None:
+            raise BlobMissing(digest)
+        records[self.key(digest)] = {"sha256": digest, "path": staged_path, "size": size, "refs": 1}
+        return staged_path, False
+
+    def drop_ref(self, records: Dict[RecordKey, Optional[dict]], digest: str) -> Optional[str]:
+        """在 update_many 的 mutate 中释放一个引用；计数归零时删除记录并返回要删除的文件路径"""
+        record = records.get(self.key(digest))
+        if record is None:
+            return None
+        record["refs"] -= 1
+        if record["refs"] > 0:
+            return None
+        records[self.key(digest)] = None
+        return record["path"]
+
+    def record_deduplicated(self):
+        with self._lock:
+            self.deduplicated += 1
+
+    def discard(self, path: str, collected: bool = True):
+        """事务提交后删除不再登记的文件：归零的blob，或重复上传暂存的副本"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        if collected:
+            with self._lock:
+                self.collected += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "deduplicated_uploads": self.deduplicated,
+                "collected_blobs": self.collected
+            }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Orchestrator 上传接口负载测试
+
+以子进程方式启动 Orchestrator，并发上传不同大小的文件，期间持续采样服务进程的
+RSS（读取 /proc，仅支持Linux），验证每个上传占用的内存与文件大小无关；
+最后上传一个超过 MAX_UPLOAD_SIZE 的文件（分别带Content-Length和分块传输），确认返回413。
+
+用法:
+    python load_test_upload.py --sizes 8,64,256 --uploads 8 --concurrency 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MB = 1024 * 1024
+
+
+class MultipartBody:
+    """按块生成的multipart请求体，客户端也不需要把整个文件放进内存"""
+
+    boundary = "loadtestboundary7f3a"
+    chunk_size = MB
+
+    def __init__(self, size: int, filename: str = "upload.png"):
+        self.size = size
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: image/png\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        chunk = os.urandom(self.chunk_size)
+        remaining = self.size
+        while remaining > 0:
+            yield chunk[:min(remaining, self.chunk_size)]
+            remaining -= self.chunk_size
+        yield self.tail
+
+
+def read_rss(pid: int) -> int:
+    """读取进程的常驻内存（字节）"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class RSSSampler:
+    """后台线程中定期采样RSS，记录峰值"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, read_rss(self.pid))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = read_rss(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_orchestrator(port: int, max_upload_size: int, upload_dir: str) -> subprocess.Popen:
+    """以子进程方式启动 Orchestrator"""
+    env = dict(os.environ)
+    env["MAX_UPLOAD_SIZE"] = str(max_upload_size)
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=upload_dir,
+        env=env
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(50):
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return proc
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError("Orchestrator 启动失败")
+
+
+def upload(base_url: str, session_id: str, size: int, chunked: bool = False) -> int:
+    """上传 size 字节的文件；chunked 时不发送Content-Length，按分块传输编码发送"""
+    body = MultipartBody(size)
+    response = requests.post(
+        f"{base_url}/api/v1/upload",
+        params={"session_id": session_id},
+        data=iter(body) if chunked else body,
+        headers={"Content-Type": body.content_type}
+    )
+    return response.status_code
+
+
+def run_load_test(base_url: str, pid: int, size: int, uploads: int, concurrency: int) -> dict:
+    """并发上传 uploads 个 size 字节的文件，返回耗时和RSS峰值"""
+    session_id = requests.post(f"{base_url}/api/v1/sessions", json={}).json()["session_id"]
+    baseline = read_rss(pid)
+
+    started = time.perf_counter()
+    with RSSSampler(pid) as sampler:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            statuses = list(pool.map(lambda _: upload(base_url, session_id, size), range(uploads)))
+    wall_time = time.perf_counter() - started
+
+    return {
+        "size": size,
+        "failed": sum(1 for status in statuses if status != 200),
+        "wall_time": wall_time,
+        "throughput": size * uploads / wall_time / MB,
+        "baseline_rss": baseline,
+        "peak_rss": sampler.peak
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Orchestrator 上传内存负载测试")
+    parser.add_argument("--sizes", default="8,64,256", help="上传文件大小列表（MB，逗号分隔）")
+    parser.add_argument("--uploads", type=int, default=8, help="每种大小的上传次数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发上传数")
+    parser.add_argument("--port", type=int, default=8092, help="Orchestrator 端口")
+    parser.add_argument("--workdir", default="load_test_uploads", help="服务运行目录（上传文件写入其中的 uploads/）")
+    args = parser.parse_args()
+
+    sizes = [int(size) * MB for size in args.sizes.split(",")]
+    max_upload_size = max(sizes)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_orchestrator(args.port, max_upload_size, args.workdir)
+
+    try:
+        results = [
+            run_load_test(base_url, server.pid, size, args.uploads, args.concurrency)
+            for size in sizes
+        ]
+        session_id = requests.post(f"{base_url}/api/v1/sessions", json={}).json()["session_id"]
+        oversized_status = upload(base_url, session_id, max_upload_size + 1)
+        chunked_status = upload(base_url, session_id, max_upload_size + 1, chunked=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print("=" * 60)
+    print(f"{'大小':>8} {'失败':>4} {'耗时':>8} {'吞吐':>10} {'基线RSS':>10} {'峰值RSS':>10} {'增量':>8}")
+    for r in results:
+        print(f"{r['size'] // MB:>6}MB {r['failed']:>4} {r['wall_time']:>7.2f}s {r['throughput']:>7.1f}MB/s "
+              f"{r['baseline_rss'] / MB:>8.1f}MB {r['peak_rss'] / MB:>8.1f}MB "
+              f"{(r['peak_rss'] - r['baseline_rss']) / MB:>6.1f}MB")
+    print(f"超限上传状态码: {oversized_status}，分块传输: {chunked_status}（期望 413）")
+
+
+if __name__ == "__main__":
+    main()
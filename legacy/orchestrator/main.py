@@ -4,18 +4,29 @@ Orchestrator - 主要的后端API服务器
 处理前端请求，协调各个Agent的工作
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Dict, Any, Set
+from collections import Counter
 import uuid
 import time
 import os
 import json
+import hashlib
+import hmac
 from datetime import datetime
 import asyncio
 import logging
+import aiofiles
+
+from blob_store import BlobMissing, BlobStore
+from multipart_upload import MultipartError, MultipartUpload
+from pipeline import AgentClient, AgentError, markdown_to_speech_text
+from workflow import Node, Workflow, WorkflowError
+from reaper import ExpiryHeap
+from storage import SESSIONS, PROJECTS, QUOTES, create_state_store
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -36,10 +47,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 内存存储（实际项目中应使用数据库）
-sessions = {}
-projects = {}
-quotes = {}
+# 状态存储配置
+STATE_STORE_BACKEND = os.getenv("STATE_STORE_BACKEND", "sqlite")  # sqlite / redis / memory
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "orchestrator.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", 10000))  # memory后端在内存中保留的最大记录数
+STATE_SPILL_PATH = os.getenv("STATE_SPILL_PATH", "orchestrator_spill.db")  # memory后端超出上限的记录转存位置
+
+# 过期回收配置
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 24 * 3600))  # 会话无活动多久后删除（秒）
+PROJECT_RETENTION = int(os.getenv("PROJECT_RETENTION", 7 * 24 * 3600))  # 已结束项目的保留时间（秒）
+REAPER_MAX_SLEEP = 60  # 回收循环两次检查之间的最长间隔（秒）
+
+# 会话、项目、报价存储（多个worker共享，重启后不丢失）
+state_store = create_state_store(
+    STATE_STORE_BACKEND, STATE_DB_PATH, REDIS_URL,
+    max_entries=STATE_MAX_ENTRIES, spill_path=STATE_SPILL_PATH
+)
+
+# 会话、报价、已结束项目的到期时间
+expiry_heap = ExpiryHeap()
+reaped_total = Counter()
+
+EVENTS_HEARTBEAT_INTERVAL = 15  # 项目进度事件流的心跳间隔（秒）
+EVENTS_POLL_INTERVAL = 2  # 检查其他worker写入的项目变化的间隔（秒）
+SESSION_CONTEXT_TOKENS = int(os.getenv("SESSION_CONTEXT_TOKENS", 4000))  # 会话保留消息的token预算
+SESSION_SUMMARY_LINES = 20  # 折叠后的历史摘要最多保留的行数
+SUMMARY_EXCERPT_CHARS = 120  # 每条被折叠消息在摘要中保留的字符数
+UPLOAD_DIR = "uploads"
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 50 * 1024 * 1024))  # 单个上传文件的最大字节数
+MULTIPART_OVERHEAD = 64 * 1024  # multipart边界和头部的余量
+
+# Agent服务配置
+AGENT_A_URL = os.getenv("AGENT_A_URL", "http://localhost:8001")
+AGENT_B_URL = os.getenv("AGENT_B_URL", "http://localhost:8002")
+AGENT_B_PUBLIC_URL = os.getenv("AGENT_B_PUBLIC_URL", AGENT_B_URL)  # 交付链接中使用的Agent B地址
+PAYMENT_MODE = os.getenv("PAYMENT_MODE", "live")  # live：等待支付回调；mock（仅本地演示）：创建支付即视为支付成功
+PAYMENT_CALLBACK_SECRET = os.getenv("PAYMENT_CALLBACK_SECRET", "")  # 支付回调HMAC-SHA256签名的共享密钥
+PAYMENT_SIGNATURE_HEADER = "X-Payment-Signature"
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", 2))  # 同一项目同时识别的图片数
+OUTPUT_DIR = "outputs"
+
+# Agent调用共享一个连接池
+agent_client = AgentClient(AGENT_A_URL, AGENT_B_URL)
+# 正在执行的项目流水线（保留引用，避免任务被垃圾回收）
+running_pipelines: Set[asyncio.Task] = set()
+
+# 上传文件按内容去重存储，引用计数与会话、项目保存在同一个状态存储中
+blob_store = BlobStore(os.path.join(UPLOAD_DIR, "blobs"), state_store)
+
+class ProjectEvents:
+    """项目进度订阅
+
+    每个订阅者持有一个asyncio.Queue，项目时间轴变化时推送项目快照；
+    没有订阅者时不产生任何额外开销。
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, project_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(project_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, project_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(project_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[project_id]
+
+    def publish(self, project: dict):
+        snapshot = json.dumps(project, ensure_ascii=False)
+        for queue in self._subscribers.get(project["project_id"], ()):
+            queue.put_nowait(snapshot)
+
+project_events = ProjectEvents()
 
 # 数据模型
 class SessionRequest(BaseModel):
@@ -60,6 +144,11 @@ class PaymentRequest(BaseModel):
     quote_id: str
     payment_method: str = "crossme"
 
+class PaymentCallback(BaseModel):
+    project_id: str
+    payment_id: str
+    status: str  # paid / failed
+
 # API端点
 @app.get("/health")
 async def health_check():
@@ -67,15 +156,128 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "blob_store": blob_store.stats(),
+        "state": state_store.stats(),
+        "expiry": {"scheduled": len(expiry_heap), "reaped": dict(reaped_total)},
+        "memory": {"rss_bytes": process_rss()}
     }
 
+def process_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法读取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def record_deadline(kind: str, record: dict) -> Optional[float]:
+    """记录的过期时间戳，不会过期时返回None"""
+    if kind == QUOTES:
+        return record["expires_at"] / 1000
+    if kind == SESSIONS:
+        return datetime.fromisoformat(record["updated_at"]).timestamp() + SESSION_IDLE_TTL
+    if kind == PROJECTS and record["status"] in ("completed", "failed"):
+        finished_at = record.get("updated_at", record["created_at"])
+        return datetime.fromisoformat(finished_at).timestamp() + PROJECT_RETENTION
+    return None
+
+def schedule_expiry(kind: str, key: str, record: dict):
+    """按记录当前内容登记（或顺延、取消）到期时间"""
+    deadline = record_deadline(kind, record)
+    if deadline is None:
+        expiry_heap.cancel(kind, key)
+    else:
+        expiry_heap.schedule(kind, key, deadline)
+
+RECORD_ID_FIELDS = {SESSIONS: "session_id", QUOTES: "quote_id", PROJECTS: "project_id"}
+
+def rebuild_expiry_heap():
+    """从存储中重建到期堆（启动时，包括重启前和其他worker写入的记录）"""
+    for kind, id_field in RECORD_ID_FIELDS.items():
+        for record in state_store.values(kind):
+            schedule_expiry(kind, record[id_field], record)
+
+def record_blobs(kind: str, record: dict) -> List[str]:
+    """记录引用的上传文件sha256（每个引用一项）：会话上传的文件、项目交付时使用的文件"""
+    files = record["context"].get("files", []) if kind == SESSIONS else record.get("files", [])
+    return [file_info["sha256"] for file_info in files if "sha256" in file_info]
+
+def reap_expired() -> Counter:
+    """删除所有已到期的记录，返回各类删除数
+
+    删除会话或项目的同一个事务中释放它们对上传文件的引用，计数归零的文件在提交后删除。
+    """
+    reaped = Counter()
+    now = time.time()
+    for kind, key in expiry_heap.pop_due(now):
+        record = state_store.get(kind, key)
+        if record is None:
+            continue
+        
+        digests = record_blobs(kind, record)
+        deleted, released = [], []
+        
+        def expire(records: dict):
+            deleted.clear()
+            released.clear()
+            current = records[(kind, key)]
+            # 其他worker可能已经顺延了到期时间或修改了引用，以事务中读到的记录为准
+            if current is None or record_blobs(kind, current) != digests:
+                return
+            deadline = record_deadline(kind, current)
+            if deadline is None or deadline > now:
+                return
+            records[(kind, key)] = None
+            deleted.append(key)
+            for digest in digests:
+                path = blob_store.drop_ref(records, digest)
+                if path is not None:
+                    released.append(path)
+        
+        records = state_store.update_many([(kind, key)] + [blob_store.key(d) for d in set(digests)], expire)
+        current = records[(kind, key)]
+        if current is not None:
+            schedule_expiry(kind, key, current)
+        if not deleted:
+            continue
+        
+        for path in released:
+            blob_store.discard(path)
+        reaped[kind] += 1
+    
+    reaped_total.update(reaped)
+    return reaped
+
+async def reaper_loop():
+    """在最近的到期时间醒来，回收过期的报价、闲置会话和已结束的项目"""
+    rebuild_expiry_heap()
+    while True:
+        try:
+            reaped = reap_expired()
+            if reaped:
+                logger.info(f"回收过期记录: {dict(reaped)}")
+        except Exception as e:
+            logger.error(f"过期记录回收失败: {str(e)}")
+        
+        next_deadline = expiry_heap.next_deadline()
+        delay = REAPER_MAX_SLEEP if next_deadline is None else next_deadline - time.time()
+        await asyncio.sleep(min(REAPER_MAX_SLEEP, max(1.0, delay)))
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(reaper_loop())
+
+@app.on_event("shutdown")
+async def close_agent_client():
+    await agent_client.aclose()
+
 @app.post("/api/v1/sessions")
 async def create_session(request: SessionRequest):
     """创建新的会话"""
     session_id = str(uuid.uuid4())
     
-    sessions[session_id] = {
+    session = {
         "session_id": session_id,
         "user_id": request.user_id or str(uuid.uuid4()),
         "language": request.language,
@@ -85,26 +287,24 @@ async def create_session(request: SessionRequest):
         "messages": [],
         "context": {}
     }
+    state_store.put(SESSIONS, session_id, session)
+    schedule_expiry(SESSIONS, session_id, session)
     
     logger.info(f"创建新会话: {session_id}")
-    return sessions[session_id]
+    return session
 
 @app.get("/api/v1/sessions/{session_id}")
 async def get_session(session_id: str):
     """获取会话信息"""
-    if session_id not in sessions:
+    session = state_store.get(SESSIONS, session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    return sessions[session_id]
+    return session
 
 @app.post("/api/v1/chat")
 async def send_message(request: MessageRequest):
     """发送消息到聊天"""
-    if request.session_id not in sessions:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    
-    session = sessions[request.session_id]
-    
     # 添加用户消息
     user_message = {
         "id": str(uuid.uuid4()),
@@ -113,7 +313,9 @@ async def send_message(request: MessageRequest):
         "timestamp": datetime.now().isoformat(),
         "type": request.message_type
     }
-    session["messages"].append(user_message)
+    session = state_store.update(SESSIONS, request.session_id, lambda s: append_session_message(s, user_message))
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
     
     # 生成AI回复（简单的模拟回复）
     ai_response = generate_ai_response(request.message, session)
@@ -127,61 +329,147 @@ async def send_message(request: MessageRequest):
         "suggestions": ai_response.get("suggestions", []),
         "requires_clarification": ai_response.get("requires_clarification", False)
     }
-    session["messages"].append(ai_message)
-    
-    session["updated_at"] = datetime.now().isoformat()
+    session = state_store.update(SESSIONS, request.session_id, lambda s: append_session_message(s, ai_message))
+    if session is not None:
+        schedule_expiry(SESSIONS, request.session_id, session)
     
     return ai_message
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """声明的请求体超过上传上限时，在读取请求体之前直接返回413"""
+    if request.url.path == "/api/v1/upload":
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"文件大小不能超过{MAX_UPLOAD_SIZE // (1024 * 1024)}MB"}
+            )
+    return await call_next(request)
+
 @app.post("/api/v1/upload")
-async def upload_file(session_id: str, file: UploadFile = File(...)):
-    """上传文件"""
-    if session_id not in sessions:
+async def upload_file(session_id: str, request: Request, sha256: Optional[str] = None):
+    """上传文件
+
+    直接读取请求体流，由 MultipartUpload 逐块取出文件数据，同一遍中写入磁盘、
+    计算sha256并计数，每个上传占用的内存与文件大小无关；文件或请求体超过
+    MAX_UPLOAD_SIZE（分块传输、没有Content-Length时也一样）时立即返回413。
+    写完后按sha256存入 blob_store，内容相同的文件只保存一份。
+
+    客户端可以在 sha256 参数中声明文件的哈希：该内容已经存储时只计算哈希核对，
+    不再写入磁盘。
+    """
+    if not state_store.exists(SESSIONS, session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     
+    try:
+        upload = MultipartUpload(request.headers.get("content-type", ""))
+    except MultipartError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # 创建上传目录
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
     
     # 保存文件
     file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(file.filename)[1]
-    saved_filename = f"{file_id}{file_extension}"
-    file_path = os.path.join(upload_dir, saved_filename)
-    
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    # 记录文件信息
-    file_info = {
-        "file_id": file_id,
-        "original_name": file.filename,
-        "saved_name": saved_filename,
-        "file_path": file_path,
-        "file_size": len(content),
-        "content_type": file.content_type,
-        "uploaded_at": datetime.now().isoformat()
-    }
-    
-    # 添加到会话上下文
-    session = sessions[session_id]
-    if "files" not in session["context"]:
-        session["context"]["files"] = []
-    session["context"]["files"].append(file_info)
+    part_path = os.path.join(UPLOAD_DIR, f"{file_id}.part")
+    known = sha256 is not None and blob_store.exists(sha256.lower())
+    too_large = HTTPException(status_code=413, detail=f"文件大小不能超过{MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
+    
+    hasher = hashlib.sha256()
+    file_size = 0
+    received = 0
+    
+    async def receive(buffer):
+        nonlocal file_size, received
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+                raise too_large
+            for data in upload.feed(chunk):
+                file_size += len(data)
+                if file_size > MAX_UPLOAD_SIZE:
+                    raise too_large
+                hasher.update(data)
+                if buffer is not None:
+                    await buffer.write(data)
+        upload.finish()
+    
+    staged_path = None
+    try:
+        if known:
+            await receive(None)
+        else:
+            async with aiofiles.open(part_path, "wb") as buffer:
+                await receive(buffer)
+        digest = hasher.hexdigest()
+        if sha256 is not None and sha256.lower() != digest:
+            raise HTTPException(status_code=400, detail="文件内容与声明的sha256不一致")
+        if not known:
+            # 写完整后再移入blob存储，中途失败不会留下不完整的文件
+            staged_path = blob_store.stage(part_path, digest)
+    except MultipartError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    
+    # 记录文件信息，与blob引用计数在同一个事务中加入会话上下文
+    file_info = {}
+    
+    def add_file(records: dict):
+        file_info.clear()
+        session = records[(SESSIONS, session_id)]
+        if session is None:
+            return
+        file_path, deduplicated = blob_store.add_ref(records, digest, staged_path, file_size)
+        file_info.update({
+            "file_id": file_id,
+            "original_name": upload.filename,
+            "saved_name": os.path.basename(file_path),
+            "file_path": file_path,
+            "file_size": file_size,
+            "sha256": digest,
+            "deduplicated": deduplicated,
+            "content_type": upload.content_type,
+            "uploaded_at": datetime.now().isoformat()
+        })
+        session["context"].setdefault("files", []).append(dict(file_info))
+        session["updated_at"] = datetime.now().isoformat()
+    
+    try:
+        records = state_store.update_many([(SESSIONS, session_id), blob_store.key(digest)], add_file)
+    except BlobMissing:
+        # 核对哈希期间该内容的最后一个引用被释放
+        raise HTTPException(status_code=409, detail="文件内容已被回收，请重新上传")
+    except BaseException:
+        if staged_path is not None:
+            blob_store.discard(staged_path, collected=False)
+        raise
+    
+    if staged_path is not None and (not file_info or file_info["deduplicated"]):
+        # 会话已不存在，或同一内容已经存储：丢弃暂存的副本
+        blob_store.discard(staged_path, collected=False)
+    session = records[(SESSIONS, session_id)]
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    schedule_expiry(SESSIONS, session_id, session)
+    if file_info["deduplicated"]:
+        blob_store.record_deduplicated()
     
-    logger.info(f"文件上传成功: {file.filename} -> {saved_filename}")
+    logger.info(f"文件上传成功: {upload.filename} -> {file_info['saved_name']}"
+                + ("（重复内容）" if file_info["deduplicated"] else ""))
     
     return {
         "file_id": file_id,
-        "message": f"文件 '{file.filename}' 上传成功",
+        "message": f"文件 '{upload.filename}' 上传成功",
         "file_info": file_info
     }
 
 @app.post("/api/v1/quote")
 async def generate_quote(request: QuoteRequest):
     """生成报价"""
-    if request.session_id not in sessions:
+    if not state_store.exists(SESSIONS, request.session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     
     quote_id = str(uuid.uuid4())
@@ -217,32 +505,44 @@ async def generate_quote(request: QuoteRequest):
         "status": "pending"
     }
     
-    quotes[quote_id] = quote
+    state_store.put(QUOTES, quote_id, quote)
+    schedule_expiry(QUOTES, quote_id, quote)
     
     return quote
 
 @app.post("/api/v1/payment")
 async def create_payment(request: PaymentRequest):
-    """创建支付"""
-    if request.session_id not in sessions:
+    """创建支付
+
+    项目记录会话当前上传的文件和报价中的需求，并在创建项目的同一个事务中引用
+    这些文件，会话和报价被回收后项目仍可使用。
+    """
+    session = state_store.get(SESSIONS, request.session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    if request.quote_id not in quotes:
+    quote = state_store.get(QUOTES, request.quote_id)
+    if quote is None:
         raise HTTPException(status_code=404, detail="报价不存在")
     
-    quote = quotes[request.quote_id]
+    if quote["expires_at"] / 1000 < time.time():
+        raise HTTPException(status_code=400, detail="报价已过期，请重新生成报价")
     
     # 创建项目
     project_id = str(uuid.uuid4())
+    payment_id = str(uuid.uuid4())
     project = {
         "project_id": project_id,
         "session_id": request.session_id,
         "quote_id": request.quote_id,
         "status": "payment_pending",
         "payment_method": request.payment_method,
+        "payment_id": payment_id,
         "total_amount": quote["total_price"],
         "currency": quote["currency"],
         "created_at": datetime.now().isoformat(),
+        "files": session["context"].get("files", []),
+        "requirements": quote.get("requirements", {}),
         "timeline": [
             {"stage": "clarification", "status": "completed", "progress": 100},
             {"stage": "quote", "status": "completed", "progress": 100},
@@ -253,58 +553,419 @@ async def create_payment(request: PaymentRequest):
         ]
     }
     
-    projects[project_id] = project
+    def create(records: dict):
+        records[(PROJECTS, project_id)] = project
+        for digest in record_blobs(PROJECTS, project):
+            blob_store.add_ref(records, digest)
+    
+    try:
+        state_store.update_many(
+            [(PROJECTS, project_id)] + [blob_store.key(d) for d in set(record_blobs(PROJECTS, project))], create
+        )
+    except BlobMissing:
+        raise HTTPException(status_code=409, detail="会话上传的文件已被回收，请重新上传")
     
     # 模拟支付处理
     payment_response = {
         "project_id": project_id,
         "payment_url": f"https://crossme.example.com/pay/{project_id}",
-        "payment_id": str(uuid.uuid4()),
+        "payment_id": payment_id,
         "amount": quote["total_price"],
         "currency": quote["currency"],
         "status": "pending",
         "created_at": datetime.now().isoformat()
     }
     
+    if PAYMENT_MODE == "mock":
+        logger.warning(f"PAYMENT_MODE=mock，未经支付直接启动项目: {project_id}")
+        confirm_payment(project_id)
+        payment_response["status"] = "paid"
+    
     return payment_response
 
+def payment_signature(body: bytes) -> str:
+    """支付回调请求体的签名：以 PAYMENT_CALLBACK_SECRET 为密钥的HMAC-SHA256（十六进制）"""
+    return hmac.new(PAYMENT_CALLBACK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+@app.post("/api/v1/payment/callback")
+async def payment_callback(raw_request: Request):
+    """支付结果回调：支付成功后开始执行项目
+
+    请求头 X-Payment-Signature 必须是原始请求体的HMAC-SHA256签名，
+    未签名或签名不符的回调一律拒绝；未配置 PAYMENT_CALLBACK_SECRET 时不接受任何回调。
+    """
+    if not PAYMENT_CALLBACK_SECRET:
+        logger.error("收到支付回调，但未配置 PAYMENT_CALLBACK_SECRET")
+        raise HTTPException(status_code=503, detail="支付回调未启用")
+    
+    body = await raw_request.body()
+    signature = raw_request.headers.get(PAYMENT_SIGNATURE_HEADER, "")
+    if not hmac.compare_digest(signature.lower(), payment_signature(body)):
+        logger.warning("拒绝签名无效的支付回调")
+        raise HTTPException(status_code=401, detail="支付回调签名无效")
+    
+    try:
+        request = PaymentCallback(**json.loads(body))
+    except (ValueError, TypeError, ValidationError):
+        raise HTTPException(status_code=400, detail="支付回调格式错误")
+    
+    project = state_store.get(PROJECTS, request.project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    if project.get("payment_id") != request.payment_id:
+        raise HTTPException(status_code=400, detail="支付单号不匹配")
+    
+    if request.status == "paid":
+        started = confirm_payment(request.project_id)
+    else:
+        fail_payment(request.project_id)
+        started = False
+    
+    return {"project_id": request.project_id, "started": started}
+
+def fail_payment(project_id: str) -> bool:
+    """标记支付失败；只有仍在等待支付的项目会变为失败，迟到或重放的失败回调不影响已启动的项目"""
+    transitioned = []
+    
+    def apply(project: dict):
+        transitioned.clear()
+        if project["status"] == "payment_pending":
+            project["status"] = "failed"
+            transitioned.append(True)
+    
+    update_project(project_id, apply)
+    if not transitioned:
+        return False
+    
+    update_project_stage(project_id, "payment", status="failed")
+    return True
+
+def confirm_payment(project_id: str) -> bool:
+    """标记支付完成并启动项目流水线，重复确认不会重复启动"""
+    transitioned = []
+    
+    def apply(project: dict):
+        transitioned.clear()
+        if project["status"] == "payment_pending":
+            project["status"] = "processing"
+            transitioned.append(True)
+    
+    update_project(project_id, apply)
+    if not transitioned:
+        return False
+    
+    update_project_stage(project_id, "payment", status="completed", progress=100)
+    task = asyncio.create_task(run_project_pipeline(project_id))
+    running_pipelines.add(task)
+    task.add_done_callback(running_pipelines.discard)
+    return True
+
+async def run_project_pipeline(project_id: str):
+    """按工作流执行项目：OCR（Agent A）与需求文本的TTS（Agent B）并发进行，
+    每识别完一张图片就立即提交该页的TTS，全部完成后生成交付结果"""
+    project = state_store.get(PROJECTS, project_id)
+    # 报价在支付回调到达前可能已过期被回收，需求以创建项目时记录的为准
+    requirements = project.get("requirements", {})
+    images = [
+        file_info for file_info in project.get("files", [])
+        if (file_info.get("content_type") or "").startswith("image/")
+    ]
+    text = requirements.get("text", "")
+    
+    try:
+        if not images and not text.strip():
+            raise WorkflowError("agent_b", AgentError("没有可合成的文本"))
+        
+        workflow = build_project_workflow(project_id, images, text, requirements.get("voice_id"))
+        
+        def describe(project: dict):
+            # 在时间轴中记录依赖关系，未参与本次工作流的阶段标记为跳过
+            for item in project["timeline"]:
+                node = workflow.nodes.get(item["stage"])
+                if node is not None:
+                    item["depends_on"] = node.depends_on
+                    item["streams_from"] = node.streams_from
+                elif item["status"] == "waiting":
+                    item.update(status="skipped", progress=100)
+        
+        update_project(project_id, describe)
+        
+        def on_status(stage: str, status: str):
+            if status == "completed":
+                update_project_stage(project_id, stage, status=status, progress=100)
+            else:
+                update_project_stage(project_id, stage, status=status)
+        
+        outputs = await workflow.run(on_status)
+        update_project(project_id, lambda p: p.update(
+            status="completed",
+            results=outputs["delivery"],
+            workflow={"nodes": workflow.timings},
+            completed_at=datetime.now().isoformat()
+        ))
+        logger.info(f"项目完成: {project_id}（{workflow.timings['total']['duration_ms']}ms）")
+    except WorkflowError as e:
+        logger.error(f"项目执行失败 {project_id}（{e.node}）: {str(e.error)}")
+        update_project_stage(project_id, e.node, status="failed", error_message=str(e.error))
+        update_project(project_id, lambda p: p.update(status="failed", error_message=str(e.error)))
+    except Exception as e:
+        logger.error(f"项目执行失败 {project_id}: {str(e)}")
+        update_project(project_id, lambda p: p.update(status="failed", error_message=str(e)))
+
+def build_project_workflow(project_id: str, images: List[dict], text: str,
+                           voice_id: Optional[str] = None) -> Workflow:
+    """构建项目工作流
+
+    agent_a：并发识别上传的图片，每识别完一张输出一页Markdown；
+    agent_b：立即合成需求中的文本，同时读取agent_a的输出流，逐页提交合成；
+    delivery：等待两者完成后保存交付文件并生成结果。
+    """
+    tts_jobs = len(images) + (1 if text.strip() else 0)
+    
+    async def run_ocr(ctx) -> dict:
+        semaphore = asyncio.Semaphore(OCR_CONCURRENCY)
+        progress = [0] * len(images)
+        
+        async def recognize(index: int, file_info: dict) -> dict:
+            async with semaphore:
+                task_id = await agent_client.submit_ocr(
+                    file_info["file_path"], file_info["original_name"], file_info.get("content_type")
+                )
+                
+                async def on_progress(status: dict):
+                    before = sum(progress) // len(images)
+                    progress[index] = status.get("progress", 0)
+                    if sum(progress) // len(images) != before:
+                        update_project_stage(project_id, "agent_a", progress=sum(progress) // len(images))
+                
+                await agent_client.follow(agent_client.agent_a_url, task_id, on_progress)
+                result = await agent_client.ocr_result(task_id)
+            
+            page = {"index": index, "source": file_info["original_name"], **result}
+            ctx.emit(page)
+            return page
+        
+        pages = await asyncio.gather(*(recognize(i, f) for i, f in enumerate(images)))
+        return {
+            "markdown": "\n\n".join(page["markdown"] for page in pages),
+            "qc_reports": [page.get("qc_report") for page in pages]
+        }
+    
+    async def run_tts(ctx) -> List[dict]:
+        progress = {}
+        
+        async def synthesize(source: str, speech_text: str) -> dict:
+            task_id = await agent_client.submit_tts(speech_text, voice_id)
+            
+            async def on_progress(status: dict):
+                progress[source] = status.get("progress", 0)
+                update_project_stage(project_id, "agent_b", progress=sum(progress.values()) // tts_jobs)
+            
+            status = await agent_client.follow(agent_client.agent_b_url, task_id, on_progress)
+            return {"source": source, **status}
+        
+        jobs = []
+        try:
+            if text.strip():
+                jobs.append(asyncio.create_task(synthesize("requirements", text)))
+            if "agent_a" in ctx.node.streams_from:
+                async for page in ctx.stream("agent_a"):
+                    speech_text = markdown_to_speech_text(page["markdown"])
+                    if speech_text:
+                        jobs.append(asyncio.create_task(synthesize(page["source"], speech_text)))
+                    else:
+                        progress[page["source"]] = 100
+            return list(await asyncio.gather(*jobs))
+        except BaseException:
+            for job in jobs:
+                job.cancel()
+            raise
+    
+    async def run_delivery(ctx) -> dict:
+        return await build_project_results(project_id, ctx.results.get("agent_a"), ctx.results["agent_b"])
+    
+    nodes = [Node("agent_b", run_tts, streams_from=["agent_a"] if images else [])]
+    if images:
+        nodes.insert(0, Node("agent_a", run_ocr))
+    nodes.append(Node("delivery", run_delivery, depends_on=[node.name for node in nodes]))
+    return Workflow(nodes)
+
+async def build_project_results(project_id: str, ocr_output: Optional[dict], tracks: List[dict]) -> dict:
+    """保存交付文件并生成项目结果"""
+    results = {}
+    
+    if ocr_output is not None:
+        project_dir = os.path.join(OUTPUT_DIR, project_id)
+        os.makedirs(project_dir, exist_ok=True)
+        async with aiofiles.open(os.path.join(project_dir, "agent_a_output.md"), "w", encoding="utf-8") as f:
+            await f.write(ocr_output["markdown"])
+        results["agent_a"] = {
+            "markdown_file": f"/api/v1/projects/{project_id}/files/agent_a_output.md",
+            "qc_reports": ocr_output["qc_reports"]
+        }
+    
+    results["agent_b"] = {
+        "tracks": [
+            {
+                "source": track["source"],
+                "task_id": track["task_id"],
+                "audio_file": f"{AGENT_B_PUBLIC_URL}{track['audio_url']}",
+                "subtitle_file": f"{AGENT_B_PUBLIC_URL}{track['vtt_url']}" if track.get("vtt_url") else None,
+                "duration": track.get("duration"),
+                "qc_report": track.get("qc_report")
+            }
+            for track in tracks
+        ]
+    }
+    return results
+
 @app.get("/api/v1/projects/{project_id}/status")
 async def get_project_status(project_id: str):
     """获取项目状态"""
-    if project_id not in projects:
+    project = state_store.get(PROJECTS, project_id)
+    if project is None:
         raise HTTPException(status_code=404, detail="项目不存在")
     
-    return projects[project_id]
+    return project
+
+@app.get("/api/v1/projects/{project_id}/events")
+async def stream_project_events(project_id: str):
+    """订阅项目进度（Server-Sent Events）
+
+    连接后立即推送当前项目状态，之后时间轴每次变化推送一条 timeline 事件，
+    项目完成后关闭连接。本进程内的变化即时推送；其他worker写入的变化
+    每 EVENTS_POLL_INTERVAL 秒从存储中检查一次。等待期间发送心跳。
+    """
+    project = state_store.get(PROJECTS, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    queue = project_events.subscribe(project_id)
+    
+    async def event_stream():
+        try:
+            snapshot = json.dumps(project, ensure_ascii=False)
+            while True:
+                yield f"event: timeline\ndata: {snapshot}\n\n"
+                if json.loads(snapshot)["status"] in ("completed", "failed"):
+                    break
+                
+                last_sent = snapshot
+                idle = 0.0
+                while True:
+                    try:
+                        snapshot = await asyncio.wait_for(queue.get(), timeout=EVENTS_POLL_INTERVAL)
+                        break
+                    except asyncio.TimeoutError:
+                        current = state_store.get(PROJECTS, project_id)
+                        if current is None:
+                            return
+                        snapshot = json.dumps(current, ensure_ascii=False)
+                        if snapshot != last_sent:
+                            break
+                        idle += EVENTS_POLL_INTERVAL
+                        if idle >= EVENTS_HEARTBEAT_INTERVAL:
+                            idle = 0.0
+                            yield ": keepalive\n\n"
+        finally:
+            project_events.unsubscribe(project_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def update_project(project_id: str, mutate) -> dict:
+    """原子地修改项目，登记到期时间并通知订阅者"""
+    def apply(project: dict):
+        mutate(project)
+        project["updated_at"] = datetime.now().isoformat()
+    
+    project = state_store.update(PROJECTS, project_id, apply)
+    if project is None:
+        raise KeyError(f"项目不存在: {project_id}")
+    schedule_expiry(PROJECTS, project_id, project)
+    project_events.publish(project)
+    return project
+
+def update_project_stage(project_id: str, stage: str, **fields) -> dict:
+    """原子地更新项目时间轴中某个阶段的状态/进度，并通知订阅者
+
+    阶段进入 processing 时记录 started_at，结束时记录 finished_at 和耗时 duration_ms。
+    """
+    def apply(project: dict):
+        for item in project["timeline"]:
+            if item["stage"] == stage:
+                break
+        else:
+            raise KeyError(f"未知的项目阶段: {stage}")
+        
+        now = datetime.now()
+        status = fields.get("status")
+        if status == "processing" and "started_at" not in item:
+            item["started_at"] = now.isoformat()
+        elif status in ("completed", "failed", "cancelled") and "started_at" in item:
+            item["finished_at"] = now.isoformat()
+            started_at = datetime.fromisoformat(item["started_at"])
+            item["duration_ms"] = round((now - started_at).total_seconds() * 1000)
+        item.update(fields)
+    
+    return update_project(project_id, apply)
 
 @app.get("/api/v1/projects/{project_id}/results")
 async def get_project_results(project_id: str):
     """获取项目结果"""
-    if project_id not in projects:
+    project = state_store.get(PROJECTS, project_id)
+    if project is None:
         raise HTTPException(status_code=404, detail="项目不存在")
     
-    project = projects[project_id]
-    
     if project["status"] != "completed":
         raise HTTPException(status_code=400, detail="项目尚未完成")
     
-    # 模拟结果
-    results = {
+    return {
         "project_id": project_id,
-        "results": {
-            "agent_a": {
-                "markdown_file": f"/download/{project_id}/agent_a_output.md",
-                "qc_report": {"score": 95.0, "issues": [], "recommendations": []}
-            },
-            "agent_b": {
-                "audio_file": f"/download/{project_id}/agent_b_output.mp3",
-                "subtitle_file": f"/download/{project_id}/agent_b_output.vtt",
-                "qc_report": {"score": 92.0, "issues": [], "recommendations": []}
-            }
-        },
-        "completed_at": datetime.now().isoformat()
+        "results": project["results"],
+        "timeline": project["timeline"],
+        "completed_at": project["completed_at"]
     }
-    
-    return results
+
+@app.get("/api/v1/projects/{project_id}/files/{filename}")
+async def download_project_file(project_id: str, filename: str):
+    """下载项目交付文件"""
+    file_path = os.path.join(OUTPUT_DIR, project_id, os.path.basename(filename))
+    if not state_store.exists(PROJECTS, project_id) or not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return FileResponse(file_path, filename=os.path.basename(filename))
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约1个token，其余约4个字符1个token"""
+    cjk = sum(1 for ch in text if '\u3040' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af')
+    return cjk + (len(text) - cjk + 3) // 4
+
+def append_session_message(session: dict, message: dict):
+    """追加消息，并把会话保留的消息控制在 SESSION_CONTEXT_TOKENS 以内
+
+    每条消息的token数只在追加时计算一次并记录在消息上；超出预算的最早消息
+    折叠为 context["summary"] 中的一行摘要，不再保留原文。
+    """
+    message["tokens"] = estimate_tokens(message["content"])
+    session["messages"].append(message)
+    
+    context = session["context"]
+    context["message_tokens"] = context.get("message_tokens", 0) + message["tokens"]
+    session["updated_at"] = message["timestamp"]
+    
+    while len(session["messages"]) > 1 and context["message_tokens"] > SESSION_CONTEXT_TOKENS:
+        oldest = session["messages"].pop(0)
+        context["message_tokens"] -= oldest["tokens"]
+        excerpt = " ".join(oldest["content"].split())[:SUMMARY_EXCERPT_CHARS]
+        summary = context.setdefault("summary", [])
+        summary.append(f"{oldest['role']}: {excerpt}")
+        del summary[:-SESSION_SUMMARY_LINES]
+        context["archived_messages"] = context.get("archived_messages", 0) + 1
 
 def generate_ai_response(message: str, session: dict) -> dict:
     """生成AI回复（简单模拟）"""
@@ -0,0 +1,103 @@
+"""
+Orchestrator 上传请求体的流式解析
+直接读取 request.stream()，用 python-multipart 的 MultipartParser 回调逐块取出文件数据，
+请求体不经过 UploadFile 的临时文件，也不会整体放进内存
+"""
+
+from typing import Dict, List, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartError(ValueError):
+    """请求体不是合法的multipart/form-data，或缺少文件字段"""
+
+
+class MultipartUpload:
+    """逐块解析multipart请求体，只取出名为 field_name 的第一个文件部分
+
+    feed 每次写入一块请求体，返回其中属于该文件的数据片段；其他字段的数据直接丢弃。
+    请求体读完后调用 finish 检查是否完整、是否找到了文件。
+    """
+
+    def __init__(self, content_type: str, field_name: str = "file"):
+        media_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise MultipartError("请求体必须是 multipart/form-data")
+
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.found = False
+        self.complete = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._in_file = False
+        self._pieces: List[bytes] = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end
+        })
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """写入一块请求体，返回其中属于文件部分的数据"""
+        self._pieces = []
+        try:
+            self._parser.write(chunk)
+        except Exception as e:
+            raise MultipartError(f"multipart请求体格式错误: {e}")
+        return self._pieces
+
+    def finish(self):
+        """请求体已读完：检查结束边界和文件字段"""
+        self._parser.finalize()
+        if not self.complete:
+            raise MultipartError("multipart请求体不完整")
+        if not self.found:
+            raise MultipartError(f"缺少文件字段 '{self.field_name}'")
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = params.get(b"name", b"").decode("utf-8", "replace")
+        if self.found or name != self.field_name or b"filename" not in params:
+            return
+        self.found = True
+        self._in_file = True
+        self.filename = params[b"filename"].decode("utf-8", "replace")
+        content_type = self._headers.get(b"content-type")
+        self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._pieces.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        self._in_file = False
+
+    def _on_end(self):
+        self.complete = True
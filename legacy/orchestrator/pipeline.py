@@ -0,0 +1,109 @@
+"""
+Orchestrator 与 Agent A / Agent B 的通信
+通过共享连接池的异步HTTP客户端提交任务，并订阅各Agent的进度事件（SSE）
+
+Agent A（OCR）接口约定，与 Agent B 保持一致：
+    POST /ocr                     multipart上传图片，返回 {"task_id": ...}
+    GET  /task/{task_id}/events   SSE，event: progress，data 为任务状态JSON
+                                  （status、progress、error_message），任务结束后关闭
+    GET  /task/{task_id}/result   返回 {"markdown": ..., "qc_report": {...}}
+"""
+
+import asyncio
+import json
+import re
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+# 进度回调：收到Agent推送的任务状态时调用
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+TTS_MAX_TEXT_LENGTH = 5000  # Agent B /tts 单次合成的最大字符数，更长的文本走 /batch-tts
+
+
+class AgentError(Exception):
+    """Agent返回错误或任务失败"""
+
+
+class AgentClient:
+    """Agent A / Agent B 客户端
+
+    所有请求共用一个 httpx.AsyncClient（keep-alive连接池）。测试时可以传入
+    挂载了进程内Agent替身（httpx.ASGITransport）的客户端。
+    """
+
+    def __init__(self, agent_a_url: str, agent_b_url: str, client: Optional[httpx.AsyncClient] = None,
+                 max_connections: int = 20, timeout: float = 30.0):
+        self.agent_a_url = agent_a_url.rstrip("/")
+        self.agent_b_url = agent_b_url.rstrip("/")
+        self.client = client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            # 读超时针对单次读取，SSE有心跳，不会因任务耗时长而超时
+            timeout=httpx.Timeout(timeout, connect=5.0)
+        )
+
+    async def _json(self, response: httpx.Response) -> dict:
+        if response.status_code != 200:
+            raise AgentError(f"{response.request.url} 返回 {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    async def submit_ocr(self, file_path: str, filename: str, content_type: Optional[str]) -> str:
+        """提交OCR任务，返回Agent A的task_id"""
+        # 在线程中读取文件，不阻塞事件循环
+        content = await asyncio.to_thread(Path(file_path).read_bytes)
+        response = await self.client.post(
+            f"{self.agent_a_url}/ocr",
+            files={"file": (filename, content, content_type or "application/octet-stream")}
+        )
+        return (await self._json(response))["task_id"]
+
+    async def ocr_result(self, task_id: str) -> dict:
+        response = await self.client.get(f"{self.agent_a_url}/task/{task_id}/result")
+        return await self._json(response)
+
+    async def submit_tts(self, text: str, voice_id: Optional[str] = None) -> str:
+        """提交TTS任务，返回Agent B的task_id；超长文本通过批量接口分段合成"""
+        payload = {"voice_id": voice_id} if voice_id else {}
+        if len(text) <= TTS_MAX_TEXT_LENGTH:
+            response = await self.client.post(f"{self.agent_b_url}/tts", json={"text": text, **payload})
+            return (await self._json(response))["task_id"]
+
+        response = await self.client.post(f"{self.agent_b_url}/batch-tts", json={"texts": [text], **payload})
+        return (await self._json(response))["task_ids"][0]
+
+    async def follow(self, base_url: str, task_id: str, on_progress: ProgressCallback) -> dict:
+        """订阅任务进度事件直到任务结束，返回最终状态；任务失败时抛出AgentError"""
+        status = None
+        event = None
+        async with self.client.stream("GET", f"{base_url}/task/{task_id}/events") as response:
+            if response.status_code != 200:
+                raise AgentError(f"订阅任务进度失败 {task_id}: {response.status_code}")
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event == "progress":
+                    status = json.loads(line[5:])
+                    await on_progress(status)
+
+        if status is None or status.get("status") not in ("completed", "failed"):
+            raise AgentError(f"任务进度中断 {task_id}")
+        if status["status"] == "failed":
+            raise AgentError(status.get("error_message") or f"任务失败 {task_id}")
+        return status
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def markdown_to_speech_text(markdown: str) -> str:
+    """去掉Markdown标记，得到适合朗读的纯文本"""
+    text = re.sub(r"```.*?```", "", markdown, flags=re.S)
+    text = re.sub(r"!\[[^\]]*\]\([^)]*\)", "", text)  # 图片
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)  # 链接保留文字
+    text = re.sub(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", "", text, flags=re.M)  # 标题、引用、列表
+    text = re.sub(r"^\s*\|?\s*:?-{3,}.*$", "", text, flags=re.M)  # 表格分隔行
+    text = re.sub(r"[*_`|]", " ", text)
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
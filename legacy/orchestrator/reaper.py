@@ -0,0 +1,52 @@
+"""
+Orchestrator 过期记录回收
+按到期时间排序的最小堆，后台循环只需查看堆顶即可找到到期的会话、报价和项目
+"""
+
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+RecordKey = Tuple[str, str]  # (kind, key)
+
+
+class ExpiryHeap:
+    """到期时间最小堆
+
+    同一条记录可以多次 schedule（例如会话每次活跃都顺延），旧的堆项不会立即删除，
+    弹出时与 _deadlines 中记录的最新到期时间不一致就直接丢弃（惰性删除）。
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str, str]] = []
+        self._deadlines: Dict[RecordKey, float] = {}
+
+    def schedule(self, kind: str, key: str, deadline: float):
+        self._deadlines[(kind, key)] = deadline
+        heapq.heappush(self._heap, (deadline, kind, key))
+        # 频繁顺延会留下大量过期堆项，超过有效项数的两倍时重建
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, k, r) for (k, r), d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def cancel(self, kind: str, key: str):
+        self._deadlines.pop((kind, key), None)
+
+    def pop_due(self, now: Optional[float] = None) -> List[RecordKey]:
+        """弹出所有已到期的记录"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, kind, key = heapq.heappop(self._heap)
+            if self._deadlines.get((kind, key)) == deadline:
+                del self._deadlines[(kind, key)]
+                due.append((kind, key))
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        while self._heap and self._deadlines.get((self._heap[0][1], self._heap[0][2])) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._deadlines)
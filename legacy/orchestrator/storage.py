@@ -0,0 +1,447 @@
+"""
+Orchestrator 状态存储
+会话、报价和项目的可插拔存储，默认使用SQLite（WAL模式），也可以使用Redis，
+多个uvicorn worker或多台实例共享同一份状态，服务重启后不会丢失
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# 记录类型
+SESSIONS = "sessions"
+PROJECTS = "projects"
+QUOTES = "quotes"
+BLOBS = "blobs"  # 上传文件的引用计数
+
+RecordKey = Tuple[str, str]  # (kind, key)
+
+# 原子更新函数：原地修改记录
+Mutator = Callable[[dict], None]
+# 多记录原子更新函数：原地修改 {(kind, key): 记录}，赋值新记录即新建，赋值None即删除
+ManyMutator = Callable[[Dict[RecordKey, Optional[dict]]], None]
+
+
+class StateStore(ABC):
+    """状态存储接口；后端须实现全部抽象方法，否则实例化时即报错
+
+    记录是可JSON序列化的dict，按 (kind, key) 存取。get 返回的是副本，
+    修改记录必须通过 put 或 update；update 在后端内部完成读-改-写，
+    并发的追加消息、时间轴变更不会互相覆盖。
+    """
+
+    @abstractmethod
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        """获取记录，不存在时返回None"""
+
+    @abstractmethod
+    def put(self, kind: str, key: str, value: dict) -> None:
+        """新建或覆盖记录"""
+
+    @abstractmethod
+    def update(self, kind: str, key: str, mutate: Mutator) -> Optional[dict]:
+        """原子地修改记录，返回修改后的记录；记录不存在时返回None
+
+        mutate 可能因并发冲突被重试，不应有副作用。
+        """
+
+    @abstractmethod
+    def update_many(self, keys: List[RecordKey], mutate: ManyMutator) -> Dict[RecordKey, Optional[dict]]:
+        """在一个事务中读-改-写多条记录，返回修改后的 {(kind, key): 记录或None}
+
+        mutate 收到的字典中不存在的记录为None；mutate 抛出异常时不写入任何修改。
+        与 update 一样，mutate 可能因并发冲突被重试，不应有副作用。
+        """
+
+    @abstractmethod
+    def delete(self, kind: str, key: str) -> bool:
+        """删除记录，返回是否存在"""
+
+    def exists(self, kind: str, key: str) -> bool:
+        return self.get(kind, key) is not None
+
+    @abstractmethod
+    def keys(self, kind: str) -> List[str]:
+        """列出某类记录的全部key"""
+
+    def values(self, kind: str) -> Iterator[dict]:
+        """遍历某类记录（用于后台清理等低频操作）"""
+        for key in self.keys(kind):
+            value = self.get(kind, key)
+            if value is not None:
+                yield value
+
+    @abstractmethod
+    def stats(self) -> Dict[str, dict]:
+        """各类记录的条目数和占用字节数"""
+
+
+class MemoryStateStore(StateStore):
+    """内存状态存储（单进程使用）
+
+    与其他后端一样保存JSON文本，get 返回独立副本，行为保持一致。
+    设置 max_entries 后按LRU限制内存中的记录数：最久未访问的记录转存到 spill
+    （通常是一个SQLiteStateStore），再次访问时自动读回内存。
+    """
+
+    def __init__(self, max_entries: int = 0, spill: Optional[StateStore] = None):
+        self.max_entries = max_entries
+        self.spill = spill
+        self._data: "OrderedDict[Tuple[str, str], str]" = OrderedDict()  # 按最近访问排序
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.spilled = 0
+        self.restored = 0
+
+    def _load(self, kind: str, key: str) -> Optional[str]:
+        """读取记录的JSON文本并标记为最近使用，必要时从spill读回（需持有锁）"""
+        raw = self._data.get((kind, key))
+        if raw is not None:
+            self._data.move_to_end((kind, key))
+            return raw
+        if self.spill is None:
+            return None
+        value = self.spill.get(kind, key)
+        if value is None:
+            return None
+        self.spill.delete(kind, key)
+        self.restored += 1
+        raw = json.dumps(value, ensure_ascii=False)
+        self._store(kind, key, raw)
+        return raw
+
+    def _store(self, kind: str, key: str, raw: str):
+        """写入记录，超出 max_entries 时淘汰最久未访问的记录（需持有锁）"""
+        old = self._data.pop((kind, key), None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._data[(kind, key)] = raw
+        self._bytes += len(raw)
+
+        while self.max_entries and len(self._data) > self.max_entries:
+            (old_kind, old_key), old_raw = self._data.popitem(last=False)
+            self._bytes -= len(old_raw)
+            if self.spill is not None:
+                self.spill.put(old_kind, old_key, json.loads(old_raw))
+                self.spilled += 1
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        with self._lock:
+            raw = self._load(kind, key)
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, kind: str, key: str, value: dict) -> None:
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._store(kind, key, raw)
+
+    def update(self, kind: str, key: str, mutate: Mutator) -> Optional[dict]:
+        with self._lock:
+            raw = self._load(kind, key)
+            if raw is None:
+                return None
+            value = json.loads(raw)
+            mutate(value)
+            self._store(kind, key, json.dumps(value, ensure_ascii=False))
+            return value
+
+    def update_many(self, keys: List[RecordKey], mutate: ManyMutator) -> Dict[RecordKey, Optional[dict]]:
+        with self._lock:
+            records = {}
+            for kind, key in keys:
+                raw = self._load(kind, key)
+                records[(kind, key)] = json.loads(raw) if raw is not None else None
+            mutate(records)
+            for (kind, key), value in records.items():
+                if value is not None:
+                    self._store(kind, key, json.dumps(value, ensure_ascii=False))
+                else:
+                    self._discard(kind, key)
+            return records
+
+    def _discard(self, kind: str, key: str) -> bool:
+        """删除记录（需持有锁）"""
+        raw = self._data.pop((kind, key), None)
+        if raw is not None:
+            self._bytes -= len(raw)
+            return True
+        return self.spill.delete(kind, key) if self.spill is not None else False
+
+    def delete(self, kind: str, key: str) -> bool:
+        with self._lock:
+            return self._discard(kind, key)
+
+    def keys(self, kind: str) -> List[str]:
+        with self._lock:
+            keys = [key for record_kind, key in self._data if record_kind == kind]
+        if self.spill is not None:
+            keys.extend(self.spill.keys(kind))
+        return keys
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            counts = Counter(kind for kind, _ in self._data)
+            stats = {
+                "backend": "memory",
+                "entries": dict(counts),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "spilled": self.spilled,
+                "restored": self.restored
+            }
+        if self.spill is not None:
+            stats["spill"] = self.spill.stats()
+        return stats
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite状态存储
+
+    使用WAL模式，读写互不阻塞，同一台机器上的多个worker进程共享一个数据库文件。
+    每个线程使用独立连接；update 在 BEGIN IMMEDIATE 事务中读-改-写，
+    同一时刻只有一个写者，跨进程也是原子的。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+    """
+
+    UPSERT = """
+        INSERT INTO records (kind, key, updated_at, data) VALUES (?, ?, ?, ?)
+        ON CONFLICT(kind, key) DO UPDATE SET
+            updated_at = excluded.updated_at,
+            data = excluded.data
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT data FROM records WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, kind: str, key: str, value: dict) -> None:
+        self._connection().execute(
+            self.UPSERT, (kind, key, time.time(), json.dumps(value, ensure_ascii=False))
+        )
+
+    def update(self, kind: str, key: str, mutate: Mutator) -> Optional[dict]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM records WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            value = json.loads(row[0])
+            mutate(value)
+            conn.execute(
+                "UPDATE records SET updated_at = ?, data = ? WHERE kind = ? AND key = ?",
+                (time.time(), json.dumps(value, ensure_ascii=False), kind, key)
+            )
+            conn.execute("COMMIT")
+            return value
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update_many(self, keys: List[RecordKey], mutate: ManyMutator) -> Dict[RecordKey, Optional[dict]]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            records = {}
+            for kind, key in keys:
+                row = conn.execute(
+                    "SELECT data FROM records WHERE kind = ? AND key = ?", (kind, key)
+                ).fetchone()
+                records[(kind, key)] = json.loads(row[0]) if row else None
+            mutate(records)
+            now = time.time()
+            for (kind, key), value in records.items():
+                if value is not None:
+                    conn.execute(self.UPSERT, (kind, key, now, json.dumps(value, ensure_ascii=False)))
+                else:
+                    conn.execute("DELETE FROM records WHERE kind = ? AND key = ?", (kind, key))
+            conn.execute("COMMIT")
+            return records
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, kind: str, key: str) -> bool:
+        cursor = self._connection().execute(
+            "DELETE FROM records WHERE kind = ? AND key = ?", (kind, key)
+        )
+        return cursor.rowcount > 0
+
+    def exists(self, kind: str, key: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM records WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone() is not None
+
+    def keys(self, kind: str) -> List[str]:
+        rows = self._connection().execute("SELECT key FROM records WHERE kind = ?", (kind,))
+        return [row[0] for row in rows]
+
+    def values(self, kind: str) -> Iterator[dict]:
+        rows = self._connection().execute("SELECT data FROM records WHERE kind = ?", (kind,))
+        for row in rows.fetchall():
+            yield json.loads(row[0])
+
+    def stats(self) -> Dict[str, dict]:
+        rows = self._connection().execute(
+            "SELECT kind, COUNT(*), SUM(LENGTH(data)) FROM records GROUP BY kind"
+        ).fetchall()
+        return {
+            "backend": "sqlite",
+            "entries": {kind: count for kind, count, _ in rows},
+            "bytes": sum(size or 0 for _, _, size in rows)
+        }
+
+
+class RedisStateStore(StateStore):
+    """Redis状态存储（多台实例共享状态）
+
+    每条记录保存为 <prefix>:<kind>:<key> 的JSON字符串，<prefix>:<kind> 集合记录全部key。
+    update 使用 WATCH/MULTI/EXEC 乐观事务，冲突时自动重试。
+    可以传入任意兼容redis-py接口的客户端（例如测试用的fakeredis）。
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "orchestrator", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("使用Redis存储需要安装redis包: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, kind: str, key: str) -> str:
+        return f"{self.prefix}:{kind}:{key}"
+
+    def _index(self, kind: str) -> str:
+        return f"{self.prefix}:{kind}"
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        raw = self.client.get(self._key(kind, key))
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, kind: str, key: str, value: dict) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self._key(kind, key), json.dumps(value, ensure_ascii=False))
+        pipe.sadd(self._index(kind), key)
+        pipe.execute()
+
+    def update(self, kind: str, key: str, mutate: Mutator) -> Optional[dict]:
+        record_key = self._key(kind, key)
+        result = {}
+
+        def transaction(pipe):
+            raw = pipe.get(record_key)
+            if raw is None:
+                result.pop("value", None)
+                return
+            value = json.loads(raw)
+            mutate(value)
+            pipe.multi()
+            pipe.set(record_key, json.dumps(value, ensure_ascii=False))
+            result["value"] = value
+
+        self.client.transaction(transaction, record_key)
+        return result.get("value")
+
+    def update_many(self, keys: List[RecordKey], mutate: ManyMutator) -> Dict[RecordKey, Optional[dict]]:
+        record_keys = [self._key(kind, key) for kind, key in keys]
+        result = {}
+
+        def transaction(pipe):
+            records = {}
+            for (kind, key), record_key in zip(keys, record_keys):
+                raw = pipe.get(record_key)
+                records[(kind, key)] = json.loads(raw) if raw is not None else None
+            mutate(records)
+            pipe.multi()
+            for (kind, key), value in records.items():
+                if value is not None:
+                    pipe.set(self._key(kind, key), json.dumps(value, ensure_ascii=False))
+                    pipe.sadd(self._index(kind), key)
+                else:
+                    pipe.delete(self._key(kind, key))
+                    pipe.srem(self._index(kind), key)
+            result["records"] = records
+
+        self.client.transaction(transaction, *record_keys)
+        return result["records"]
+
+    def delete(self, kind: str, key: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(kind, key))
+        pipe.srem(self._index(kind), key)
+        deleted, _ = pipe.execute()
+        return deleted > 0
+
+    def exists(self, kind: str, key: str) -> bool:
+        return bool(self.client.exists(self._key(kind, key)))
+
+    def keys(self, kind: str) -> List[str]:
+        return [
+            key.decode() if isinstance(key, bytes) else key
+            for key in self.client.smembers(self._index(kind))
+        ]
+
+    def values(self, kind: str) -> Iterator[dict]:
+        keys = self.keys(kind)
+        for start in range(0, len(keys), 100):
+            batch = keys[start:start + 100]
+            for raw in self.client.mget([self._key(kind, key) for key in batch]):
+                if raw is not None:
+                    yield json.loads(raw)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            "backend": "redis",
+            "entries": {kind: self.client.scard(self._index(kind)) for kind in (SESSIONS, PROJECTS, QUOTES, BLOBS)}
+        }
+
+
+def create_state_store(backend: str, path: str = "orchestrator.db",
+                       redis_url: str = "redis://localhost:6379/0",
+                       max_entries: int = 0, spill_path: Optional[str] = None) -> StateStore:
+    """根据配置创建状态存储
+
+    max_entries/spill_path 只对memory后端生效：超出条数的记录按LRU转存到spill_path的SQLite。
+    """
+    if backend == "memory":
+        spill = SQLiteStateStore(spill_path) if max_entries and spill_path else None
+        return MemoryStateStore(max_entries, spill)
+    if backend == "sqlite":
+        return SQLiteStateStore(path)
+    if backend == "redis":
+        return RedisStateStore(redis_url)
+    raise ValueError(f"不支持的状态存储类型: {backend}")
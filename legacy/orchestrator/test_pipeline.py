@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Orchestrator 项目流水线测试
+
+Agent A / Agent B 使用进程内的替身应用（httpx.ASGITransport），不需要启动真实服务：
+创建会话 → 上传图片 → 报价 → 支付 → 签名的支付回调，等待项目完成，检查时间轴、各阶段耗时、
+OCR结果是否直接送入TTS，以及交付结果；需求中同时有文本时，文本的TTS应与OCR并发执行。
+
+用法:
+    python -m pytest test_pipeline.py
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import StreamingResponse
+
+# 状态存储使用内存且不转存到SQLite，导入 main 时不在当前目录创建文件
+os.environ.setdefault("STATE_STORE_BACKEND", "memory")
+os.environ.setdefault("STATE_MAX_ENTRIES", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from pipeline import AgentClient  # noqa: E402
+from reaper import ExpiryHeap  # noqa: E402
+from storage import MemoryStateStore  # noqa: E402
+
+OCR_MARKDOWN = "# 标题\n\n这是**识别**出的文字，见[链接](http://example.com)。"
+OCR_SPEECH_TEXT = "标题\n\n这是 识别 出的文字，见链接。"
+OCR_DELAY = 0.3  # 替身OCR的耗时，用于检查TTS是否与OCR并发
+CALLBACK_SECRET = "test-callback-secret"
+
+
+@pytest.fixture(autouse=True)
+def orchestrator(monkeypatch, tmp_path):
+    """给 main 换上独立的状态存储、blob存储和到期堆，上传和交付文件写入本测试的临时目录"""
+    monkeypatch.chdir(tmp_path)
+    store = MemoryStateStore()
+    monkeypatch.setattr(main, "state_store", store)
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path / "uploads" / "blobs"), store))
+    monkeypatch.setattr(main, "expiry_heap", ExpiryHeap())
+
+
+@pytest.fixture(autouse=True)
+def payment_callback_secret(monkeypatch):
+    monkeypatch.setattr(main, "PAYMENT_CALLBACK_SECRET", CALLBACK_SECRET)
+
+
+def progress_stream(task_id: str, final: dict):
+    """按 0 → 50 → 100 推送进度事件，与 Agent B 的 /task/{id}/events 格式一致"""
+    async def events():
+        for progress in (0, 50):
+            data = {"task_id": task_id, "status": "processing", "progress": progress}
+            yield f"event: progress\ndata: {json.dumps(data)}\n\n"
+            await asyncio.sleep(0.01)
+        yield f"event: progress\ndata: {json.dumps({**final, 'task_id': task_id, 'progress': 100})}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def create_agent_a() -> FastAPI:
+    """Agent A（OCR）替身"""
+    app = FastAPI()
+
+    @app.post("/ocr")
+    async def ocr(file: UploadFile = File(...)):
+        await file.read()
+        return {"task_id": str(uuid.uuid4())}
+
+    @app.get("/task/{task_id}/events")
+    async def events(task_id: str):
+        await asyncio.sleep(OCR_DELAY)
+        return progress_stream(task_id, {"status": "completed"})
+
+    @app.get("/task/{task_id}/result")
+    async def result(task_id: str):
+        return {"markdown": OCR_MARKDOWN, "qc_report": {"score": 95.0}}
+
+    return app
+
+
+def create_agent_b(received: list) -> FastAPI:
+    """Agent B（TTS）替身，记录收到的文本及提交时间"""
+    app = FastAPI()
+
+    @app.post("/tts")
+    async def tts(request: dict):
+        received.append((request["text"], time.perf_counter()))
+        return {"task_id": str(uuid.uuid4()), "status": "pending", "message": "ok", "created_at": "now"}
+
+    @app.get("/task/{task_id}/events")
+    async def events(task_id: str):
+        return progress_stream(task_id, {
+            "status": "completed",
+            "audio_url": f"/task/{task_id}/download",
+            "vtt_url": f"/task/{task_id}/vtt",
+            "duration": 3.2,
+            "qc_report": {"score": 92.0}
+        })
+
+    return app
+
+
+async def wait_for_project(client: httpx.AsyncClient, project_id: str, timeout: float = 10.0) -> dict:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        project = (await client.get(f"/api/v1/projects/{project_id}/status")).json()
+        if project["status"] in ("completed", "failed"):
+            return project
+        await asyncio.sleep(0.05)
+    raise TimeoutError("项目未在规定时间内完成")
+
+
+def create_agent_client(received: list) -> AgentClient:
+    return AgentClient("http://agent-a", "http://agent-b", client=httpx.AsyncClient(mounts={
+        "http://agent-a": httpx.ASGITransport(app=create_agent_a()),
+        "http://agent-b": httpx.ASGITransport(app=create_agent_b(received))
+    }))
+
+
+def orchestrator_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://orchestrator")
+
+
+async def create_payment(client: httpx.AsyncClient, requirements: dict, images: int) -> dict:
+    """创建会话、上传图片、报价并创建支付，返回支付信息"""
+    session_id = (await client.post("/api/v1/sessions", json={})).json()["session_id"]
+    for index in range(images):
+        await client.post("/api/v1/upload", params={"session_id": session_id},
+                          files={"file": (f"page{index + 1}.png", b"\x89PNG fake image %d" % index, "image/png")})
+    quote = (await client.post("/api/v1/quote", json={
+        "session_id": session_id, "requirements": requirements
+    })).json()
+    return (await client.post("/api/v1/payment", json={
+        "session_id": session_id, "quote_id": quote["quote_id"]
+    })).json()
+
+
+async def send_callback(client: httpx.AsyncClient, payment: dict, signature: str = None,
+                        status: str = "paid") -> httpx.Response:
+    """发送支付回调（默认为支付成功），默认使用正确的签名"""
+    body = json.dumps({"project_id": payment["project_id"], "payment_id": payment["payment_id"], "status": status})
+    headers = {}
+    if signature is None:
+        signature = hmac.new(CALLBACK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+    if signature:
+        headers[main.PAYMENT_SIGNATURE_HEADER] = signature
+    return await client.post("/api/v1/payment/callback", content=body, headers=headers)
+
+
+async def run_project(requirements: dict, images: int) -> tuple:
+    """创建会话、上传图片、报价、支付并回调，返回 (项目状态, 交付结果, Markdown内容)"""
+    async with orchestrator_client() as client:
+        payment = await create_payment(client, requirements, images)
+        assert payment["status"] == "pending"
+        response = await send_callback(client, payment)
+        assert response.status_code == 200 and response.json()["started"]
+
+        project = await wait_for_project(client, payment["project_id"])
+        assert project["status"] == "completed", project.get("error_message")
+
+        results = (await client.get(f"/api/v1/projects/{payment['project_id']}/results")).json()["results"]
+        markdown = (await client.get(results["agent_a"]["markdown_file"])).text
+    return project, results, markdown
+
+
+def test_pipeline(monkeypatch):
+    """测试支付后完整执行 OCR → TTS → 交付"""
+    received = []
+    monkeypatch.setattr(main, "agent_client", create_agent_client(received))
+    project, results, markdown = asyncio.run(run_project({}, images=1))
+
+    tracks = results["agent_b"]["tracks"]
+    # OCR结果送入TTS（已去除Markdown标记）
+    assert [text for text, _ in received] == [OCR_SPEECH_TEXT]
+    # Markdown交付文件
+    assert markdown == OCR_MARKDOWN
+    # 音频地址来自Agent B
+    assert len(tracks) == 1 and tracks[0]["audio_file"].startswith(main.AGENT_B_PUBLIC_URL)
+    # 各Agent阶段记录耗时
+    assert all("duration_ms" in item for item in project["timeline"]
+               if item["stage"] in ("agent_a", "agent_b", "delivery"))
+    # 状态中包含工作流节点耗时
+    assert set(project["workflow"]["nodes"]) == {"agent_a", "agent_b", "delivery", "total"}
+
+
+def test_parallel_stages(monkeypatch):
+    """测试需求文本的TTS与OCR并发执行，多张图片逐页送入TTS"""
+    received = []
+    monkeypatch.setattr(main, "agent_client", create_agent_client(received))
+    started = time.perf_counter()
+    project, results, markdown = asyncio.run(run_project({"text": "需求中的文本"}, images=2))
+
+    submitted = {text: at - started for text, at in received}
+    nodes = project["workflow"]["nodes"]
+    # 需求文本与每页OCR结果都已合成
+    assert sorted(text for text, _ in received) == sorted(["需求中的文本", OCR_SPEECH_TEXT, OCR_SPEECH_TEXT])
+    # 需求文本未等待OCR完成
+    assert submitted["需求中的文本"] < OCR_DELAY
+    # 多张图片并发识别
+    assert nodes["agent_a"]["duration_ms"] < 2 * OCR_DELAY * 1000
+    # 每个音轨标明来源
+    assert sorted(track["source"] for track in results["agent_b"]["tracks"]) == ["page1.png", "page2.png", "requirements"]
+    # Markdown按上传顺序合并
+    assert markdown == f"{OCR_MARKDOWN}\n\n{OCR_MARKDOWN}"
+
+
+def test_payment_callback_requires_signature(monkeypatch):
+    """未签名、签名错误的回调被拒绝，项目保持待支付；未配置密钥时不接受回调"""
+    async def run() -> tuple:
+        async with orchestrator_client() as client:
+            payment = await create_payment(client, {"text": "需求中的文本"}, images=0)
+            unsigned = await send_callback(client, payment, signature="")
+            forged = await send_callback(client, payment, signature="0" * 64)
+            monkeypatch.setattr(main, "PAYMENT_CALLBACK_SECRET", "")
+            unconfigured = await send_callback(client, payment)
+            project = (await client.get(f"/api/v1/projects/{payment['project_id']}/status")).json()
+        return unsigned.status_code, forged.status_code, unconfigured.status_code, project["status"]
+
+    assert asyncio.run(run()) == (401, 401, 503, "payment_pending")
+
+
+def test_project_outlives_quote_and_ignores_late_failure(monkeypatch):
+    """报价在回调前被回收，项目仍按创建时的需求执行；项目启动后迟到的失败回调不改变状态"""
+    received = []
+    monkeypatch.setattr(main, "agent_client", create_agent_client(received))
+
+    async def run() -> tuple:
+        async with orchestrator_client() as client:
+            payment = await create_payment(client, {"text": "需求中的文本"}, images=0)
+            project = main.state_store.get(main.PROJECTS, payment["project_id"])
+            main.state_store.delete(main.QUOTES, project["quote_id"])
+
+            await send_callback(client, payment)
+            project = await wait_for_project(client, payment["project_id"])
+            late = await send_callback(client, payment, status="failed")
+            after = (await client.get(f"/api/v1/projects/{payment['project_id']}/status")).json()
+        return project, late.json(), after
+
+    project, late, after = asyncio.run(run())
+    assert project["status"] == "completed", project.get("error_message")
+    assert [text for text, _ in received] == ["需求中的文本"]
+    assert late["started"] is False
+    assert after["status"] == "completed"
+    assert {item["stage"]: item["status"] for item in after["timeline"]}["payment"] == "completed"
+
+
+def test_failed_payment_callback():
+    """待支付的项目收到失败回调后变为失败，之后的成功回调不再启动项目"""
+    async def run() -> tuple:
+        async with orchestrator_client() as client:
+            payment = await create_payment(client, {"text": "需求中的文本"}, images=0)
+            failed = await send_callback(client, payment, status="failed")
+            paid = await send_callback(client, payment)
+            project = (await client.get(f"/api/v1/projects/{payment['project_id']}/status")).json()
+        return failed.json()["started"], paid.json()["started"], project["status"]
+
+    assert asyncio.run(run()) == (False, False, "failed")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
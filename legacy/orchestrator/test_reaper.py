@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Orchestrator 过期记录回收测试
+
+ExpiryHeap：顺延后旧堆项的惰性删除、取消和重建；reap_expired：报价、会话、项目
+三种过期规则，只删除已到期的记录，并释放被删除的会话、项目引用的上传文件。
+
+用法:
+    python -m pytest test_reaper.py
+"""
+
+import hashlib
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+# 状态存储使用内存且不转存到SQLite，导入 main 时不在当前目录创建文件
+os.environ.setdefault("STATE_STORE_BACKEND", "memory")
+os.environ.setdefault("STATE_MAX_ENTRIES", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from reaper import ExpiryHeap  # noqa: E402
+from storage import BLOBS, PROJECTS, QUOTES, SESSIONS, MemoryStateStore  # noqa: E402
+
+HOUR = 3600
+
+
+def test_pop_due_in_deadline_order():
+    heap = ExpiryHeap()
+    heap.schedule(SESSIONS, "late", 30)
+    heap.schedule(QUOTES, "early", 10)
+    heap.schedule(PROJECTS, "middle", 20)
+
+    assert heap.next_deadline() == 10
+    assert heap.pop_due(5) == []
+    assert heap.pop_due(20) == [(QUOTES, "early"), (PROJECTS, "middle")]
+    assert len(heap) == 1
+    assert heap.pop_due(100) == [(SESSIONS, "late")]
+    assert heap.next_deadline() is None
+
+
+def test_extended_deadline_skips_stale_entry():
+    heap = ExpiryHeap()
+    heap.schedule(SESSIONS, "s1", 10)
+    heap.schedule(SESSIONS, "s1", 50)  # 会话再次活跃，顺延
+
+    # 旧堆项仍在堆中，但与最新到期时间不一致，不会弹出
+    assert heap.pop_due(20) == []
+    assert heap.next_deadline() == 50
+    assert len(heap) == 1
+    assert heap.pop_due(50) == [(SESSIONS, "s1")]
+    assert heap.pop_due(100) == []
+
+
+def test_cancel():
+    heap = ExpiryHeap()
+    heap.schedule(PROJECTS, "p1", 10)
+    heap.cancel(PROJECTS, "p1")
+    heap.cancel(PROJECTS, "unknown")
+
+    assert len(heap) == 0
+    assert heap.next_deadline() is None
+    assert heap.pop_due(100) == []
+
+
+def test_frequent_extensions_keep_heap_bounded():
+    heap = ExpiryHeap()
+    for i in range(1000):
+        heap.schedule(SESSIONS, "s1", 10 + i)
+        heap.schedule(SESSIONS, "s2", 5)
+
+    assert len(heap._heap) <= 2 * len(heap) + 64
+    assert heap.pop_due(10 + 998) == [(SESSIONS, "s2")]
+    assert heap.pop_due(10 + 999) == [(SESSIONS, "s1")]
+
+
+@pytest.fixture
+def orchestrator(monkeypatch, tmp_path):
+    """给 main 换上独立的状态存储、blob存储和到期堆，文件写入本测试的临时目录"""
+    monkeypatch.chdir(tmp_path)
+    store = MemoryStateStore()
+    monkeypatch.setattr(main, "state_store", store)
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path / "blobs"), store))
+    monkeypatch.setattr(main, "expiry_heap", ExpiryHeap())
+    return main
+
+
+def iso(seconds_ago: float) -> str:
+    return datetime.fromtimestamp(time.time() - seconds_ago).isoformat()
+
+
+def add_session(idle: float) -> str:
+    session_id = str(uuid.uuid4())
+    session = {"session_id": session_id, "updated_at": iso(idle), "messages": [], "context": {}}
+    main.state_store.put(SESSIONS, session_id, session)
+    main.schedule_expiry(SESSIONS, session_id, session)
+    return session_id
+
+
+def add_upload(session_id: str, content: bytes) -> str:
+    """与上传接口一样，在同一个事务中登记blob引用并加入会话，返回sha256"""
+    digest = hashlib.sha256(content).hexdigest()
+    os.makedirs(main.UPLOAD_DIR, exist_ok=True)
+    part_path = os.path.join(main.UPLOAD_DIR, f"{uuid.uuid4()}.part")
+    with open(part_path, "wb") as f:
+        f.write(content)
+    staged_path = main.blob_store.stage(part_path, digest)
+
+    def add_file(records: dict):
+        file_path, _ = main.blob_store.add_ref(records, digest, staged_path, len(content))
+        records[(SESSIONS, session_id)]["context"].setdefault("files", []).append(
+            {"sha256": digest, "file_path": file_path}
+        )
+
+    records = main.state_store.update_many([(SESSIONS, session_id), main.blob_store.key(digest)], add_file)
+    if records[main.blob_store.key(digest)]["path"] != staged_path:
+        main.blob_store.discard(staged_path, collected=False)
+    return digest
+
+
+def add_project(session_id: str, status: str, finished_ago: float) -> str:
+    project_id = str(uuid.uuid4())
+    session = main.state_store.get(SESSIONS, session_id)
+    project = {
+        "project_id": project_id,
+        "session_id": session_id,
+        "status": status,
+        "created_at": iso(finished_ago + HOUR),
+        "updated_at": iso(finished_ago),
+        "files": session["context"].get("files", [])
+    }
+
+    def create(records: dict):
+        records[(PROJECTS, project_id)] = project
+        for digest in main.record_blobs(PROJECTS, project):
+            main.blob_store.add_ref(records, digest)
+
+    keys = [(PROJECTS, project_id)] + [main.blob_store.key(d) for d in main.record_blobs(PROJECTS, project)]
+    main.state_store.update_many(keys, create)
+    main.schedule_expiry(PROJECTS, project_id, project)
+    return project_id
+
+
+def add_quote(expires_in: float) -> str:
+    quote_id = str(uuid.uuid4())
+    quote = {"quote_id": quote_id, "expires_at": (time.time() + expires_in) * 1000}
+    main.state_store.put(QUOTES, quote_id, quote)
+    main.schedule_expiry(QUOTES, quote_id, quote)
+    return quote_id
+
+
+def blob_refs(digest: str):
+    record = main.state_store.get(BLOBS, digest)
+    return record["refs"] if record is not None else None
+
+
+def blob_file(digest: str) -> str:
+    return main.state_store.get(BLOBS, digest)["path"]
+
+
+def test_quote_ttl(orchestrator):
+    expired = add_quote(-1)
+    valid = add_quote(HOUR)
+
+    assert main.reap_expired() == {QUOTES: 1}
+    assert not main.state_store.exists(QUOTES, expired)
+    assert main.state_store.exists(QUOTES, valid)
+
+
+def test_session_idle_ttl(orchestrator):
+    idle = add_session(main.SESSION_IDLE_TTL + 1)
+    active = add_session(60)
+
+    assert main.reap_expired() == {SESSIONS: 1}
+    assert not main.state_store.exists(SESSIONS, idle)
+    assert main.state_store.exists(SESSIONS, active)
+
+
+def test_project_retention_only_after_finish(orchestrator):
+    session_id = add_session(60)
+    old = main.PROJECT_RETENTION + 1
+    completed = add_project(session_id, "completed", old)
+    failed = add_project(session_id, "failed", old)
+    recent = add_project(session_id, "completed", 60)
+    running = add_project(session_id, "processing", old)
+
+    assert main.reap_expired() == {PROJECTS: 2}
+    assert not main.state_store.exists(PROJECTS, completed)
+    assert not main.state_store.exists(PROJECTS, failed)
+    assert main.state_store.exists(PROJECTS, recent)
+    assert main.state_store.exists(PROJECTS, running)
+    # 进行中的项目不会过期，不在到期堆中
+    assert len(main.expiry_heap) == 2
+
+
+def test_activity_from_another_worker_extends_session(orchestrator):
+    """堆中的到期时间已过，但存储中的会话已被其他worker顺延：不删除，按新的到期时间重新登记"""
+    session_id = add_session(main.SESSION_IDLE_TTL + 1)
+    main.state_store.update(SESSIONS, session_id, lambda s: s.update(updated_at=iso(0)))
+
+    assert main.reap_expired() == {}
+    assert main.state_store.exists(SESSIONS, session_id)
+    assert main.expiry_heap.next_deadline() == pytest.approx(time.time() + main.SESSION_IDLE_TTL, abs=5)
+
+
+def test_reap_pass_deletes_only_expired(orchestrator):
+    idle = add_session(main.SESSION_IDLE_TTL + 1)
+    active = add_session(60)
+    kept_by_project = add_upload(idle, b"also used by a project")
+    project_id = add_project(idle, "processing", 0)
+    only_idle = add_upload(idle, b"only referenced by the idle session")
+    shared = add_upload(idle, b"shared")
+    add_upload(active, b"shared")
+    expired_quote = add_quote(-1)
+    valid_quote = add_quote(HOUR)
+
+    only_idle_path = blob_file(only_idle)
+    assert blob_refs(shared) == 2
+    assert blob_refs(kept_by_project) == 2
+
+    assert main.reap_expired() == {SESSIONS: 1, QUOTES: 1}
+    assert not main.state_store.exists(SESSIONS, idle)
+    assert not main.state_store.exists(QUOTES, expired_quote)
+    assert main.state_store.exists(SESSIONS, active)
+    assert main.state_store.exists(QUOTES, valid_quote)
+    assert main.state_store.exists(PROJECTS, project_id)
+
+    # 只被过期会话引用的文件随会话一起删除；仍被其他会话或项目引用的文件保留
+    assert blob_refs(only_idle) is None
+    assert not os.path.exists(only_idle_path)
+    assert blob_refs(shared) == 1
+    assert os.path.exists(blob_file(shared))
+    assert blob_refs(kept_by_project) == 1
+    assert os.path.exists(blob_file(kept_by_project))
+
+    # 再次回收没有新的到期记录
+    assert main.reap_expired() == {}
+
+
+def test_reaped_project_releases_last_reference(orchestrator):
+    session_id = add_session(main.SESSION_IDLE_TTL + 1)
+    digest = add_upload(session_id, b"page")
+    path = blob_file(digest)
+    project_id = add_project(session_id, "completed", main.PROJECT_RETENTION + 1)
+
+    assert main.reap_expired() == {SESSIONS: 1, PROJECTS: 1}
+    assert not main.state_store.exists(PROJECTS, project_id)
+    assert blob_refs(digest) is None
+    assert not os.path.exists(path)
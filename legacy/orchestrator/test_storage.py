@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Orchestrator 状态存储测试
+
+同一组约定分别在三种后端上运行：memory（限制条数，超出的记录按LRU转存到SQLite）、
+sqlite（BEGIN IMMEDIATE事务）和redis（WATCH/MULTI乐观事务，使用fakeredis），
+包括两个线程并发 update 同一条记录，以及两个进程并发写同一个SQLite文件。
+
+用法:
+    python -m pytest test_storage.py
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import (  # noqa: E402
+    BLOBS, PROJECTS, QUOTES, SESSIONS, MemoryStateStore, RedisStateStore, SQLiteStateStore, StateStore
+)
+
+CONCURRENT_UPDATES = 200  # 每个线程/进程的自增次数
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def connect(request, tmp_path):
+    """返回一个函数，每次调用得到连接到同一份数据的存储（每个线程各用一个）"""
+    if request.param == "memory":
+        store = MemoryStateStore(max_entries=3, spill=SQLiteStateStore(str(tmp_path / "spill.db")))
+        return lambda: store
+    if request.param == "sqlite":
+        path = str(tmp_path / "state.db")
+        return lambda: SQLiteStateStore(path)
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return lambda: RedisStateStore(client=fakeredis.FakeRedis(server=server))
+
+
+@pytest.fixture
+def store(connect):
+    return connect()
+
+
+def increment(record: dict):
+    record["count"] += 1
+
+
+def test_incomplete_backend_cannot_be_created():
+    class PartialStore(StateStore):
+        def get(self, kind, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_put_get_delete(store):
+    assert store.get(SESSIONS, "s1") is None
+    assert not store.exists(SESSIONS, "s1")
+
+    store.put(SESSIONS, "s1", {"session_id": "s1", "messages": ["你好"]})
+    assert store.get(SESSIONS, "s1") == {"session_id": "s1", "messages": ["你好"]}
+    assert store.exists(SESSIONS, "s1")
+    assert store.get(PROJECTS, "s1") is None
+
+    assert store.delete(SESSIONS, "s1")
+    assert not store.delete(SESSIONS, "s1")
+    assert store.get(SESSIONS, "s1") is None
+
+
+def test_get_returns_copy(store):
+    store.put(QUOTES, "q1", {"items": [1]})
+    store.get(QUOTES, "q1")["items"].append(2)
+    assert store.get(QUOTES, "q1") == {"items": [1]}
+
+
+def test_keys_and_values(store):
+    for i in range(5):
+        store.put(SESSIONS, f"s{i}", {"session_id": f"s{i}"})
+    store.put(PROJECTS, "p1", {"project_id": "p1"})
+
+    assert sorted(store.keys(SESSIONS)) == [f"s{i}" for i in range(5)]
+    assert sorted(value["session_id"] for value in store.values(SESSIONS)) == [f"s{i}" for i in range(5)]
+    assert store.keys(PROJECTS) == ["p1"]
+
+
+def test_update(store):
+    store.put(PROJECTS, "p1", {"count": 0})
+    assert store.update(PROJECTS, "p1", increment) == {"count": 1}
+    assert store.get(PROJECTS, "p1") == {"count": 1}
+    assert store.update(PROJECTS, "missing", increment) is None
+    assert not store.exists(PROJECTS, "missing")
+
+
+def test_failed_update_changes_nothing(store):
+    store.put(PROJECTS, "p1", {"count": 0})
+
+    def fail(record: dict):
+        record["count"] = 99
+        raise ValueError("mutate失败")
+
+    with pytest.raises(ValueError):
+        store.update(PROJECTS, "p1", fail)
+    assert store.get(PROJECTS, "p1") == {"count": 0}
+
+
+def test_update_many(store):
+    store.put(SESSIONS, "s1", {"files": []})
+    store.put(BLOBS, "old", {"refs": 1})
+
+    def apply(records: dict):
+        records[(SESSIONS, "s1")]["files"].append("new")
+        records[(BLOBS, "new")] = {"refs": 1}
+        records[(BLOBS, "old")] = None
+
+    records = store.update_many([(SESSIONS, "s1"), (BLOBS, "new"), (BLOBS, "old")], apply)
+    assert records == {(SESSIONS, "s1"): {"files": ["new"]}, (BLOBS, "new"): {"refs": 1}, (BLOBS, "old"): None}
+    assert store.get(SESSIONS, "s1") == {"files": ["new"]}
+    assert store.get(BLOBS, "new") == {"refs": 1}
+    assert store.get(BLOBS, "old") is None
+    assert store.keys(BLOBS) == ["new"]
+
+
+def test_failed_update_many_changes_nothing(store):
+    store.put(SESSIONS, "s1", {"files": []})
+
+    def fail(records: dict):
+        records[(SESSIONS, "s1")]["files"].append("new")
+        records[(BLOBS, "new")] = {"refs": 1}
+        raise ValueError("mutate失败")
+
+    with pytest.raises(ValueError):
+        store.update_many([(SESSIONS, "s1"), (BLOBS, "new")], fail)
+    assert store.get(SESSIONS, "s1") == {"files": []}
+    assert store.get(BLOBS, "new") is None
+
+
+def test_concurrent_update(connect):
+    """两个线程同时自增同一条记录，任何一次修改都不能丢失"""
+    connect().put(PROJECTS, "p1", {"count": 0})
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def worker():
+        store = connect()
+        try:
+            barrier.wait()
+            for _ in range(CONCURRENT_UPDATES):
+                store.update(PROJECTS, "p1", increment)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert connect().get(PROJECTS, "p1") == {"count": 2 * CONCURRENT_UPDATES}
+
+
+def test_concurrent_update_many(connect):
+    """两个线程同时在一个事务里修改两条记录，两条记录始终一致"""
+    store = connect()
+    store.put(SESSIONS, "s1", {"count": 0})
+    store.put(BLOBS, "b1", {"count": 0})
+    barrier = threading.Barrier(2)
+
+    def apply(records: dict):
+        increment(records[(SESSIONS, "s1")])
+        increment(records[(BLOBS, "b1")])
+
+    def worker():
+        handle = connect()
+        barrier.wait()
+        for _ in range(CONCURRENT_UPDATES):
+            handle.update_many([(SESSIONS, "s1"), (BLOBS, "b1")], apply)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get(SESSIONS, "s1") == store.get(BLOBS, "b1") == {"count": 2 * CONCURRENT_UPDATES}
+
+
+def test_memory_spills_least_recently_used(tmp_path):
+    spill = SQLiteStateStore(str(tmp_path / "spill.db"))
+    store = MemoryStateStore(max_entries=2, spill=spill)
+    for i in range(3):
+        store.put(SESSIONS, f"s{i}", {"count": i})
+    store.get(SESSIONS, "s1")
+
+    # s0 最久未访问，被转存
+    assert spill.keys(SESSIONS) == ["s0"]
+    assert store.stats()["spilled"] == 1
+
+    # 再次访问时读回内存，并把当前最久未访问的 s2 转存出去
+    assert store.update(SESSIONS, "s0", increment) == {"count": 1}
+    assert spill.keys(SESSIONS) == ["s2"]
+    assert store.stats()["restored"] == 1
+    assert sorted(store.keys(SESSIONS)) == ["s0", "s1", "s2"]
+    assert store.delete(SESSIONS, "s2")
+    assert spill.keys(SESSIONS) == []
+
+
+def sqlite_worker(path: str, ready, start):
+    store = SQLiteStateStore(path)
+    ready.set()
+    start.wait()
+    for _ in range(CONCURRENT_UPDATES):
+        store.update(PROJECTS, "p1", increment)
+
+
+def test_sqlite_concurrent_processes(tmp_path):
+    """两个进程同时自增同一个数据库文件中的记录（BEGIN IMMEDIATE跨进程串行化写入）"""
+    path = str(tmp_path / "state.db")
+    SQLiteStateStore(path).put(PROJECTS, "p1", {"count": 0})
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    workers = []
+    for _ in range(2):
+        ready = context.Event()
+        process = context.Process(target=sqlite_worker, args=(path, ready, start))
+        process.start()
+        ready.wait(30)
+        workers.append(process)
+    start.set()
+    for process in workers:
+        process.join(60)
+
+    assert [process.exitcode for process in workers] == [0, 0]
+    assert SQLiteStateStore(path).get(PROJECTS, "p1") == {"count": 2 * CONCURRENT_UPDATES}
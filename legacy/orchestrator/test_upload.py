@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Orchestrator 文件上传测试
+
+上传接口流式解析multipart请求体：超过大小上限（声明的Content-Length、分块传输的
+请求体、文件本身）返回413；格式错误的请求体返回400；相同内容只保存一份blob，
+引用计数随会话增加；声明的sha256与内容不一致时返回400，且不留下任何文件或引用。
+
+用法:
+    python -m pytest test_upload.py
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+
+import httpx
+import pytest
+
+# 状态存储使用内存且不转存到SQLite，导入 main 时不在当前目录创建文件
+os.environ.setdefault("STATE_STORE_BACKEND", "memory")
+os.environ.setdefault("STATE_MAX_ENTRIES", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from reaper import ExpiryHeap  # noqa: E402
+from storage import BLOBS, SESSIONS, MemoryStateStore  # noqa: E402
+
+BOUNDARY = "test-boundary"
+UPLOAD_LIMIT = 1024
+CONTENT = b"\x89PNG fake image"
+
+
+@pytest.fixture(autouse=True)
+def orchestrator(monkeypatch, tmp_path):
+    """给 main 换上独立的状态存储、blob存储和到期堆，上传文件写入本测试的临时目录"""
+    monkeypatch.chdir(tmp_path)
+    store = MemoryStateStore()
+    monkeypatch.setattr(main, "state_store", store)
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path / "uploads" / "blobs"), store))
+    monkeypatch.setattr(main, "expiry_heap", ExpiryHeap())
+    monkeypatch.setattr(main, "MAX_UPLOAD_SIZE", UPLOAD_LIMIT)
+    monkeypatch.setattr(main, "MULTIPART_OVERHEAD", UPLOAD_LIMIT)
+
+
+def multipart_body(content: bytes, filename: str = "page.png", field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def upload(session_id: str, body, sha256: str = None,
+           content_type: str = f"multipart/form-data; boundary={BOUNDARY}") -> httpx.Response:
+    """body 为bytes时带Content-Length发送；为bytes列表时以分块传输发送"""
+    params = {"session_id": session_id}
+    if sha256 is not None:
+        params["sha256"] = sha256
+
+    async def chunks():
+        for chunk in body:
+            yield chunk
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://orchestrator") as client:
+            content = body if isinstance(body, bytes) else chunks()
+            return await client.post("/api/v1/upload", params=params, content=content,
+                                     headers={"Content-Type": content_type})
+    return asyncio.run(post())
+
+
+def create_session() -> str:
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://orchestrator") as client:
+            return (await client.post("/api/v1/sessions", json={})).json()["session_id"]
+    return asyncio.run(post())
+
+
+def session_files(session_id: str) -> list:
+    return main.state_store.get(SESSIONS, session_id)["context"].get("files", [])
+
+
+def stored_files() -> list:
+    """上传目录中的全部文件（blob和未清理的临时文件）"""
+    return sorted(
+        os.path.relpath(os.path.join(root, name), main.UPLOAD_DIR)
+        for root, _, names in os.walk(main.UPLOAD_DIR)
+        for name in names
+    )
+
+
+def assert_nothing_stored(session_id: str):
+    assert session_files(session_id) == []
+    assert main.state_store.keys(BLOBS) == []
+    assert stored_files() == []
+
+
+def test_upload_stores_blob():
+    session_id = create_session()
+    response = upload(session_id, multipart_body(CONTENT))
+
+    assert response.status_code == 200
+    file_info = response.json()["file_info"]
+    assert file_info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert file_info["file_size"] == len(CONTENT)
+    assert file_info["original_name"] == "page.png"
+    assert file_info["content_type"] == "image/png"
+    assert not file_info["deduplicated"]
+    with open(file_info["file_path"], "rb") as f:
+        assert f.read() == CONTENT
+    assert [item["sha256"] for item in session_files(session_id)] == [file_info["sha256"]]
+
+
+def test_declared_length_over_limit():
+    session_id = create_session()
+    response = upload(session_id, multipart_body(b"x" * (3 * UPLOAD_LIMIT)))
+
+    assert response.status_code == 413
+    assert_nothing_stored(session_id)
+
+
+def test_chunked_body_over_limit():
+    """没有Content-Length的分块请求体在读取过程中超限"""
+    session_id = create_session()
+    body = multipart_body(b"x" * (3 * UPLOAD_LIMIT))
+    response = upload(session_id, [body[i:i + 256] for i in range(0, len(body), 256)])
+
+    assert response.status_code == 413
+    assert_nothing_stored(session_id)
+
+
+def test_file_over_limit():
+    """请求体在余量之内，但文件本身超过上限"""
+    session_id = create_session()
+    response = upload(session_id, multipart_body(b"x" * (UPLOAD_LIMIT + 1)))
+
+    assert response.status_code == 413
+    assert_nothing_stored(session_id)
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (multipart_body(CONTENT), "application/json"),
+    (multipart_body(CONTENT), "multipart/form-data"),
+    (multipart_body(CONTENT)[:-20], f"multipart/form-data; boundary={BOUNDARY}"),
+    (multipart_body(CONTENT, field="image"), f"multipart/form-data; boundary={BOUNDARY}"),
+    (b"not a multipart body", f"multipart/form-data; boundary={BOUNDARY}")
+], ids=["not-multipart", "no-boundary", "truncated", "no-file-field", "garbage"])
+def test_malformed_multipart(body, content_type):
+    session_id = create_session()
+    response = upload(session_id, body, content_type=content_type)
+
+    assert response.status_code == 400
+    assert_nothing_stored(session_id)
+
+
+def test_duplicate_content_shares_blob():
+    first_session = create_session()
+    second_session = create_session()
+    first = upload(first_session, multipart_body(CONTENT, "a.png")).json()["file_info"]
+    second = upload(second_session, multipart_body(CONTENT, "b.png")).json()["file_info"]
+
+    assert not first["deduplicated"]
+    assert second["deduplicated"]
+    assert second["file_path"] == first["file_path"]
+    assert second["original_name"] == "b.png"
+    assert main.state_store.get(BLOBS, first["sha256"])["refs"] == 2
+    # 只保存了一份，重复上传暂存的副本已丢弃
+    assert stored_files() == [os.path.relpath(first["file_path"], main.UPLOAD_DIR)]
+    assert main.blob_store.stats()["deduplicated_uploads"] == 1
+
+
+def test_declared_sha256_of_stored_content():
+    """声明的sha256已经存储时只核对哈希，不再写入磁盘"""
+    session_id = create_session()
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    first = upload(session_id, multipart_body(CONTENT)).json()["file_info"]
+    second = upload(session_id, multipart_body(CONTENT), sha256=digest.upper()).json()["file_info"]
+
+    assert second["deduplicated"]
+    assert second["file_path"] == first["file_path"]
+    assert main.state_store.get(BLOBS, digest)["refs"] == 2
+    assert len(stored_files()) == 1
+
+
+@pytest.mark.parametrize("stored", [False, True], ids=["new-content", "stored-content"])
+def test_sha256_mismatch(stored):
+    session_id = create_session()
+    other = b"other content"
+    if stored:
+        # 声明的哈希属于已存储的内容，但实际上传的是另一份内容
+        upload(session_id, multipart_body(other))
+    files_before = session_files(session_id)
+    blobs_before = stored_files()
+
+    response = upload(session_id, multipart_body(CONTENT), sha256=hashlib.sha256(other).hexdigest())
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "文件内容与声明的sha256不一致"
+    assert session_files(session_id) == files_before
+    assert stored_files() == blobs_before
+    assert not main.state_store.exists(BLOBS, hashlib.sha256(CONTENT).hexdigest())
+    if stored:
+        assert main.state_store.get(BLOBS, hashlib.sha256(other).hexdigest())["refs"] == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
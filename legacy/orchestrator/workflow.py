@@ -0,0 +1,179 @@
+"""
+Orchestrator 工作流引擎
+阶段以有向无环图声明依赖，没有依赖关系的阶段并发执行；
+上游阶段可以逐项输出（Stream），下游阶段不必等上游全部完成即可开始处理
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+class WorkflowError(Exception):
+    """某个节点执行失败"""
+
+    def __init__(self, node: str, error: BaseException):
+        super().__init__(f"{node}: {error}")
+        self.node = node
+        self.error = error
+
+
+class Stream:
+    """节点逐项输出的异步流
+
+    每个下游节点各自从头完整消费；上游结束后迭代结束，上游失败时迭代抛出异常。
+    """
+
+    def __init__(self):
+        self._items: List[Any] = []
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # 唤醒正在等待的消费者，之后的等待使用新的Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def emit(self, item: Any):
+        self._items.append(item)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        self._closed = True
+        self._error = error
+        self._notify()
+
+    async def __aiter__(self):
+        index = 0
+        while True:
+            while index < len(self._items):
+                yield self._items[index]
+                index += 1
+            if self._closed:
+                if self._error is not None:
+                    raise self._error
+                return
+            await self._changed.wait()
+
+
+class NodeContext:
+    """传给节点函数的上下文：依赖节点的结果、上游输出流和本节点的输出"""
+
+    def __init__(self, node: "Node", results: Dict[str, Any], streams: Dict[str, Stream]):
+        self.node = node
+        self.results = results
+        self._streams = streams
+
+    def stream(self, name: str) -> Stream:
+        if name not in self.node.streams_from:
+            raise KeyError(f"节点 {self.node.name} 没有声明读取 {name} 的输出流")
+        return self._streams[name]
+
+    def emit(self, item: Any):
+        """输出一项中间结果，streams_from 本节点的下游立即可以读取"""
+        self._streams[self.node.name].emit(item)
+
+
+class Node:
+    """工作流节点
+
+    depends_on：这些节点全部完成后才开始，结果可通过 ctx.results 读取；
+    streams_from：与这些节点同时开始，通过 ctx.stream(name) 边产出边消费。
+    """
+
+    def __init__(self, name: str, run: Callable[[NodeContext], Awaitable[Any]],
+                 depends_on: Sequence[str] = (), streams_from: Sequence[str] = ()):
+        self.name = name
+        self.run = run
+        self.depends_on = list(depends_on)
+        self.streams_from = list(streams_from)
+
+
+# 节点状态回调：(节点名, 状态)，状态为 processing / completed / failed / cancelled
+StatusCallback = Callable[[str, str], None]
+
+
+class Workflow:
+    """有向无环图工作流"""
+
+    def __init__(self, nodes: Sequence[Node]):
+        self.nodes = {node.name: node for node in nodes}
+        self.order = self._topological_order()
+        self.timings: Dict[str, dict] = {}
+
+    def _topological_order(self) -> List[str]:
+        """检查依赖是否存在且无环，返回拓扑序"""
+        remaining = {}
+        for node in self.nodes.values():
+            upstream = set(node.depends_on) | set(node.streams_from)
+            unknown = upstream - set(self.nodes)
+            if unknown:
+                raise ValueError(f"节点 {node.name} 依赖了不存在的节点: {sorted(unknown)}")
+            remaining[node.name] = upstream
+
+        order = []
+        while remaining:
+            ready = [name for name, upstream in remaining.items() if not upstream]
+            if not ready:
+                raise ValueError(f"工作流存在循环依赖: {sorted(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for upstream in remaining.values():
+                upstream.difference_update(ready)
+        return order
+
+    async def run(self, on_status: Optional[StatusCallback] = None) -> Dict[str, Any]:
+        """执行工作流，返回各节点的结果；任一节点失败时取消其余节点并抛出WorkflowError"""
+        notify = on_status or (lambda name, status: None)
+        results: Dict[str, Any] = {}
+        streams = {name: Stream() for name in self.nodes}
+        finished = {name: asyncio.Event() for name in self.nodes}
+        started = time.perf_counter()
+        self.timings = {}
+
+        async def execute(node: Node):
+            for dependency in node.depends_on:
+                await finished[dependency].wait()
+
+            begin = time.perf_counter()
+            notify(node.name, "processing")
+            try:
+                output = await node.run(NodeContext(node, results, streams))
+            except asyncio.CancelledError:
+                streams[node.name].close(asyncio.CancelledError())
+                raise
+            except Exception as e:
+                streams[node.name].close(e)
+                raise WorkflowError(node.name, e) from e
+            end = time.perf_counter()
+
+            results[node.name] = output
+            streams[node.name].close()
+            self.timings[node.name] = {
+                "offset_ms": round((begin - started) * 1000),
+                "duration_ms": round((end - begin) * 1000)
+            }
+            finished[node.name].set()
+            notify(node.name, "completed")
+
+        tasks = {asyncio.create_task(execute(self.nodes[name])): name for name in self.order}
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            failed = [task for task in done if task.exception() is not None]
+            if failed:
+                error = failed[0].exception()
+                notify(error.node if isinstance(error, WorkflowError) else tasks[failed[0]], "failed")
+                for task in pending:
+                    task.cancel()
+                    notify(tasks[task], "cancelled")
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise error
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        self.timings["total"] = {"offset_ms": 0, "duration_ms": round((time.perf_counter() - started) * 1000)}
+        return results
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+本地OCR引擎 - Tesseract（pytesseract）+ 多进程
+上传的文件先在主进程中按页解码并归一化（灰度、按目标DPI缩小、去掉EXIF），
+归一化结果按内容哈希缓存；工作进程完成纠偏和识别，按页分批提交，
+识别结果整理为Markdown
+"""
+
+import hashlib
+import importlib.util
+import io
+import math
+import os
+import multiprocessing
+import shutil
+import statistics
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, ImageSequence
+
+DEFAULT_LANG = "chi_sim+eng"
+DEFAULT_DPI = 300
+DEFAULT_MAX_PIXELS = 9_000_000  # 约 A4 @ 300dpi，超过时等比缩小
+LOW_CONFIDENCE = 60  # Tesseract 单词置信度低于此值视为低置信度
+
+# 归一化后的一页：(尺寸, 8位灰度像素)，直接传给工作进程，不必重新编码为PNG
+Page = Tuple[Tuple[int, int], bytes]
+
+
+def estimate_skew(image: Image.Image, max_angle: float = 5.0, sample_size: int = 800) -> float:
+    """估计使文本行恢复水平所需的旋转角度（度，逆时针为正，可直接传给 Image.rotate）
+
+    在缩略图上尝试不同的旋转角度，文字行水平时逐行亮度分布起伏最大（投影方差最大）。
+    先以1°为步长粗搜，再在最优角附近以0.25°细搜。
+    """
+    sample = image.copy()
+    sample.thumbnail((sample_size, sample_size))
+    sample = ImageOps.invert(sample)  # 文字为亮、背景为暗，旋转补的黑边不影响投影
+
+    def score(angle: float) -> float:
+        rotated = sample.rotate(angle, resample=Image.Resampling.BILINEAR)
+        # 缩成一列即得到每行的平均亮度
+        rows = list(rotated.resize((1, rotated.height), Image.Resampling.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        return sum((value - mean) ** 2 for value in rows)
+
+    coarse = [float(angle) for angle in range(-int(max_angle), int(max_angle) + 1)]
+    best = max(coarse, key=score)
+    fine = [best + step * 0.25 for step in range(-3, 4)]
+    return max(fine, key=score)
+
+
+def normalize(image: Image.Image, target_dpi: int = DEFAULT_DPI,
+              max_pixels: int = DEFAULT_MAX_PIXELS) -> Image.Image:
+    """按目标DPI缩小并转为灰度，按EXIF方向摆正后丢弃EXIF等元数据
+
+    传入尚未解码的图片（Image.open 的返回值）：JPEG 通过 draft 直接解码为灰度，
+    并在解码时按 1/2、1/4、1/8 缩小，大尺寸手机照片不必先解码出完整的RGB位图；
+    其他格式解码后先用 reduce 做整数倍缩小，剩余部分再用 LANCZOS 缩放。
+    """
+    # 高于目标DPI的扫描件缩小到目标DPI，未知DPI时只限制总像素数
+    dpi = image.info.get("dpi", (0, 0))[0]
+    scale = target_dpi / dpi if dpi and dpi > target_dpi else 1.0
+    if image.width * image.height * scale * scale > max_pixels:
+        scale = math.sqrt(max_pixels / (image.width * image.height))
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+
+    if image.format == "JPEG":
+        image.draft("L", target)
+    orientation = image.getexif().get(0x0112, 1)  # 5-8 表示需要旋转90°
+    image = ImageOps.exif_transpose(image).convert("L")
+    if orientation in (5, 6, 7, 8):
+        target = target[::-1]
+
+    factor = min(image.width // target[0], image.height // target[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.LANCZOS)
+    image.info.clear()
+    return image
+
+
+def preprocess(image: Image.Image) -> Image.Image:
+    """增强对比度并纠偏，返回适合Tesseract识别的图片"""
+    image = ImageOps.autocontrast(image, cutoff=1)
+    angle = estimate_skew(image)
+    if abs(angle) >= 0.25:
+        image = image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    return image
+
+
+def _is_cjk(ch: str) -> bool:
+    return '\u3040' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af' or '\uff00' <= ch <= '\uffef'
+
+
+def _join(parts: List[str]) -> str:
+    """拼接单词，中日韩文字之间不加空格"""
+    text = ""
+    for part in parts:
+        if text and not (_is_cjk(text[-1]) and _is_cjk(part[0])):
+            text += " "
+        text += part
+    return text
+
+
+def assemble_markdown(data: Dict[str, list]) -> Dict:
+    """把 pytesseract.image_to_data 的输出整理为Markdown
+
+    同一段落（block, par）的行合并为一段，字高明显大于正文的短段落作为标题。
+    """
+    paragraphs = {}  # (block, par) -> {line: [(word, height)]}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        confidences.append(conf)
+        lines = paragraphs.setdefault((data["block_num"][i], data["par_num"][i]), {})
+        lines.setdefault(data["line_num"][i], []).append((word, data["height"][i]))
+
+    line_heights = [
+        max(height for _, height in words)
+        for lines in paragraphs.values() for words in lines.values()
+    ]
+    body_height = statistics.median(line_heights) if line_heights else 0
+
+    blocks = []
+    for lines in paragraphs.values():
+        text = _join([_join([word for word, _ in words]) for words in lines.values()])
+        height = statistics.mean(max(h for _, h in words) for words in lines.values())
+        if len(lines) <= 2 and len(text) <= 60 and body_height and height >= 1.4 * body_height:
+            text = f"## {text}"
+        blocks.append(text)
+
+    return {
+        "markdown": "\n\n".join(blocks),
+        "confidence": round(statistics.mean(confidences) / 100, 4) if confidences else 0.0,
+        "words": len(confidences),
+        "low_confidence_words": sum(1 for conf in confidences if conf < LOW_CONFIDENCE)
+    }
+
+
+def build_qc_report(page: Dict, image: Image.Image) -> Dict:
+    score = round(page["confidence"] * 100, 1)
+    issues, recommendations = [], []
+    if not page["words"]:
+        issues.append("未识别到文字")
+        recommendations.append("请确认图片中包含清晰的文字")
+    elif page["low_confidence_words"] / page["words"] > 0.2:
+        issues.append("部分字符置信度较低")
+    if min(image.size) < 600:
+        recommendations.append("建议提高图像分辨率")
+    return {
+        "score": score,
+        "recognition_accuracy": score,
+        "words": page["words"],
+        "low_confidence_words": page["low_confidence_words"],
+        "issues": issues,
+        "recommendations": recommendations or ["识别质量良好"]
+    }
+
+
+def recognize_page(page: Page, options: Dict) -> Dict:
+    """在工作进程中识别一页归一化后的图片"""
+    import pytesseract
+
+    started = time.perf_counter()
+    try:
+        image = preprocess(Image.frombytes("L", *page))
+        preprocessed = time.perf_counter()
+        data = pytesseract.image_to_data(
+            image, lang=options["lang"],
+            config=f"--psm 3 --dpi {options['target_dpi']}",
+            output_type=pytesseract.Output.DICT
+        )
+    except Exception as e:
+        return {"task_id": str(uuid.uuid4()), "status": "failed", "error": f"OCR识别失败: {str(e)}"}
+    finished = time.perf_counter()
+
+    page = assemble_markdown(data)
+    return {
+        "task_id": str(uuid.uuid4()),
+        "status": "completed",
+        "extracted_text": page["markdown"],
+        "confidence": page["confidence"],
+        "qc_report": build_qc_report(page, image),
+        "timing": {
+            "preprocess_ms": round((preprocessed - started) * 1000),
+            "ocr_ms": round((finished - preprocessed) * 1000)
+        }
+    }
+
+
+def recognize_batch(pages: List[Page], options: Dict) -> List[Dict]:
+    return [recognize_page(page, options) for page in pages]
+
+
+def _init_worker():
+    # 并行由进程池提供，Tesseract 自身的 OpenMP 线程只会互相争抢CPU
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _warm_up_worker(lang: str) -> str:
+    """在工作进程中导入识别依赖，并用空白小图跑一次识别，让语言包进入系统缓存"""
+    import pytesseract
+    pytesseract.image_to_string(Image.new("L", (64, 32), 255), lang=lang)
+    return str(pytesseract.get_tesseract_version())
+
+
+class OCREngine:
+    """基于进程池的Tesseract OCR
+
+    页面按批提交给工作进程，减少序列化和进程间通信的开销；每个工作进程独立完成
+    预处理和识别，吞吐量随CPU核数增长。进程池在首次使用时创建，之后一直复用。
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 4, lang: str = DEFAULT_LANG,
+                 target_dpi: int = DEFAULT_DPI, max_pixels: int = DEFAULT_MAX_PIXELS):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.options = {"lang": lang, "target_dpi": target_dpi, "max_pixels": max_pixels}
+        self.cache = NormalizedImageCache()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        """pytesseract 已安装且能找到 tesseract 可执行文件"""
+        if importlib.util.find_spec("pytesseract") is None:
+            return False
+        import pytesseract
+        return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn：宿主进程（Streamlit）有后台线程，fork 出的子进程可能继承被占用的锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            return self._executor
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """工作进程异常退出后进程池不能再用，丢弃它，下次使用时重新创建"""
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self, timeout: float = 120) -> str:
+        """启动全部工作进程并各完成一次识别，返回 tesseract 版本
+
+        缺少语言包等问题在这里就会暴露，而不是等到第一个用户上传文件时。
+        """
+        pool = self._pool()
+        futures = [pool.submit(_warm_up_worker, self.options["lang"]) for _ in range(self.workers)]
+        _, pending = wait(futures, timeout)
+        if pending:
+            raise TimeoutError(f"{len(pending)} 个OCR工作进程未在 {timeout} 秒内完成预热")
+        try:
+            for future in futures:
+                future.result()  # 任一工作进程预热失败都要暴露
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+        return futures[0].result()
+
+    def check(self):
+        """健康检查：tesseract 仍可用；不提交任务，免得排在识别任务后面
+
+        损坏的进程池由 recognize_many 发现并重建。
+        """
+        if not self.available():
+            raise RuntimeError("找不到 tesseract")
+
+    def load(self, data: bytes) -> List[Page]:
+        """解码并归一化上传的文件，结果按内容哈希缓存"""
+        key = NormalizedImageCache.make_key(data, self.options["target_dpi"], self.options["max_pixels"])
+        pages = self.cache.get(key)
+        if pages is None:
+            pages = load_pages(data, self.options["target_dpi"], self.options["max_pixels"])
+            self.cache.put(key, pages)
+        return pages
+
+    def recognize_many(self, pages: List[Page]) -> List[Dict]:
+        """识别多页归一化后的图片，按输入顺序返回每页的结果"""
+        if not pages:
+            return []
+        # 页数较少时减小批大小，让每个工作进程都分到页
+        size = max(1, min(self.batch_size, math.ceil(len(pages) / self.workers)))
+        batches = [pages[i:i + size] for i in range(0, len(pages), size)]
+        pool = self._pool()
+        try:
+            results = list(pool.map(recognize_batch, batches, repeat(self.options)))
+        except BrokenProcessPool:
+            # 工作进程异常退出（例如被OOM终止），换一个新的进程池重试一次
+            self._discard(pool)
+            results = list(self._pool().map(recognize_batch, batches, repeat(self.options)))
+        return [page for batch in results for page in batch]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+def load_pages(data: bytes, target_dpi: int = DEFAULT_DPI, max_pixels: int = DEFAULT_MAX_PIXELS) -> List[Page]:
+    """把上传的文件解码为逐页归一化的图片：PDF按页渲染，多帧TIFF/GIF按帧拆分，其余为单页"""
+    if data[:5] == b"%PDF-":
+        import pypdfium2
+
+        pages = []
+        pdf = pypdfium2.PdfDocument(data)
+        try:
+            for page in pdf:
+                # 直接以目标DPI渲染灰度位图，超过像素上限时再缩小
+                image = page.render(scale=target_dpi / 72, grayscale=True).to_pil()
+                image = normalize(image, target_dpi, max_pixels)
+                pages.append((image.size, image.tobytes()))
+        finally:
+            pdf.close()
+        return pages
+
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "n_frames", 1) <= 1:
+        image = normalize(image, target_dpi, max_pixels)
+        return [(image.size, image.tobytes())]
+    pages = []
+    for frame in ImageSequence.Iterator(image):
+        frame = normalize(frame.copy(), target_dpi, max_pixels)
+        pages.append((frame.size, frame.tobytes()))
+    return pages
+
+
+class NormalizedImageCache:
+    """按内容哈希缓存归一化后的页面
+
+    同一文件重复识别（例如Streamlit重跑、换一种语言再识别一次）时跳过解码和缩放；
+    按最近使用顺序淘汰，总字节数超过上限时清理最旧的条目。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, List[Page]]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(data: bytes, target_dpi: int, max_pixels: int) -> str:
+        return hashlib.sha256(data).hexdigest() + f":{target_dpi}:{max_pixels}"
+
+    @staticmethod
+    def _size(pages: List[Page]) -> int:
+        return sum(len(pixels) for _, pixels in pages)
+
+    def get(self, key: str) -> Optional[List[Page]]:
+        with self._lock:
+            pages = self._entries.get(key)
+            if pages is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return pages
+
+    def put(self, key: str, pages: List[Page]):
+        size = self._size(pages)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._size(self._entries.pop(key))
+            self._entries[key] = pages
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, old_pages = self._entries.popitem(last=False)
+                self._total_bytes -= self._size(old_pages)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def merge_pages(pages: List[Dict]) -> Dict:
+    """把多页识别结果合并为一个结果，页与页之间以分隔线隔开"""
+    if len(pages) == 1:
+        return pages[0]
+    completed = [page for page in pages if page["status"] == "completed"]
+    if not completed:
+        return pages[0]
+
+    sections = [
+        page["extracted_text"] if page["status"] == "completed" else f"> 第 {index + 1} 页: {page['error']}"
+        for index, page in enumerate(pages)
+    ]
+    words = sum(page["qc_report"]["words"] for page in completed)
+    low_confidence = sum(page["qc_report"]["low_confidence_words"] for page in completed)
+    confidence = sum(page["confidence"] * page["qc_report"]["words"] for page in completed) / words if words else 0.0
+    issues = [f"第 {i + 1} 页: {issue}" for i, page in enumerate(pages) if page["status"] == "completed"
+              for issue in page["qc_report"]["issues"]]
+    issues += [f"第 {i + 1} 页识别失败" for i, page in enumerate(pages) if page["status"] != "completed"]
+    recommendations = sorted({r for page in completed for r in page["qc_report"]["recommendations"]})
+    return {
+        "task_id": str(uuid.uuid4()),
+        "status": "completed",
+        "extracted_text": "\n\n---\n\n".join(sections),
+        "confidence": round(confidence, 4),
+        "pages": len(pages),
+        "qc_report": {
+            "score": round(confidence * 100, 1),
+            "recognition_accuracy": round(confidence * 100, 1),
+            "words": words,
+            "low_confidence_words": low_confidence,
+            "issues": issues,
+            "recommendations": recommendations
+        },
+        "timing": {
+            key: sum(page["timing"][key] for page in completed) for key in ("preprocess_ms", "ocr_ms")
+        }
+    }
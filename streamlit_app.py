@@ -6,16 +6,28 @@ GitHub部署友好的单文件应用
 
 import streamlit as st
 import requests
+import httpx
+import asyncio
+import importlib.util
+import contextlib
+import queue
 import json
 import time
 import uuid
 import os
 import tempfile
 import base64
+import shutil
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 import io
+import hashlib
+import threading
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from ocr_engine import OCREngine, merge_pages
 
 # 页面配置
 st.set_page_config(
@@ -25,593 +37,482 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# 现代化CSS样式 - 基于参考设计的美观界面
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    /* 隐藏Streamlit默认元素 */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    .stDeployButton {visibility: hidden;}
-    
-    /* 全局样式重置 */
-    * {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-    }
-    
-    .main .block-container {
-        padding: 0;
-        max-width: 100%;
-        margin: 0;
-    }
-    
-    body {
-        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-        margin: 0;
-        padding: 0;
-    }
-    
-    /* 顶部导航栏 - 现代化设计 */
-    .modern-nav {
-        background: rgba(255, 255, 255, 0.95);
-        backdrop-filter: blur(10px);
-        border-bottom: 1px solid rgba(0, 0, 0, 0.05);
-        padding: 1rem 2rem;
-        position: fixed;
-        top: 0;
-        left: 0;
-        right: 0;
-        z-index: 1000;
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        animation: slideDown 0.8s ease-out;
-    }
-    
-    @keyframes slideDown {
-        from { transform: translateY(-100%); opacity: 0; }
-        to { transform: translateY(0); opacity: 1; }
-    }
-    
-    .nav-brand {
-        display: flex;
-        align-items: center;
-        gap: 0.75rem;
-        font-size: 1.25rem;
-        font-weight: 700;
-        color: #1a1a1a;
-    }
-    
-    .nav-logo {
-        width: 40px;
-        height: 40px;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        border-radius: 10px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        color: white;
-        font-weight: bold;
-        font-size: 1.1rem;
-        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
-    }
-    
-    .nav-menu {
-        display: flex;
-        gap: 2rem;
-        align-items: center;
-    }
-    
-    .nav-link {
-        color: #64748b;
-        text-decoration: none;
-        font-weight: 500;
-        font-size: 0.95rem;
-        padding: 0.5rem 1rem;
-        border-radius: 8px;
-        transition: all 0.3s ease;
-    }
-    
-    .nav-link:hover {
-        color: #667eea;
-        background: rgba(102, 126, 234, 0.1);
-        transform: translateY(-1px);
-    }
-    
-    .nav-link.admin {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        font-weight: 600;
-    }
-    
-    .nav-link.admin:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 25px rgba(102, 126, 234, 0.4);
-    }
-    
-    /* Hero区域 - 现代化渐变 */
-    .hero-section {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        min-height: 100vh;
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
-        align-items: center;
-        text-align: center;
-        color: white;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .hero-section::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><defs><pattern id="grain" width="100" height="100" patternUnits="userSpaceOnUse"><circle cx="25" cy="25" r="1" fill="white" opacity="0.1"/><circle cx="75" cy="75" r="1" fill="white" opacity="0.1"/><circle cx="50" cy="10" r="1" fill="white" opacity="0.1"/><circle cx="10" cy="60" r="1" fill="white" opacity="0.1"/><circle cx="90" cy="40" r="1" fill="white" opacity="0.1"/></pattern></defs><rect width="100" height="100" fill="url(%23grain)"/></svg>');
-        opacity: 0.3;
-    }
-    
-    .hero-content {
-        position: relative;
-        z-index: 2;
-        animation: fadeInUp 1.2s ease-out;
-    }
-    
-    @keyframes fadeInUp {
-        from { opacity: 0; transform: translateY(50px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    .hero-title {
-        font-size: 3.5rem;
-        font-weight: 700;
-        margin-bottom: 1.5rem;
-        text-shadow: 0 4px 20px rgba(0,0,0,0.3);
-        line-height: 1.2;
-    }
-    
-    .hero-subtitle {
-        font-size: 1.3rem;
-        opacity: 0.95;
-        margin-bottom: 3rem;
-        max-width: 700px;
-        line-height: 1.6;
-        font-weight: 400;
-    }
-    
-    .hero-cta {
-        display: inline-flex;
-        align-items: center;
-        gap: 0.75rem;
-        background: rgba(255, 255, 255, 0.95);
-        color: #667eea;
-        padding: 1.25rem 2.5rem;
-        border-radius: 50px;
-        text-decoration: none;
-        font-weight: 600;
-        font-size: 1.1rem;
-        box-shadow: 0 10px 40px rgba(0,0,0,0.2);
-        transition: all 0.4s ease;
-        backdrop-filter: blur(10px);
-    }
-    
-    .hero-cta:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-        background: white;
-    }
-    
-    /* 主要内容区域 - 现代化网格布局 */
-    .main-content {
-        padding: 4rem 2rem;
-        max-width: 1400px;
-        margin: 0 auto;
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(420px, 1fr));
-        gap: 2rem;
-        animation: fadeIn 1s ease-out 0.3s both;
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(30px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    /* 现代化卡片设计 */
-    .modern-card {
-        background: rgba(255, 255, 255, 0.95);
-        backdrop-filter: blur(10px);
-        border-radius: 20px;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        overflow: hidden;
-        transition: all 0.4s ease;
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        position: relative;
-    }
-    
-    .modern-card:hover {
-        transform: translateY(-8px);
-        box-shadow: 0 20px 60px rgba(0, 0, 0, 0.15);
-    }
-    
-    .modern-card::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 4px;
-        background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-    }
-    
-    .card-header {
-        padding: 2rem 2rem 1rem;
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-    }
-    
-    .card-title {
-        display: flex;
-        align-items: center;
-        gap: 0.75rem;
-        font-size: 1.25rem;
-        font-weight: 600;
-        color: #1a1a1a;
-    }
-    
-    .card-icon {
-        font-size: 1.5rem;
-        width: 48px;
-        height: 48px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        border-radius: 12px;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.3);
-    }
-    
-    .status-badge {
-        padding: 0.5rem 1rem;
-        border-radius: 20px;
-        font-size: 0.85rem;
-        font-weight: 600;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    .status-connected {
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        color: white;
-        box-shadow: 0 4px 15px rgba(16, 185, 129, 0.3);
-    }
-    
-    .status-pending {
-        background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-        color: white;
-        box-shadow: 0 4px 15px rgba(245, 158, 11, 0.3);
-    }
-    
-    .card-body {
-        padding: 0 2rem 2rem;
-    }
-    
-    /* 聊天界面现代化 */
-    .chat-container {
-        height: 350px;
-        overflow-y: auto;
-        padding: 1.5rem;
-        background: linear-gradient(135deg, #f8fafc 0%, #f1f5f9 100%);
-        border-radius: 16px;
-        margin-bottom: 1.5rem;
-        border: 1px solid rgba(0, 0, 0, 0.05);
-    }
-    
-    .chat-container::-webkit-scrollbar {
-        width: 6px;
-    }
-    
-    .chat-container::-webkit-scrollbar-track {
-        background: transparent;
-    }
-    
-    .chat-container::-webkit-scrollbar-thumb {
-        background: rgba(102, 126, 234, 0.3);
-        border-radius: 3px;
-    }
-    
-    .chat-message {
-        margin-bottom: 1.5rem;
-        display: flex;
-        align-items: flex-start;
-        gap: 1rem;
-        animation: messageSlide 0.5s ease-out;
-    }
-    
-    @keyframes messageSlide {
-        from { opacity: 0; transform: translateX(-20px); }
-        to { opacity: 1; transform: translateX(0); }
-    }
-    
-    .chat-message.user {
-        flex-direction: row-reverse;
-    }
-    
-    .chat-message.user .chat-bubble {
-        animation: messageSlideRight 0.5s ease-out;
-    }
-    
-    @keyframes messageSlideRight {
-        from { opacity: 0; transform: translateX(20px); }
-        to { opacity: 1; transform: translateX(0); }
-    }
-    
-    .chat-avatar {
-        width: 40px;
-        height: 40px;
-        border-radius: 12px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.1rem;
-        font-weight: 600;
-        flex-shrink: 0;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    }
-    
-    .chat-avatar.user {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-    }
-    
-    .chat-avatar.assistant {
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        color: white;
-    }
-    
-    .chat-bubble {
-        max-width: 75%;
-        padding: 1rem 1.25rem;
-        border-radius: 18px;
-        font-size: 0.95rem;
-        line-height: 1.5;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    }
-    
-    .chat-bubble.user {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border-bottom-right-radius: 6px;
-    }
-    
-    .chat-bubble.assistant {
-        background: white;
-        color: #374151;
-        border: 1px solid rgba(0, 0, 0, 0.05);
-        border-bottom-left-radius: 6px;
-    }
-    
-    /* 现代化按钮样式 */
-    .stButton > button {
-        width: 100%;
-        border-radius: 12px;
-        border: none;
-        padding: 1rem 1.5rem;
-        font-weight: 600;
-        font-size: 0.95rem;
-        transition: all 0.3s ease;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.3);
-        cursor: pointer;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 25px rgba(102, 126, 234, 0.4);
-    }
-    
-    .stButton > button:active {
-        transform: translateY(0);
-    }
-    
-    /* 输入框现代化 */
-    .stTextInput > div > div > input,
-    .stTextArea > div > div > textarea {
-        border-radius: 12px;
-        border: 2px solid rgba(0, 0, 0, 0.05);
-        padding: 1rem;
-        font-size: 0.95rem;
-        background: rgba(255, 255, 255, 0.8);
-        transition: all 0.3s ease;
-    }
-    
-    .stTextInput > div > div > input:focus,
-    .stTextArea > div > div > textarea:focus {
-        border-color: #667eea;
-        box-shadow: 0 0 0 4px rgba(102, 126, 234, 0.1);
-        background: white;
-    }
-    
-    /* 文件上传现代化 */
-    .stFileUploader > div {
-        border-radius: 16px;
-        border: 2px dashed rgba(102, 126, 234, 0.3);
-        padding: 2.5rem;
-        text-align: center;
-        transition: all 0.3s ease;
-        background: linear-gradient(135deg, rgba(102, 126, 234, 0.05) 0%, rgba(118, 75, 162, 0.05) 100%);
-    }
-    
-    .stFileUploader > div:hover {
-        border-color: #667eea;
-        background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-        transform: translateY(-2px);
-    }
-    
-    /* 进度时间轴现代化 */
-    .timeline-item {
-        display: flex;
-        align-items: center;
-        margin-bottom: 1.5rem;
-        padding: 1rem;
-        border-radius: 12px;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .timeline-item.completed {
-        background: linear-gradient(135deg, rgba(16, 185, 129, 0.1) 0%, rgba(5, 150, 105, 0.1) 100%);
-        border: 1px solid rgba(16, 185, 129, 0.2);
-    }
-    
-    .timeline-item.pending {
-        background: linear-gradient(135deg, rgba(245, 158, 11, 0.1) 0%, rgba(217, 119, 6, 0.1) 100%);
-        border: 1px solid rgba(245, 158, 11, 0.2);
-    }
-    
-    .timeline-item.waiting {
-        background: rgba(0, 0, 0, 0.02);
-        border: 1px solid rgba(0, 0, 0, 0.05);
-    }
-    
-    .timeline-icon {
-        width: 48px;
-        height: 48px;
-        border-radius: 12px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.2rem;
-        font-weight: 600;
-        margin-right: 1.5rem;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    }
-    
-    .timeline-icon.completed {
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        color: white;
-    }
-    
-    .timeline-icon.pending {
-        background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-        color: white;
-    }
-    
-    .timeline-icon.waiting {
-        background: #f1f5f9;
-        color: #64748b;
-    }
-    
-    /* 统计卡片 */
-    .stat-card {
-        background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-        padding: 2rem;
-        border-radius: 16px;
-        text-align: center;
-        border: 1px solid rgba(102, 126, 234, 0.2);
-        transition: all 0.3s ease;
-    }
-    
-    .stat-card:hover {
-        transform: translateY(-4px);
-        box-shadow: 0 12px 40px rgba(102, 126, 234, 0.15);
-    }
-    
-    .stat-number {
-        font-size: 2.5rem;
-        font-weight: 700;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-        margin-bottom: 0.5rem;
-    }
-    
-    .stat-label {
-        color: #64748b;
-        font-size: 0.9rem;
-        font-weight: 500;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    /* 响应式设计 */
-    @media (max-width: 768px) {
-        .main-content {
-            grid-template-columns: 1fr;
-            padding: 2rem 1rem;
+# 共享的异步HTTP连接池
+class AsyncHTTPClient:
+    """在Streamlit重跑之间共享的异步HTTP连接池
+
+    httpx.AsyncClient 运行在后台线程的专用事件循环上，keep-alive 连接在重跑之间保留，
+    不会绑定到每次调用后就被 asyncio.run() 关闭的事件循环。
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, max_concurrency: int = 8):
+        self.http2 = importlib.util.find_spec("h2") is not None  # 安装了h2时启用HTTP/2
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-http", daemon=True)
+        self._thread.start()
+        self.run(self._start(max_connections, max_keepalive, max_concurrency))
+
+    async def _start(self, max_connections: int, max_keepalive: int, max_concurrency: int):
+        # 连接池和信号量都要在后台事件循环中创建
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=60.0
+            )
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def run(self, coro, timeout: float = None):
+        """在客户端的事件循环上运行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def post(self, url: str, timeout: httpx.Timeout, **kwargs) -> httpx.Response:
+        """通过连接池发送POST请求，同时进行的请求不超过 max_concurrency 个"""
+        async with self._semaphore:
+            return await self.client.post(url, timeout=timeout, **kwargs)
+
+    async def request(self, method: str, url: str, timeout: httpx.Timeout, **kwargs) -> httpx.Response:
+        async with self._semaphore:
+            return await self.client.request(method, url, timeout=timeout, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, timeout: httpx.Timeout, **kwargs):
+        """通过连接池发送流式请求；响应体读完之前一直占用并发名额"""
+        async with self._semaphore:
+            async with self.client.stream(method, url, timeout=timeout, **kwargs) as response:
+                yield response
+
+    def iterate(self, agen) -> Iterator:
+        """在脚本线程中逐个取出客户端事件循环上异步生成器的结果"""
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(("item", item))
+            except Exception as e:
+                items.put(("error", e))
+            finally:
+                items.put(("done", None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            # 调用方提前停止迭代时取消上游请求，释放连接
+            future.cancel()
+
+    def close(self):
+        self.run(self.client.aclose())
+        # 结束尚未关闭的异步生成器（例如提前停止迭代的回答流），再停止事件循环
+        self.run(self._loop.shutdown_asyncgens())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+# 对话上下文管理
+class ConversationContext:
+    """按token预算截取的对话历史滑动窗口
+
+    最新的几轮对话在 max_tokens 以内原样发送，更早的轮次折叠为一段简短的摘录式摘要。
+    token数缓存在消息字典上（保存在 st.session_state 中），摘要增量扩展，
+    每轮只需对新消息分词。
+    """
+
+    def __init__(self, max_tokens: int = 3000, summary_tokens: int = 400, excerpt_chars: int = 160):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.excerpt_chars = excerpt_chars
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # 未安装tiktoken（或无法下载词表）时使用估算
+            self._encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        # 中日韩字符约1个token，其余约4个字符1个token
+        cjk = sum(1 for ch in text if '\u3040' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af')
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def build(self, messages: List[Dict], state: Dict) -> List[Dict]:
+        """返回要发送的历史：可选的摘要消息加上最新的几轮对话
+
+        state 是每个会话的字典（保存在 st.session_state 中），其中保存摘要。
+        """
+        if state.get("summarized", 0) > len(messages):
+            # 对话被清空后重新开始
+            state.clear()
+        summarized = state.setdefault("summarized", 0)
+        lines = state.setdefault("summary_lines", [])  # [(token数, 摘要行)]
+
+        for message in messages[summarized:]:
+            if "tokens" not in message:
+                message["tokens"] = self.count_tokens(message["content"])
+
+        # 从最新的消息往前取，直到用完窗口预算
+        window_budget = self.max_tokens - self.summary_tokens
+        start = len(messages)
+        used = 0
+        while start > summarized and used + messages[start - 1]["tokens"] <= window_budget:
+            start -= 1
+            used += messages[start]["tokens"]
+
+        # 窗口之外的新消息折叠进摘要，摘要超出预算时丢弃最早的行
+        for message in messages[summarized:start]:
+            line = f"{message['role']}: {' '.join(message['content'].split())[:self.excerpt_chars]}"
+            lines.append((self.count_tokens(line), line))
+        while lines and sum(tokens for tokens, _ in lines) > self.summary_tokens:
+            lines.pop(0)
+        state["summarized"] = start
+
+        history = []
+        if lines:
+            history.append({
+                "role": "system",
+                "content": "Summary of earlier conversation:\n" + "\n".join(line for _, line in lines)
+            })
+        history.extend({"role": m["role"], "content": m["content"]} for m in messages[start:])
+        return history
+
+class LLMError(Exception):
+    """提供商返回了错误响应"""
+
+# LLM路由
+class LLMRouter:
+    """按延迟选择提供商，带熔断器
+
+    为每个提供商保留最近一段时间的延迟（到回答第一段内容为止的时间）和成败记录，
+    按 p50 延迟排序；样本数少于 ``min_samples`` 的提供商排在前面以便测量，
+    一次较慢的首个回答不会让提供商一直排在最后。
+    提供商的 p95 是路由器在对冲（同时请求下一个提供商）之前等待的时间。
+    连续失败 ``failure_threshold`` 次后熔断，``reset_timeout`` 秒内跳过该提供商，
+    之后只放行一个试探请求（半开状态）。
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 5, default_hedge_delay: float = 2.0,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._window = window
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _state(self, provider: str) -> Dict:
+        # 调用方持有锁
+        if provider not in self._stats:
+            self._stats[provider] = {
+                "latencies": deque(maxlen=self._window),
+                "outcomes": deque(maxlen=self._window),
+                "failures": 0,
+                "breaker": "closed",
+                "opened_at": 0.0,
+                "trial": False
+            }
+        return self._stats[provider]
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def available(self, provider: str) -> bool:
+        """熔断器是否放行请求；半开状态下占用唯一的试探名额"""
+        with self._lock:
+            state = self._state(provider)
+            if state["breaker"] == "closed":
+                return True
+            if state["breaker"] == "open" and time.monotonic() - state["opened_at"] >= self.reset_timeout:
+                state["breaker"] = "half_open"
+                state["trial"] = False
+            if state["breaker"] == "half_open" and not state["trial"]:
+                state["trial"] = True
+                return True
+            return False
+
+    def rank(self, providers: List[str]) -> List[str]:
+        """按 p50 从快到慢排列的提供商；样本不足的排在最前"""
+        with self._lock:
+            def key(provider):
+                latencies = list(self._state(provider)["latencies"])
+                if len(latencies) < self.min_samples:
+                    return (False, len(latencies))
+                return (True, self._percentile(latencies, 0.5))
+            return sorted(providers, key=key)
+
+    def hedge_delay(self, provider: str) -> float:
+        """对冲前等待该提供商的时间：样本足够时为其 p95"""
+        with self._lock:
+            latencies = list(self._state(provider)["latencies"])
+        if len(latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return max(0.05, self._percentile(latencies, 0.95))
+
+    def record_success(self, provider: str, latency: float):
+        with self._lock:
+            state = self._state(provider)
+            state["latencies"].append(latency)
+            state["outcomes"].append(True)
+            state.update(failures=0, breaker="closed", trial=False)
+
+    def record_failure(self, provider: str):
+        with self._lock:
+            state = self._state(provider)
+            state["outcomes"].append(False)
+            state["failures"] += 1
+            if state["breaker"] == "half_open" or state["failures"] >= self.failure_threshold:
+                state.update(breaker="open", opened_at=time.monotonic(), trial=False)
+
+    def release(self, provider: str):
+        """请求被取消（对冲落败）时归还半开状态的试探名额"""
+        with self._lock:
+            state = self._state(provider)
+            if state["breaker"] == "half_open":
+                state["trial"] = False
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for provider, state in self._stats.items():
+                latencies = list(state["latencies"])
+                outcomes = list(state["outcomes"])
+                p50 = self._percentile(latencies, 0.5)
+                p95 = self._percentile(latencies, 0.95)
+                result[provider] = {
+                    "requests": len(outcomes),
+                    "error_rate": round(outcomes.count(False) / len(outcomes), 4) if outcomes else 0.0,
+                    "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                    "breaker": state["breaker"]
+                }
+            return result
+
+# LLM服务类
+class LLMService:
+    def __init__(self, http: AsyncHTTPClient):
+        self.http = http
+        self.context = ConversationContext(max_tokens=int(os.getenv('LLM_CONTEXT_TOKENS', 3000)))
+        # 各提供商的超时：连接快速失败，生成内容允许较长的读取时间
+        self.providers = {
+            'mock': {'name': 'Local Mock', 'needsKey': False},
+            # 地址可通过环境变量覆盖，例如指向本地的假SSE服务器做测试
+            'openai': {'name': 'OpenAI GPT', 'needsKey': True,
+                       'url': os.getenv('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions'),
+                       'timeout': httpx.Timeout(60.0, connect=5.0)},
+            'deepseek': {'name': 'DeepSeek', 'needsKey': True,
+                         'url': os.getenv('DEEPSEEK_API_URL', 'https://api.aimlapi.com/v1/chat/completions'),
+                         'timeout': httpx.Timeout(90.0, connect=5.0)},
+            'qianwen': {'name': 'Qianwen', 'needsKey': True,
+                        'url': os.getenv('QIANWEN_API_URL', 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'),
+                        'timeout': httpx.Timeout(60.0, connect=5.0)},
         }
+        # 自动路由（provider='auto'）在配置了密钥的提供商之间选择，密钥来自环境变量
+        self.api_keys = {name: os.getenv(f'{name.upper()}_API_KEY', '') for name in self.providers if name != 'mock'}
+        self.router = LLMRouter()
+        self.hedge = os.getenv('LLM_HEDGE', '1') != '0'
+        self.health = None  # get_services 中设置；路由时跳过健康检查发现不可用的提供商
+    
+    def probe(self, provider: str, timeout: float = 5.0):
+        """通过共享连接池访问提供商的接口；不可用时抛出异常
+
+        不发送API密钥，任何低于500的响应都算可达。连接保留在 keep-alive 池中供之后的请求使用。
+        """
+        url = self.providers[provider]['url']
+        response = self.http.run(self.http.request("GET", url, httpx.Timeout(timeout)), timeout + 1)
+        if response.status_code >= 500:
+            raise LLMError(f"{self.providers[provider]['name']} returned {response.status_code}")
+    
+    def generate(self, message: str, provider: str, api_key: str = None, history: List = None) -> Dict:
+        """供Streamlit脚本线程调用的 generate_response 阻塞封装"""
+        return self.http.run(self.generate_response(message, provider, api_key, history))
+    
+    def stream_response(self, message: str, provider: str, api_key: str = None, history: List = None) -> Iterator[str]:
+        """边生成边逐段返回AI回复
+
+        提供商拒绝请求时抛出 LLMError。
+        """
+        if provider == 'mock':
+            yield from self._mock_stream(message)
+            return
         
-        .hero-title {
-            font-size: 2.5rem;
-        }
+        if provider == 'auto':
+            yield from self.http.iterate(self._route_stream(message, history or []))
+            return
         
-        .hero-subtitle {
-            font-size: 1.1rem;
-        }
+        if not api_key and self.providers[provider]['needsKey']:
+            raise LLMError("API key required")
         
-        .nav-menu {
-            display: none;
-        }
+        yield from self.http.iterate(self._provider_stream(provider, message, api_key, history or []))
+    
+    def _provider_stream(self, provider: str, message: str, api_key: str, history: List):
+        """逐段产出单个提供商回答的异步生成器；失败时抛出异常"""
+        if provider == 'openai':
+            return self._stream_chat('openai', 'OpenAI', 'gpt-3.5-turbo', message, api_key, history)
+        if provider == 'deepseek':
+            return self._stream_chat('deepseek', 'DeepSeek', 'deepseek-chat', message, api_key, history)
+        return self._qianwen_stream(message, api_key, history)
+    
+    async def _qianwen_stream(self, message: str, api_key: str, history: List):
+        # 非OpenAI兼容的接口不支持SSE，整段返回
+        response = await self._call_qianwen(message, api_key, history)
+        if "error" in response:
+            raise LLMError(response["error"])
+        yield response["content"]
+    
+    async def _route_stream(self, message: str, history: List):
+        """由最快的可用提供商回答
+
+        提供商在其 p95 延迟内还没有开始回答时，同时请求下一个提供商（对冲），先回答的胜出，
+        另一个请求被取消。提供商在开始回答之前失败时，立即换下一个提供商。
+        """
+        candidates = [name for name, key in self.api_keys.items()
+                      if key and not (self.health and self.health.is_degraded(name))]
+        order = self.router.rank(candidates)
+        results = asyncio.Queue()
+        tasks = {}
+        running = set()
+        errors = []
+        loop = asyncio.get_running_loop()
         
-        .modern-nav {
-            padding: 1rem;
+        async def run(provider: str):
+            started = loop.time()
+            answered = False
+            stream = self._provider_stream(provider, message, self.api_keys[provider], history)
+            try:
+                async for piece in stream:
+                    if not answered:
+                        answered = True
+                        self.router.record_success(provider, loop.time() - started)
+                    await results.put((provider, "item", piece))
+            except asyncio.CancelledError:
+                if not answered:
+                    self.router.release(provider)
+                raise
+            except Exception as e:
+                if not answered:
+                    self.router.record_failure(provider)
+                await results.put((provider, "error", e))
+            else:
+                await results.put((provider, "done", None))
+            finally:
+                # 被取消时立即关闭上游请求，释放连接
+                await stream.aclose()
+        
+        def launch() -> Optional[str]:
+            # 启动排在最前、熔断器允许通过的提供商
+            while order:
+                provider = order.pop(0)
+                if self.router.available(provider):
+                    tasks[provider] = asyncio.create_task(run(provider))
+                    running.add(provider)
+                    return provider
+            return None
+        
+        current = launch()
+        if current is None:
+            raise LLMError("No LLM provider available")
+        winner = None
+        try:
+            while True:
+                hedge_after = self.router.hedge_delay(current) if winner is None and self.hedge and order else None
+                try:
+                    provider, kind, value = await asyncio.wait_for(results.get(), hedge_after)
+                except asyncio.TimeoutError:
+                    current = launch() or current
+                    continue
+                
+                if winner is None and kind != "error":
+                    # 第一个开始回答的提供商胜出，取消其他请求
+                    winner = provider
+                    for other, task in tasks.items():
+                        if other != winner:
+                            task.cancel()
+                
+                if provider == winner:
+                    if kind == "item":
+                        yield value
+                    elif kind == "done":
+                        return
+                    else:
+                        raise LLMError(f"{self.providers[provider]['name']} failed mid-answer: {value}")
+                elif kind == "error":
+                    errors.append(f"{self.providers[provider]['name']}: {value}")
+                    running.discard(provider)
+                    if not running:
+                        current = launch()
+                        if current is None:
+                            raise LLMError("All LLM providers failed: " + "; ".join(errors))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+    
+    def _mock_stream(self, message: str, delay: float = 0.03) -> Iterator[str]:
+        """逐词回放模拟回复"""
+        content = self._mock_response(message)["content"]
+        for word in content.split(" "):
+            yield word + " "
+            time.sleep(delay)
+    
+    async def _stream_chat(self, provider: str, label: str, model: str, message: str, api_key: str, history: List):
+        """从OpenAI兼容的 chat completions 接口流式读取增量内容（SSE）"""
+        messages = [{"role": "system", "content": "You are an AI assistant for a workflow platform, specializing in OCR and TTS tasks."}]
+        messages.extend(history)
+        messages.append({"role": "user", "content": message})
+        
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
         }
-    }
-    
-    /* 加载动画 */
-    @keyframes pulse {
-        0%, 100% { opacity: 1; }
-        50% { opacity: 0.5; }
-    }
-    
-    .loading {
-        animation: pulse 2s infinite;
-    }
-    
-    /* 成功/错误消息样式 */
-    .stSuccess {
-        background: linear-gradient(135deg, rgba(16, 185, 129, 0.1) 0%, rgba(5, 150, 105, 0.1) 100%);
-        border: 1px solid rgba(16, 185, 129, 0.3);
-        border-radius: 12px;
-        color: #065f46;
-    }
-    
-    .stError {
-        background: linear-gradient(135deg, rgba(239, 68, 68, 0.1) 0%, rgba(220, 38, 38, 0.1) 100%);
-        border: 1px solid rgba(239, 68, 68, 0.3);
-        border-radius: 12px;
-        color: #991b1b;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# LLM服务类
-class LLMService:
-    def __init__(self):
-        self.providers = {
-            'mock': {'name': 'Local Mock', 'needsKey': False},
-            'openai': {'name': 'OpenAI GPT', 'needsKey': True, 'url': 'https://api.openai.com/v1/chat/completions'},
-            'deepseek': {'name': 'DeepSeek', 'needsKey': True, 'url': 'https://api.aimlapi.com/v1/chat/completions'},
-            'qianwen': {'name': 'Qianwen', 'needsKey': True, 'url': 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'},
+        
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 1000,
+            "temperature": 0.7,
+            "stream": True
         }
+        
+        config = self.providers[provider]
+        async with self.http.stream("POST", config['url'], config['timeout'], headers=headers, json=data) as response:
+            if response.status_code != 200:
+                raise LLMError(f"{label} API Error: {response.status_code}")
+            
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                choices = json.loads(payload).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
     
     async def generate_response(self, message: str, provider: str, api_key: str = None, history: List = None) -> Dict:
         """Generate AI response"""
         if provider == 'mock':
             return self._mock_response(message)
         
+        if provider == 'auto':
+            try:
+                return {"content": "".join([piece async for piece in self._route_stream(message, history or [])])}
+            except Exception as e:
+                return {"error": f"API call failed: {str(e)}"}
+        
         if not api_key and self.providers[provider]['needsKey']:
             return {"error": "API key required"}
         
@@ -663,7 +564,8 @@ class LLMService:
             "temperature": 0.7
         }
         
-        response = requests.post(self.providers['openai']['url'], headers=headers, json=data)
+        provider = self.providers['openai']
+        response = await self.http.post(provider['url'], provider['timeout'], headers=headers, json=data)
         
         if response.status_code == 200:
             result = response.json()
@@ -689,7 +591,8 @@ class LLMService:
             "temperature": 0.7
         }
         
-        response = requests.post(self.providers['deepseek']['url'], headers=headers, json=data)
+        provider = self.providers['deepseek']
+        response = await self.http.post(provider['url'], provider['timeout'], headers=headers, json=data)
         
         if response.status_code == 200:
             result = response.json()
@@ -697,9 +600,133 @@ class LLMService:
         else:
             return {"error": f"DeepSeek API Error: {response.status_code}"}
 
+    async def _call_qianwen(self, message: str, api_key: str, history: List) -> Dict:
+        """调用千问（DashScope文本生成）API"""
+        messages = [{"role": "system", "content": "You are an AI assistant for a workflow platform, specializing in OCR and TTS tasks."}]
+        messages.extend(history)
+        messages.append({"role": "user", "content": message})
+        
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": "qwen-turbo",
+            "input": {"messages": messages},
+            "parameters": {
+                "result_format": "message",
+                "max_tokens": 1000,
+                "temperature": 0.7
+            }
+        }
+        
+        provider = self.providers['qianwen']
+        response = await self.http.post(provider['url'], provider['timeout'], headers=headers, json=data)
+        
+        if response.status_code == 200:
+            result = response.json()
+            return {"content": result['output']['choices'][0]['message']['content']}
+        else:
+            return {"error": f"Qianwen API Error: {response.status_code}"}
+
+# TTS合成缓存
+class TTSCache:
+    """内容寻址的TTS音频磁盘缓存
+
+    以 (text, voice_id, model_id, voice_settings, output_format) 的哈希为键保存音频，
+    相同请求不再重复调用ElevenLabs；按最近使用顺序（文件mtime）淘汰，
+    条目数或总字节数超过上限时清理最旧的条目。
+    """
+    
+    def __init__(self, cache_dir: str, max_entries: int = 500, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> 文件大小，按最近使用排序
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(cache_dir):
+            if name.endswith(".mp3"):
+                path = os.path.join(cache_dir, name)
+                files.append((os.path.getmtime(path), name[:-4], os.path.getsize(path)))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+    
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: Dict, output_format: str) -> str:
+        payload = json.dumps([text, voice_id, model_id, voice_settings, output_format], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+    
+    def get_path(self, key: str) -> Optional[str]:
+        """缓存音频的文件路径，未命中时返回None"""
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return self._path(key)
+    
+    def temp_path(self, key: str) -> str:
+        """缓存目录中的临时文件路径，写完后交给 put_file"""
+        return f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+    
+    def put_file(self, key: str, tmp_path: str) -> str:
+        """把已写好的临时文件移入缓存并按LRU淘汰超出上限的条目，返回缓存文件路径"""
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self._path(key))
+        
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
+        return self._path(key)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
 # TTS服务类
 class TTSService:
+    api_url = "https://api.elevenlabs.io/v1"
+    
     def __init__(self):
+        self.cache = TTSCache(os.path.join(tempfile.gettempdir(), "ai_workflow_tts_cache"))
+        # 复用连接，预热和健康检查打开的连接之后的合成请求也能用上
+        self.session = requests.Session()
         self.voices = {
             "21m00Tcm4TlvDq8ikWAM": "Rachel - 英语女声",
             "AZnzlk1XvdvUeBnXmlld": "Domi - 英语女声", 
@@ -709,6 +736,22 @@ class TTSService:
             "TxGEqnHWrfWFTfGW9XjX": "Josh - 英语男声"
         }
     
+    def probe(self, timeout: float = 5.0):
+        """检查ElevenLabs是否可达；配置了 ELEVENLABS_API_KEY 时顺便刷新语音列表"""
+        api_key = os.getenv('ELEVENLABS_API_KEY')
+        response = self.session.get(f"{self.api_url}/voices", headers={"xi-api-key": api_key} if api_key else {},
+                                    timeout=timeout)
+        if response.status_code >= 500:
+            raise RuntimeError(f"ElevenLabs API错误: {response.status_code}")
+        if api_key and response.status_code == 200:
+            voices = {}
+            for voice in response.json().get("voices", []):
+                labels = voice.get("labels") or {}
+                description = " ".join(filter(None, (labels.get("accent"), labels.get("gender"))))
+                voices[voice["voice_id"]] = f"{voice['name']} - {description}" if description else voice["name"]
+            if voices:
+                self.voices = voices
+    
     def generate_tts_mock(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM") -> Dict:
         """模拟TTS生成"""
         return {
@@ -734,7 +777,7 @@ class TTSService:
         if not api_key:
             return {"error": "需要ElevenLabs API密钥"}
         
-        url = "https://api.elevenlabs.io/v1/text-to-speech/" + voice_id
+        url = f"{self.api_url}/text-to-speech/{voice_id}"
         headers = {
             "xi-api-key": api_key,
             "Content-Type": "application/json"
@@ -751,24 +794,56 @@ class TTSService:
             }
         }
         
+        # 相同文本和参数直接返回缓存的音频
+        cache_key = TTSCache.make_key(text, voice_id, data["model_id"], data["voice_settings"], "mp3")
+        cached_path = self.cache.get_path(cache_key)
+        if cached_path is not None:
+            return {
+                "task_id": str(uuid.uuid4()),
+                "status": "completed",
+                "audio_path": cached_path,
+                "content_type": "audio/mpeg",
+                "cached": True
+            }
+        
+        # 音频边下载边写入缓存目录，不在内存中保留完整的响应
+        tmp_path = self.cache.temp_path(cache_key)
         try:
-            response = requests.post(url, headers=headers, json=data)
-            if response.status_code == 200:
-                return {
-                    "task_id": str(uuid.uuid4()),
-                    "status": "completed",
-                    "audio_data": response.content,
-                    "content_type": "audio/mpeg"
-                }
-            else:
-                return {"error": f"ElevenLabs API错误: {response.status_code}"}
+            with self.session.post(url, headers=headers, json=data, stream=True, timeout=(10, 120)) as response:
+                if response.status_code != 200:
+                    return {"error": f"ElevenLabs API错误: {response.status_code}"}
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+            return {
+                "task_id": str(uuid.uuid4()),
+                "status": "completed",
+                "audio_path": self.cache.put_file(cache_key, tmp_path),
+                "content_type": "audio/mpeg"
+            }
         except Exception as e:
             return {"error": f"TTS生成失败: {str(e)}"}
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
 # OCR服务类
 class OCRService:
-    def __init__(self):
-        pass
+    def __init__(self, engine: Optional[OCREngine] = None):
+        # 未安装Tesseract时退回模拟结果
+        self.engine = engine
+    
+    def extract_text(self, image_data: bytes) -> Dict:
+        """识别上传的图片或PDF；多页文件分批并行OCR"""
+        if self.engine is None:
+            return self.extract_text_mock(image_data)
+        try:
+            pages = self.engine.load(image_data)
+        except Exception as e:
+            return {"task_id": str(uuid.uuid4()), "status": "failed", "error": f"无法读取文件: {str(e)}"}
+        if not pages:
+            return {"task_id": str(uuid.uuid4()), "status": "failed", "error": "文件中没有可识别的页面"}
+        return merge_pages(self.engine.recognize_many(pages))
     
     def extract_text_mock(self, image_data: bytes) -> Dict:
         """模拟OCR文字提取"""
@@ -787,60 +862,653 @@ class OCRService:
             }
         }
 
+# 后台任务执行器
+class JobExecutor:
+    """所有会话共享的有界工作线程池，用于较慢的提供商调用
+
+    脚本线程提交任务后只保存任务ID，界面在自动刷新的片段中查询任务状态，
+    耗时较长的TTS或OCR调用不会占住会话的脚本线程。没有人取走的已完成任务
+    （例如浏览器标签页已关闭）在 ``ttl`` 秒后丢弃。
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, ttl: float = 600.0):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> 任务状态
+
+    def submit(self, kind: str, fn, *args) -> str:
+        """把 fn(*args) 加入队列并返回任务ID"""
+        with self._lock:
+            self._expire()
+            pending = sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise RuntimeError("服务繁忙，请稍后再试")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"id": job_id, "kind": kind, "status": "queued", "submitted_at": time.time()}
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id: str, fn, args):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "running"
+            job["started_at"] = time.time()
+        try:
+            update = {"status": "completed", "result": fn(*args)}
+        except Exception as e:
+            update = {"status": "failed", "error": str(e)}
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(update, finished_at=time.time())
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if now - job.get("finished_at", now) > self.ttl]:
+            del self._jobs[job_id]
+
+    def poll(self, job_id: str) -> Optional[Dict]:
+        """任务状态的快照；任务不存在或已过期时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def collect(self, job_id: str) -> Optional[Dict]:
+        """移除并返回已完成的任务；仍在排队或运行时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in ("queued", "running"):
+                return None
+            return self._jobs.pop(job_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return counts
+
+# 生成结果存储
+class ArtifactStore:
+    """内容寻址的生成结果磁盘存储，所有会话共享
+
+    合成的音频、OCR文本等结果以内容的sha256为ID写入磁盘，会话状态中只保存
+    {"id", "size", "content_type"} 这样的小句柄。超过 ttl 秒未被访问的条目过期，
+    总字节数超过上限时按最近访问顺序淘汰最旧的条目。
+    """
+    
+    def __init__(self, root: str, max_bytes: int = 1024 * 1024 * 1024, ttl: float = 24 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (文件大小, 最近访问时间)，按最近访问排序
+        self._total_bytes = 0
+        self.evictions = 0
+        
+        os.makedirs(root, exist_ok=True)
+        files = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            else:
+                files.append((os.path.getmtime(path), name, os.path.getsize(path)))
+        for mtime, artifact_id, size in sorted(files):
+            self._entries[artifact_id] = (size, mtime)
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+    
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.root, artifact_id)
+    
+    def put(self, data: bytes, content_type: str) -> Dict:
+        """保存一段内容，返回句柄"""
+        tmp_path = os.path.join(self.root, f"{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self._add(tmp_path, hashlib.sha256(data).hexdigest(), content_type)
+    
+    def put_file(self, path: str, content_type: str) -> Dict:
+        """保存一个已有的文件（分块计算哈希，尽量用硬链接避免复制），返回句柄"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        tmp_path = os.path.join(self.root, f"{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        return self._add(tmp_path, digest.hexdigest(), content_type)
+    
+    def _add(self, tmp_path: str, artifact_id: str, content_type: str) -> Dict:
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self._path(artifact_id))
+        with self._lock:
+            if artifact_id in self._entries:
+                self._total_bytes -= self._entries.pop(artifact_id)[0]
+            self._entries[artifact_id] = (size, time.time())
+            self._total_bytes += size
+            self._evict()
+        return {"id": artifact_id, "size": size, "content_type": content_type}
+    
+    def _evict(self):
+        # 先清理过期条目，再按LRU淘汰到上限以内
+        expired_before = time.time() - self.ttl
+        while self._entries:
+            artifact_id, (size, accessed_at) = next(iter(self._entries.items()))
+            if accessed_at >= expired_before and self._total_bytes <= self.max_bytes:
+                break
+            del self._entries[artifact_id]
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(artifact_id))
+            except FileNotFoundError:
+                pass
+    
+    def path(self, handle: Dict) -> Optional[str]:
+        """句柄对应的文件路径，已过期或被淘汰时返回None"""
+        with self._lock:
+            entry = self._entries.get(handle["id"])
+            if entry is None or entry[1] < time.time() - self.ttl:
+                return None
+            self._entries[handle["id"]] = (entry[0], time.time())
+            self._entries.move_to_end(handle["id"])
+        try:
+            os.utime(self._path(handle["id"]))
+        except FileNotFoundError:
+            return None
+        return self._path(handle["id"])
+    
+    def read_text(self, handle: Dict) -> Optional[str]:
+        path = self.path(handle)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "evictions": self.evictions}
+
+# 健康检查
+class HealthMonitor:
+    """后台检查各提供商，把不可用的标记为降级，界面可以直接跳过
+
+    第一轮执行各提供商的预热而不是检查（启动OCR工作进程、建立连接池中的连接、获取语音列表）。
+    之后每 ``interval`` 秒执行一次全部检查，有失败时每 ``retry_interval`` 秒一次。
+    连续失败 ``failure_threshold`` 次的提供商标记为降级，成功一次即恢复。
+    """
+
+    def __init__(self, checks: Dict[str, Any], warm_ups: Dict[str, Any] = None, interval: float = 30.0,
+                 retry_interval: float = 5.0, failure_threshold: int = 2):
+        self.checks = checks
+        self.warm_ups = warm_ups or {}
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self._status = {name: {"status": "unknown", "failures": 0} for name in checks}
+        self._executor = ThreadPoolExecutor(max_workers=len(checks) or 1, thread_name_prefix="health")
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+
+    def start(self) -> "HealthMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        probes = {name: self.warm_ups.get(name, check) for name, check in self.checks.items()}
+        while not self._stopped.is_set():
+            self.run_once(probes)
+            probes = self.checks
+            failing = any(status["failures"] for status in self.snapshot().values())
+            self._stopped.wait(self.retry_interval if failing else self.interval)
+
+    def run_once(self, probes: Dict[str, Any] = None):
+        """并行执行给定的检查（默认全部）并记录结果"""
+        probes = probes or self.checks
+        futures = {name: self._executor.submit(self._probe, probe) for name, probe in probes.items()}
+        for name, future in futures.items():
+            self._record(name, *future.result())
+
+    @staticmethod
+    def _probe(probe):
+        started = time.perf_counter()
+        try:
+            probe()
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return error, (time.perf_counter() - started) * 1000
+
+    def _record(self, name: str, error: Optional[str], latency_ms: float):
+        with self._lock:
+            status = self._status[name]
+            status.update(checked_at=time.time(), latency_ms=round(latency_ms, 1), error=error)
+            if error is None:
+                status.update(status="healthy", failures=0)
+            else:
+                status["failures"] += 1
+                if status["failures"] >= self.failure_threshold:
+                    status["status"] = "degraded"
+
+    def is_degraded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._status and self._status[name]["status"] == "degraded"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
 # 初始化服务
 @st.cache_resource
 def get_services():
+    """共享的服务单例，每个服务器进程只创建一次
+
+    预热和健康检查在后台启动，首次加载页面不必等待。
+    """
+    llm = LLMService(AsyncHTTPClient())
+    tts = TTSService()
+    ocr_engine = OCREngine(
+        workers=int(os.getenv('OCR_WORKERS', 0)) or None,
+        lang=os.getenv('OCR_LANG', 'chi_sim+eng')
+    ) if OCREngine.available() else None
+    
+    # 只检查配置了密钥的提供商，没有密钥的反正不会被选中
+    checks = {name: (lambda name=name: llm.probe(name)) for name, key in llm.api_keys.items() if key}
+    if os.getenv('ELEVENLABS_API_KEY'):
+        checks['elevenlabs'] = tts.probe
+    warm_ups = {}
+    if ocr_engine is not None:
+        checks['ocr'] = ocr_engine.check
+        warm_ups['ocr'] = ocr_engine.warm_up
+    health = HealthMonitor(checks, warm_ups, interval=float(os.getenv('HEALTH_PROBE_INTERVAL', 30))).start()
+    llm.health = health
+    
+    return {
+        'llm': llm,
+        'tts': tts,
+        'health': health,
+        'jobs': JobExecutor(max_workers=int(os.getenv('JOB_WORKERS', 4))),
+        'artifacts': ArtifactStore(
+            os.path.join(tempfile.gettempdir(), "ai_workflow_artifacts"),
+            max_bytes=int(os.getenv('ARTIFACT_MAX_MB', 1024)) * 1024 * 1024,
+            ttl=float(os.getenv('ARTIFACT_TTL_HOURS', 24)) * 3600
+        ),
+        'ocr': OCRService(ocr_engine)
+    }
+
+# 页面静态资源
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# 现代化顶部导航栏
+NAV_HTML = """
+<div class="modern-nav">
+    <div class="nav-brand">
+        <div class="nav-logo">AI</div>
+        <span>AI Workflow</span>
+    </div>
+    <div class="nav-menu">
+        <a href="#" class="nav-link">How it Works</a>
+        <a href="#" class="nav-link">My Orders</a>
+        <a href="/Admin" class="nav-link admin">⚙️ Admin</a>
+    </div>
+    <div style="display: flex; gap: 1rem; align-items: center;">
+        <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">EN</span>
+        <span style="color: #64748b; font-size: 1.1rem;">⭐</span>
+    </div>
+</div>
+"""
+
+# 现代化Hero区域
+HERO_HTML = """
+<div class="hero-section">
+    <div class="hero-content">
+        <h1 class="hero-title">AI Multi-Agent Workflow Platform</h1>
+        <p class="hero-subtitle">From requirement clarification to content delivery, AI Agents make workflows more efficient</p>
+        <a href="#main-content" class="hero-cta">
+            🚀 Start Project
+        </a>
+    </div>
+</div>
+"""
+
+# 现代化底部区域
+FOOTER_HTML = """
+<div style="background: linear-gradient(135deg, rgba(102, 126, 234, 0.05) 0%, rgba(118, 75, 162, 0.05) 100%); padding: 4rem 2rem; margin-top: 3rem;">
+    <div style="max-width: 1200px; margin: 0 auto; display: grid; grid-template-columns: 1fr 1fr; gap: 3rem;">
+        <div class="modern-card" style="padding: 2rem; text-align: center;">
+            <div style="font-size: 2rem; margin-bottom: 1rem;">📥</div>
+            <h3 style="color: #1a1a1a; margin-bottom: 1rem; font-size: 1.3rem; font-weight: 600;">Download Center</h3>
+            <p style="color: #64748b; font-size: 0.95rem; margin-bottom: 2rem; line-height: 1.6;">
+                All project deliverables will be available for download here upon completion
+            </p>
+            <button style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; padding: 1rem 2rem; border-radius: 12px; cursor: not-allowed; opacity: 0.6; font-weight: 600; font-size: 0.95rem; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.2);">
+                📥 Download Project Files
+            </button>
+        </div>
+        <div class="modern-card" style="padding: 2rem; text-align: center;">
+            <div style="font-size: 2rem; margin-bottom: 1rem;">💳</div>
+            <h3 style="color: #1a1a1a; margin-bottom: 1rem; font-size: 1.3rem; font-weight: 600;">Transaction History</h3>
+            <div style="background: linear-gradient(135deg, #f8fafc 0%, #f1f5f9 100%); padding: 1.5rem; border-radius: 12px; border: 1px solid rgba(0, 0, 0, 0.05); margin-top: 1rem;">
+                <div style="display: flex; justify-content: space-between; margin-bottom: 1rem; padding-bottom: 0.75rem; border-bottom: 1px solid rgba(0, 0, 0, 0.05);">
+                    <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">AI Workflow Services</span>
+                    <span style="font-weight: 600; color: #1a1a1a;">$21.00</span>
+                </div>
+                <div style="display: flex; justify-content: space-between;">
+                    <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">Smart Contract Escrow</span>
+                    <span style="font-weight: 600; color: #10b981;">$21.00</span>
+                </div>
+            </div>
+        </div>
+    </div>
+</div>
+"""
+
+def minify_markup(text: str) -> str:
+    """去掉CSS注释，把空白压缩为单行"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    return re.sub(r"\s+", " ", text).strip()
+
+@st.cache_resource
+def page_assets() -> Dict[str, str]:
+    """静态页面内容，每个进程只读取和压缩一次
+
+    每次重跑时各字符串逐字节相同，Streamlit的消息缓存
+    （.streamlit/config.toml 中的 global.minCachedMessageSize）让浏览器复用已有的副本，
+    不必重新接收。样式表带有内容哈希，可以在浏览器中确认 app.css 的当前版本。
+    """
+    with open(os.path.join(STATIC_DIR, "app.css"), encoding="utf-8") as f:
+        css = minify_markup(f.read())
+    version = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
     return {
-        'llm': LLMService(),
-        'tts': TTSService(),
-        'ocr': OCRService()
+        "styles": f'<style data-version="{version}">{css}</style>',
+        "nav": minify_markup(NAV_HTML),
+        "hero": minify_markup(HERO_HTML),
+        "footer": minify_markup(FOOTER_HTML)
     }
 
+# 聊天卡片
+CHAT_WINDOW = 20  # 默认显示的最近消息数，每次"加载更早消息"再多显示这么多
+OCR_EXCERPT_CHARS = 300  # OCR结果消息中保留的摘录长度，全文在结果存储中
+
+def add_message(role: str, content: str, **extra) -> Dict:
+    """追加一条聊天消息；消息ID用作其HTML缓存的键"""
+    message = {"id": uuid.uuid4().hex, "role": role, "content": content, **extra}
+    st.session_state.messages.append(message)
+    return message
+
+def message_content(message: Dict, artifacts: Optional["ArtifactStore"]) -> str:
+    """消息要显示的内容：带结果句柄的消息从结果存储读取全文，读不到时显示摘录"""
+    if artifacts is None or "artifact" not in message:
+        return message["content"]
+    text = artifacts.read_text(message["artifact"])
+    if text is None:
+        return message["content"]
+    return message["template"].replace("{text}", text)
+
+def message_html(message: Dict, content: Optional[str] = None) -> str:
+    content = message["content"] if content is None else content
+    if message["role"] == "user":
+        return f"""
+        <div class="chat-message user">
+            <div class="chat-bubble user">{content}</div>
+            <div class="chat-avatar user">👤</div>
+        </div>
+        """
+    return f"""
+        <div class="chat-message">
+            <div class="chat-avatar assistant">🤖</div>
+            <div class="chat-bubble assistant">{content}</div>
+        </div>
+        """
+
+def render_messages(messages: List[Dict], artifacts: Optional["ArtifactStore"] = None) -> str:
+    """一组消息的HTML，按消息ID复用已缓存的片段
+
+    带结果句柄的消息每次从结果存储读取全文渲染，不缓存，会话中只保留摘录和句柄。
+    """
+    cache = st.session_state.setdefault("message_html", {})
+    parts = []
+    for message in messages:
+        if "id" not in message:
+            message["id"] = uuid.uuid4().hex
+        if "artifact" in message:
+            parts.append(message_html(message, message_content(message, artifacts)))
+            continue
+        if message["id"] not in cache:
+            cache[message["id"]] = message_html(message)
+        parts.append(cache[message["id"]])
+    return "".join(parts)
+
+# 后台任务
+JOB_POLL_INTERVAL = 1.0  # 有任务进行中时刷新状态的间隔（秒）
+
+def submit_job(services: Dict, kind: str, fn, *args, **details) -> Optional[Dict]:
+    """把任务提交到共享执行器，并在会话中保存任务句柄"""
+    try:
+        job_id = services['jobs'].submit(kind, fn, *args)
+    except RuntimeError as e:
+        st.error(f"❌ {str(e)}")
+        return None
+    handle = {"id": job_id, "kind": kind, **details}
+    st.session_state.setdefault("jobs", []).append(handle)
+    return handle
+
+def session_jobs(kind: str) -> List[Dict]:
+    return [handle for handle in st.session_state.get("jobs", []) if handle["kind"] == kind]
+
+def record_project(revenue: float):
+    # 更新admin统计数据
+    if "admin_data" not in st.session_state:
+        st.session_state.admin_data = {"total_projects": 0, "total_revenue": 0}
+    st.session_state.admin_data["total_projects"] = st.session_state.admin_data.get("total_projects", 0) + 1
+    st.session_state.admin_data["total_revenue"] = st.session_state.admin_data.get("total_revenue", 0) + revenue
+
+def finish_ocr(services: Dict, handle: Dict, result: Dict):
+    if result["status"] != "completed":
+        st.session_state.ocr_error = result["error"]
+        return
+    # 识别文本写入结果存储，会话中只保留句柄
+    text = result.pop("extracted_text")
+    result["text"] = services['artifacts'].put(text.encode("utf-8"), "text/markdown")
+    st.session_state.project_data["files"].append({
+        "type": "ocr",
+        "filename": handle["filename"],
+        "result": result
+    })
+    add_message("user", f"Uploaded image file: {handle['filename']}")
+    # 消息中只保存摘录和结果句柄，显示时再读取全文
+    template = f"✅ OCR Recognition Completed!\n\n**Extracted Text:**\n{{text}}\n\n**Quality Score:** {result['qc_report']['score']}/100"
+    excerpt = text if len(text) <= OCR_EXCERPT_CHARS else text[:OCR_EXCERPT_CHARS] + "…"
+    add_message("assistant", template.replace("{text}", excerpt), artifact=result["text"], template=template)
+    record_project(15.00)
+
+def finish_tts(services: Dict, handle: Dict, result: Dict):
+    # 音频移入结果存储，会话中只保留句柄
+    if "audio_path" in result:
+        result["audio"] = services['artifacts'].put_file(result.pop("audio_path"), result["content_type"])
+    st.session_state.tts_result = result
+    if "error" in result:
+        return
+    st.session_state.project_data["files"].append({
+        "type": "tts",
+        "text": handle["text"],
+        "result": result
+    })
+    record_project(8.00)
+
+JOB_HANDLERS = {"ocr": finish_ocr, "tts": finish_tts}
+
+def audio_player(services: Dict, handle: Dict):
+    """从结果存储读取文件的 st.audio"""
+    path = services['artifacts'].path(handle)
+    if path is None:
+        st.caption("🔇 Audio expired")
+    else:
+        st.audio(path, format=handle["content_type"])
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def job_monitor(services: Dict, kind: str, label: str):
+    """本会话某一类任务的进度；其中任一任务完成时重跑页面
+
+    只在会话有这类任务时调用，空闲的会话不会轮询。
+    """
+    finished = []
+    for handle in session_jobs(kind):
+        job = services['jobs'].poll(handle["id"])
+        if job is None:
+            finished.append((handle, {"status": "failed", "error": "任务已过期"}))
+        elif job["status"] in ("queued", "running"):
+            elapsed = time.time() - job["submitted_at"]
+            st.info(f"⏳ {label} ({job['status']}, {elapsed:.0f}s)")
+        else:
+            finished.append((handle, services['jobs'].collect(handle["id"])))
+    
+    if finished:
+        for handle, job in finished:
+            st.session_state.jobs.remove(handle)
+            if job["status"] == "completed":
+                result = job["result"]
+            else:
+                result = {"status": "failed", "error": job["error"]}
+            JOB_HANDLERS[kind](services, handle, result)
+        # 结果会出现在聊天、结果列表等多个卡片中，重跑整个页面
+        st.rerun()
+
+@st.fragment
+def chat_card(services: Dict, config: Dict):
+    """聊天记录、上传和输入框；发送消息只重跑这张卡片"""
+    messages = st.session_state.messages
+    
+    # 只显示最近的一段消息，更早的消息按需加载
+    window = st.session_state.setdefault("chat_window", CHAT_WINDOW)
+    if len(messages) > window:
+        if st.button(f"⬆️ Load older messages ({len(messages) - window})", key="load_older"):
+            window = st.session_state.chat_window = window + CHAT_WINDOW
+    
+    # 聊天容器：窗口内的消息拼成一个元素渲染
+    visible = messages[-window:]
+    chat_container = st.container()
+    with chat_container:
+        st.markdown(f'<div class="chat-container">{render_messages(visible, services["artifacts"])}</div>', unsafe_allow_html=True)
+    
+    # 缓存只保留窗口内的消息
+    cache = st.session_state.message_html
+    if len(cache) > len(visible) + CHAT_WINDOW:
+        st.session_state.message_html = {m["id"]: cache[m["id"]] for m in visible}
+    
+    # 文件上传区域
+    st.markdown("**📁 Upload Files**")
+    uploaded_file = st.file_uploader(
+        "Choose an image file",
+        type=config["supported_formats"],
+        help=f"Supports {', '.join(config['supported_formats']).upper()} formats (Max: {config['max_file_size']}MB)",
+        key="file_uploader"
+    )
+    
+    if uploaded_file is not None:
+        st.success(f"📁 File uploaded: {uploaded_file.name}")
+        
+        if st.button("🔍 Start OCR Recognition", key="ocr_btn", disabled=bool(session_jobs("ocr"))):
+            # 检查文件大小（UploadedFile.size 不需要复制文件内容）
+            file_size_mb = uploaded_file.size / (1024 * 1024)
+            if file_size_mb > config["max_file_size"]:
+                st.error(f"❌ File size ({file_size_mb:.1f}MB) exceeds limit ({config['max_file_size']}MB)")
+            else:
+                # 健康检查发现OCR引擎不可用时直接使用模拟结果，不再等待超时
+                extract_text = services['ocr'].extract_text
+                if services['health'].is_degraded('ocr'):
+                    st.toast("⚠️ OCR engine is unavailable, using simulated results")
+                    extract_text = services['ocr'].extract_text_mock
+                if submit_job(services, "ocr", extract_text, uploaded_file.getvalue(), filename=uploaded_file.name):
+                    # 识别在后台进行，重跑整个页面以显示进度
+                    st.rerun()
+    
+    if "ocr_error" in st.session_state:
+        st.error(f"❌ {st.session_state.pop('ocr_error')}")
+    
+    # 聊天输入
+    st.markdown("**💭 Chat Input**")
+    user_input = st.text_input(
+        "Enter your message:",
+        placeholder="Type your request here...",
+        key="chat_input"
+    )
+    
+    if st.button("Send Message", key="send_message") and user_input:
+        # 只发送预算内的最近几轮，更早的对话以摘要形式带上
+        history = services['llm'].context.build(
+            st.session_state.messages,
+            st.session_state.setdefault("context_state", {})
+        )
+        user_message = add_message("user", user_input)
+        
+        # 在聊天区域中边生成边显示回复
+        with chat_container:
+            st.markdown(render_messages([user_message]), unsafe_allow_html=True)
+            placeholder = st.empty()
+        
+        # 使用admin配置中的LLM设置；健康检查发现提供商不可用时降级到模拟响应
+        provider = config["llm_provider"]
+        if provider != 'mock' and services['health'].is_degraded(provider):
+            st.toast(f"⚠️ {services['llm'].providers[provider]['name']} is unreachable, answering with the local mock")
+            provider = 'mock'
+        
+        ai_response = ""
+        try:
+            for piece in services['llm'].stream_response(
+                user_input, provider, config["llm_api_key"], history
+            ):
+                ai_response += piece
+                placeholder.markdown(
+                    message_html({"role": "assistant", "content": f"{ai_response}▌"}),
+                    unsafe_allow_html=True
+                )
+        except LLMError as e:
+            st.error(str(e))
+        except Exception as e:
+            st.error(f"API call failed: {str(e)}")
+        else:
+            # 在原位置显示最终回复，不必重跑：点击片段内的按钮本来就只重跑聊天卡片
+            placeholder.markdown(render_messages([add_message("assistant", ai_response.strip())]), unsafe_allow_html=True)
+
 def main():
     """主应用函数"""
     services = get_services()
+    assets = page_assets()
+    
+    # 样式和静态区块每次重跑都原样发送，内容不变时浏览器直接使用缓存
+    st.markdown(assets["styles"], unsafe_allow_html=True)
     
     # 现代化顶部导航栏
-    st.markdown("""
-    <div class="modern-nav">
-        <div class="nav-brand">
-            <div class="nav-logo">AI</div>
-            <span>AI Workflow</span>
-        </div>
-        <div class="nav-menu">
-            <a href="#" class="nav-link">How it Works</a>
-            <a href="#" class="nav-link">My Orders</a>
-            <a href="/Admin" class="nav-link admin">⚙️ Admin</a>
-        </div>
-        <div style="display: flex; gap: 1rem; align-items: center;">
-            <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">EN</span>
-            <span style="color: #64748b; font-size: 1.1rem;">⭐</span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(assets["nav"], unsafe_allow_html=True)
     
     # 添加admin页面快速访问按钮
     if st.button("⚙️ Go to Admin Dashboard", key="admin_link", help="Access system configuration and analytics"):
         st.switch_page("pages/1_Admin.py")
     
     # 现代化Hero区域
-    st.markdown("""
-    <div class="hero-section">
-        <div class="hero-content">
-            <h1 class="hero-title">AI Multi-Agent Workflow Platform</h1>
-            <p class="hero-subtitle">From requirement clarification to content delivery, AI Agents make workflows more efficient</p>
-            <a href="#main-content" class="hero-cta">
-                🚀 Start Project
-            </a>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(assets["hero"], unsafe_allow_html=True)
     
     # 从admin配置加载设置
     if "admin_data" not in st.session_state:
         st.session_state.admin_data = {
             "system_config": {
-                "llm_provider": "mock",
+                "llm_provider": os.getenv('LLM_PROVIDER', 'mock'),  # auto：在配置了密钥的提供商之间自动路由
                 "llm_api_key": "",
                 "elevenlabs_api_key": "",
                 "default_voice": "21m00Tcm4TlvDq8ikWAM",
@@ -884,98 +1552,10 @@ def main():
                 <div class="card-body">
             """, unsafe_allow_html=True)
             
-            # 聊天容器
-            chat_container = st.container()
-            with chat_container:
-                st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-                
-                # 显示聊天消息
-                for message in st.session_state.messages:
-                    if message["role"] == "user":
-                        st.markdown(f"""
-                        <div class="chat-message user">
-                            <div class="chat-bubble user">{message["content"]}</div>
-                            <div class="chat-avatar user">👤</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                        <div class="chat-message">
-                            <div class="chat-avatar assistant">🤖</div>
-                            <div class="chat-bubble assistant">{message["content"]}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+            chat_card(services, config)
             
-            # 文件上传区域
-            st.markdown("**📁 Upload Files**")
-            uploaded_file = st.file_uploader(
-                "Choose an image file",
-                type=config["supported_formats"],
-                help=f"Supports {', '.join(config['supported_formats']).upper()} formats (Max: {config['max_file_size']}MB)",
-                key="file_uploader"
-            )
-            
-            if uploaded_file is not None:
-                st.success(f"📁 File uploaded: {uploaded_file.name}")
-                
-                if st.button("🔍 Start OCR Recognition", key="ocr_btn"):
-                    # 检查文件大小
-                    file_size_mb = len(uploaded_file.getvalue()) / (1024 * 1024)
-                    if file_size_mb > config["max_file_size"]:
-                        st.error(f"❌ File size ({file_size_mb:.1f}MB) exceeds limit ({config['max_file_size']}MB)")
-                    else:
-                        with st.spinner("Recognizing text in image..."):
-                            image_data = uploaded_file.read()
-                            ocr_result = services['ocr'].extract_text_mock(image_data)
-                            
-                            if ocr_result["status"] == "completed":
-                                st.session_state.project_data["files"].append({
-                                    "type": "ocr",
-                                    "filename": uploaded_file.name,
-                                    "result": ocr_result
-                                })
-                                
-                                st.session_state.messages.append({
-                                    "role": "user",
-                                    "content": f"Uploaded image file: {uploaded_file.name}"
-                                })
-                                st.session_state.messages.append({
-                                    "role": "assistant", 
-                                    "content": f"✅ OCR Recognition Completed!\n\n**Extracted Text:**\n{ocr_result['extracted_text']}\n\n**Quality Score:** {ocr_result['qc_report']['score']}/100"
-                                })
-                                
-                                # 更新admin统计数据
-                                if "admin_data" not in st.session_state:
-                                    st.session_state.admin_data = {"total_projects": 0, "total_revenue": 0}
-                                st.session_state.admin_data["total_projects"] = st.session_state.admin_data.get("total_projects", 0) + 1
-                                st.session_state.admin_data["total_revenue"] = st.session_state.admin_data.get("total_revenue", 0) + 15.00
-                                
-                                st.rerun()
-            
-            # 聊天输入
-            st.markdown("**💭 Chat Input**")
-            user_input = st.text_input(
-                "Enter your message:",
-                placeholder="Type your request here...",
-                key="chat_input"
-            )
-            
-            if st.button("Send Message", key="send_message") and user_input:
-                st.session_state.messages.append({"role": "user", "content": user_input})
-                
-                with st.spinner("AI is thinking..."):
-                    # 使用admin配置中的LLM设置
-                    if config["llm_provider"] == "mock":
-                        response = services['llm']._mock_response(user_input)
-                    else:
-                        # 对于其他提供商，可以扩展支持
-                        response = services['llm']._mock_response(user_input)
-                    
-                    ai_response = response["content"]
-                    st.session_state.messages.append({"role": "assistant", "content": ai_response})
-                    st.rerun()
+            if session_jobs("ocr"):
+                job_monitor(services, "ocr", "Recognizing text in image...")
             
             st.markdown("""
                 </div>
@@ -1079,48 +1659,43 @@ def main():
                 placeholder="Type or paste your text here..."
             )
             
-            if st.button("🔊 Generate Speech", key="tts_btn") and tts_text:
-                with st.spinner("Generating speech..."):
-                    # 使用admin配置中的设置
-                    if config["elevenlabs_api_key"]:
-                        tts_result = services['tts'].generate_tts_with_elevenlabs(
-                            tts_text, config["default_voice"], config["elevenlabs_api_key"]
-                        )
-                    else:
-                        tts_result = services['tts'].generate_tts_mock(tts_text, config["default_voice"])
-                    
-                    if "error" in tts_result:
-                        st.error(f"❌ {tts_result['error']}")
-                    else:
-                        st.success("✅ Speech generated successfully!")
-                        
-                        # 显示音频播放器（如果有实际音频数据）
-                        if "audio_data" in tts_result:
-                            st.audio(tts_result["audio_data"], format="audio/mp3")
-                        
-                        # 显示QC报告
-                        if "qc_report" in tts_result:
-                            qc = tts_result["qc_report"]
-                            st.markdown(f"""
-                            **QC Quality Report:**
-                            - Overall Score: {qc['score']}/100
-                            - Audio Quality: {qc['audio_quality']}/100
-                            - Text Accuracy: {qc['text_accuracy']}/100
-                            - Voice Consistency: {qc['voice_consistency']}/100
-                            """)
-                        
-                        # 保存到项目数据
-                        st.session_state.project_data["files"].append({
-                            "type": "tts",
-                            "text": tts_text,
-                            "result": tts_result
-                        })
-                        
-                        # 更新admin统计数据
-                        if "admin_data" not in st.session_state:
-                            st.session_state.admin_data = {"total_projects": 0, "total_revenue": 0}
-                        st.session_state.admin_data["total_projects"] = st.session_state.admin_data.get("total_projects", 0) + 1
-                        st.session_state.admin_data["total_revenue"] = st.session_state.admin_data.get("total_revenue", 0) + 8.00
+            if st.button("🔊 Generate Speech", key="tts_btn", disabled=bool(session_jobs("tts"))) and tts_text:
+                # 使用admin配置中的设置；合成在共享的任务执行器中进行
+                use_elevenlabs = bool(config["elevenlabs_api_key"])
+                if use_elevenlabs and services['health'].is_degraded('elevenlabs'):
+                    st.toast("⚠️ ElevenLabs is unreachable, generating a simulated result")
+                    use_elevenlabs = False
+                if use_elevenlabs:
+                    submit_job(services, "tts", services['tts'].generate_tts_with_elevenlabs,
+                               tts_text, config["default_voice"], config["elevenlabs_api_key"], text=tts_text)
+                else:
+                    submit_job(services, "tts", services['tts'].generate_tts_mock,
+                               tts_text, config["default_voice"], text=tts_text)
+            
+            if session_jobs("tts"):
+                job_monitor(services, "tts", "Generating speech...")
+            
+            # 最近一次合成的结果
+            tts_result = st.session_state.get("tts_result")
+            if tts_result and "error" in tts_result:
+                st.error(f"❌ {tts_result['error']}")
+            elif tts_result:
+                st.success("✅ Speech generated successfully!")
+                
+                # 显示音频播放器（如果有实际音频数据）
+                if "audio" in tts_result:
+                    audio_player(services, tts_result["audio"])
+                
+                # 显示QC报告
+                if "qc_report" in tts_result:
+                    qc = tts_result["qc_report"]
+                    st.markdown(f"""
+                    **QC Quality Report:**
+                    - Overall Score: {qc['score']}/100
+                    - Audio Quality: {qc['audio_quality']}/100
+                    - Text Accuracy: {qc['text_accuracy']}/100
+                    - Voice Consistency: {qc['voice_consistency']}/100
+                    """)
             
             st.markdown("""
                 </div>
@@ -1205,10 +1780,13 @@ def main():
                     with st.expander(f"{file_data['type'].upper()} - {file_data.get('filename', f'Task {i+1}')}"):
                         if file_data["type"] == "ocr":
                             st.markdown("**Extracted Text:**")
-                            st.text_area("", value=file_data["result"]["extracted_text"], height=100, disabled=True, key=f"ocr_{i}")
+                            text = services['artifacts'].read_text(file_data["result"]["text"])
+                            st.text_area("", value=text if text is not None else "(expired)", height=100, disabled=True, key=f"ocr_{i}")
                             st.markdown(f"**Confidence:** {file_data['result']['confidence']:.2%}")
                         elif file_data["type"] == "tts":
                             st.markdown(f"**Original Text:** {file_data['text']}")
+                            if "audio" in file_data["result"]:
+                                audio_player(services, file_data["result"]["audio"])
                             if "qc_report" in file_data["result"]:
                                 st.markdown(f"**Quality Score:** {file_data['result']['qc_report']['score']}/100")
             
@@ -1221,36 +1799,7 @@ def main():
     st.markdown('</div>', unsafe_allow_html=True)
     
     # 现代化底部区域
-    st.markdown("""
-    <div style="background: linear-gradient(135deg, rgba(102, 126, 234, 0.05) 0%, rgba(118, 75, 162, 0.05) 100%); padding: 4rem 2rem; margin-top: 3rem;">
-        <div style="max-width: 1200px; margin: 0 auto; display: grid; grid-template-columns: 1fr 1fr; gap: 3rem;">
-            <div class="modern-card" style="padding: 2rem; text-align: center;">
-                <div style="font-size: 2rem; margin-bottom: 1rem;">📥</div>
-                <h3 style="color: #1a1a1a; margin-bottom: 1rem; font-size: 1.3rem; font-weight: 600;">Download Center</h3>
-                <p style="color: #64748b; font-size: 0.95rem; margin-bottom: 2rem; line-height: 1.6;">
-                    All project deliverables will be available for download here upon completion
-                </p>
-                <button style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; padding: 1rem 2rem; border-radius: 12px; cursor: not-allowed; opacity: 0.6; font-weight: 600; font-size: 0.95rem; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.2);">
-                    📥 Download Project Files
-                </button>
-            </div>
-            <div class="modern-card" style="padding: 2rem; text-align: center;">
-                <div style="font-size: 2rem; margin-bottom: 1rem;">💳</div>
-                <h3 style="color: #1a1a1a; margin-bottom: 1rem; font-size: 1.3rem; font-weight: 600;">Transaction History</h3>
-                <div style="background: linear-gradient(135deg, #f8fafc 0%, #f1f5f9 100%); padding: 1.5rem; border-radius: 12px; border: 1px solid rgba(0, 0, 0, 0.05); margin-top: 1rem;">
-                    <div style="display: flex; justify-content: space-between; margin-bottom: 1rem; padding-bottom: 0.75rem; border-bottom: 1px solid rgba(0, 0, 0, 0.05);">
-                        <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">AI Workflow Services</span>
-                        <span style="font-weight: 600; color: #1a1a1a;">$21.00</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between;">
-                        <span style="color: #64748b; font-size: 0.9rem; font-weight: 500;">Smart Contract Escrow</span>
-                        <span style="font-weight: 600; color: #10b981;">$21.00</span>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(assets["footer"], unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
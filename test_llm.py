@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+LLM 服务测试
+
+使用 benchmark_llm.py 中的假提供商（本地HTTP服务器）：OpenAI兼容接口的SSE增量解析、
+千问的整段返回、熔断器打开后自动路由只使用其余提供商、对冲时先回答的提供商胜出，
+以及 ConversationContext 按token预算截取对话历史。
+
+用法:
+    python -m pytest test_llm.py
+"""
+
+import time
+
+import pytest
+
+from benchmark_llm import PROVIDERS, start_provider
+from streamlit_app import AsyncHTTPClient, ConversationContext, LLMError, LLMRouter, LLMService
+
+PROVIDER_PATHS = {
+    "openai": "/v1/chat/completions",
+    "deepseek": "/v1/chat/completions",
+    "qianwen": "/api/v1/services/aigc/text-generation/generation"
+}
+
+
+def answer(name: str) -> str:
+    return f"Answer from {name}: the workflow platform can help with OCR and TTS."
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """返回启动假提供商的函数；只有启动过的提供商配置了密钥，参与自动路由"""
+    servers = []
+    for name in PROVIDERS:
+        monkeypatch.delenv(f"{name.upper()}_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_HEDGE", "1")
+
+    def start(name: str, delay: float = 0.0, fail: bool = False):
+        server = start_provider(name, delay, tail=0.0, tail_factor=1.0, fail=fail)
+        servers.append(server)
+        monkeypatch.setenv(f"{name.upper()}_API_URL", f"http://127.0.0.1:{server.server_port}{PROVIDER_PATHS[name]}")
+        monkeypatch.setenv(f"{name.upper()}_API_KEY", "fake-key")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def create_llm():
+    """在提供商启动之后创建 LLMService（地址和密钥在创建时从环境变量读取）"""
+    services = []
+
+    def create() -> LLMService:
+        llm = LLMService(AsyncHTTPClient())
+        services.append(llm)
+        return llm
+
+    yield create
+    for llm in services:
+        llm.http.close()
+
+
+def test_sse_stream_parsed_into_pieces(providers, create_llm):
+    providers("openai")
+    llm = create_llm()
+
+    pieces = list(llm.stream_response("hello", "openai", api_key="fake-key"))
+
+    # 每个SSE事件一段增量内容，[DONE] 结束
+    assert len(pieces) == len(answer("openai").split(" "))
+    assert "".join(pieces) == answer("openai") + " "
+
+
+def test_provider_error_raises(providers, create_llm):
+    providers("deepseek", fail=True)
+    llm = create_llm()
+
+    with pytest.raises(LLMError, match="500"):
+        list(llm.stream_response("hello", "deepseek", api_key="fake-key"))
+    assert "error" in llm.generate("hello", "deepseek", api_key="fake-key")
+
+
+def test_qianwen_returns_whole_answer(providers, create_llm):
+    providers("qianwen")
+    llm = create_llm()
+
+    assert list(llm.stream_response("hello", "auto")) == [answer("qianwen")]
+    assert llm.generate("hello", "qianwen", api_key="fake-key") == {"content": answer("qianwen")}
+
+
+def test_fallback_after_breaker_opens(providers, create_llm):
+    """失败的提供商先被尝试，立即换下一个；连续失败达到阈值后熔断，不再向它发送请求"""
+    failing = providers("openai", fail=True)
+    providers("deepseek")
+    llm = create_llm()
+    llm.hedge = False
+
+    answers = ["".join(llm.stream_response(f"request {i}", "auto")) for i in range(6)]
+
+    assert all(text.startswith("Answer from deepseek") for text in answers)
+    assert failing.requests == llm.router.failure_threshold
+    stats = llm.router.stats()
+    assert stats["openai"]["breaker"] == "open"
+    assert stats["openai"]["error_rate"] == 1.0
+    assert stats["deepseek"]["requests"] == 6
+
+
+def test_all_providers_failing(providers, create_llm):
+    providers("openai", fail=True)
+    providers("deepseek", fail=True)
+    llm = create_llm()
+
+    with pytest.raises(LLMError, match="All LLM providers failed"):
+        list(llm.stream_response("hello", "auto"))
+
+
+def test_hedge_winner(providers, create_llm):
+    """排在最前的提供商超过对冲等待时间仍未回答，同时请求的下一个提供商先回答并胜出"""
+    slow = providers("openai", delay=1.5)
+    providers("deepseek", delay=0.05)
+    llm = create_llm()
+    llm.router.default_hedge_delay = 0.1
+
+    started = time.perf_counter()
+    text = "".join(llm.stream_response("hello", "auto"))
+    elapsed = time.perf_counter() - started
+
+    assert text.startswith("Answer from deepseek")
+    assert elapsed < 1.0
+    assert slow.requests == 1
+    # 落败的请求被取消，不计为失败
+    stats = llm.router.stats()
+    assert "openai" not in stats or stats["openai"]["requests"] == 0
+    assert stats["deepseek"]["requests"] == 1
+
+
+def test_without_hedge_waits_for_first_provider(providers, create_llm):
+    providers("openai", delay=0.3)
+    providers("deepseek", delay=0.05)
+    llm = create_llm()
+    llm.hedge = False
+    llm.router.default_hedge_delay = 0.1
+
+    assert "".join(llm.stream_response("hello", "auto")).startswith("Answer from openai")
+
+
+def test_router_ranks_by_p50():
+    router = LLMRouter(min_samples=2)
+    for latency in (0.3, 0.3):
+        router.record_success("slow", latency)
+    for latency in (0.1, 0.1):
+        router.record_success("fast", latency)
+    router.record_success("new", 0.05)
+
+    # 样本不足的提供商排在最前以便测量，其余按 p50 从快到慢
+    assert router.rank(["slow", "fast", "new"]) == ["new", "fast", "slow"]
+    assert router.hedge_delay("fast") == pytest.approx(0.1)
+    assert router.hedge_delay("new") == router.default_hedge_delay
+
+
+def test_router_breaker_half_open():
+    router = LLMRouter(failure_threshold=2, reset_timeout=0.05)
+    router.record_failure("openai")
+    assert router.available("openai")
+    router.record_failure("openai")
+    assert not router.available("openai")
+
+    # 超时后只放行一个试探请求；试探失败重新熔断
+    time.sleep(0.06)
+    assert router.available("openai")
+    assert not router.available("openai")
+    router.record_failure("openai")
+    assert not router.available("openai")
+
+    # 再次试探成功后恢复
+    time.sleep(0.06)
+    assert router.available("openai")
+    router.record_success("openai", 0.1)
+    assert router.stats()["openai"]["breaker"] == "closed"
+    assert router.available("openai") and router.available("openai")
+
+
+def conversation(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}：" + "请帮我识别这张图片中的文字。" * 5})
+        messages.append({"role": "assistant", "content": f"回答{i}: " + "The text has been converted to Markdown. " * 5})
+    return messages
+
+
+def test_context_within_budget_is_unchanged():
+    context = ConversationContext(max_tokens=3000, summary_tokens=400)
+    messages = conversation(2)
+
+    assert context.build(messages, {}) == [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+def test_context_trims_to_token_budget():
+    context = ConversationContext(max_tokens=300, summary_tokens=100, excerpt_chars=40)
+    messages = conversation(20)
+    state = {}
+
+    history = context.build(messages, state)
+    summary, window = history[0], history[1:]
+
+    # 最新的对话原样保留，窗口不超过预算
+    assert window == [{"role": m["role"], "content": m["content"]} for m in messages[-len(window):]]
+    assert sum(context.count_tokens(m["content"]) for m in window) <= 300 - 100
+    assert len(window) < len(messages)
+    # 更早的轮次折叠为摘要，摘要只保留最近的行且不超过预算
+    assert summary["role"] == "system"
+    assert summary["content"].startswith("Summary of earlier conversation:")
+    assert sum(tokens for tokens, _ in state["summary_lines"]) <= 100
+    assert state["summary_lines"][-1][1].startswith(messages[-len(window) - 1]["role"])
+    assert "问题0" not in summary["content"]
+
+    # 继续对话时摘要增量扩展，窗口随之后移
+    messages += conversation(1)
+    summarized = state["summarized"]
+    history = context.build(messages, state)
+    assert state["summarized"] >= summarized
+    assert history[-1]["content"] == messages[-1]["content"]
+
+    # 对话被清空后重新开始
+    assert context.build(messages[:2], state) == [{"role": m["role"], "content": m["content"]} for m in messages[:2]]